@@ -0,0 +1,189 @@
+import math
+import time
+import asyncio
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from temporalio.api.enums.v1 import TaskQueueType
+from temporalio.api.taskqueue.v1 import TaskQueue
+from temporalio.api.workflowservice.v1 import DescribeTaskQueueRequest
+from temporalio.client import Client
+
+from api import visibility
+
+
+@dataclass
+class LoadSnapshot:
+    running: int
+    backlog: int
+    # activity tasks handed to workers per second, how fast the backlog drains
+    dispatch_rate: float = 0.0
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+async def temporal_load(client: Client, task_queue: str) -> LoadSnapshot:
+    """
+    Running extraction workflows (one visibility count) and the activity backlog of the task queue.
+    """
+    running = await client.count_workflows(visibility.filter_query(status="RUNNING", task_queue=task_queue))
+    description = await client.workflow_service.describe_task_queue(DescribeTaskQueueRequest(
+        namespace=client.namespace,
+        task_queue=TaskQueue(name=task_queue),
+        # call_model is the bottleneck, its tasks wait on the activity queue
+        task_queue_type=TaskQueueType.TASK_QUEUE_TYPE_ACTIVITY,
+        report_stats=True,
+    ))
+    return LoadSnapshot(
+        running=running.count,
+        backlog=description.stats.approximate_backlog_count,
+        dispatch_rate=description.stats.tasks_dispatch_rate,
+    )
+
+
+class AdmissionController:
+    """
+    Caps the workflows the API keeps in flight and the task queue backlog they may build up.
+
+    Load is probed at most every `refresh_interval_s` and workflows admitted since the last probe
+    are counted locally, so a burst cannot slip through between two probes. Requests over the limit
+    wait in a bounded FIFO buffer for up to `queue_timeout_s`, when the buffer is full or the wait
+    runs out they are rejected with a Retry-After estimated from the observed drain rate.
+    A limit of 0 disables that check, a failing probe keeps the last known load.
+    """
+
+    def __init__(self, probe: Callable[[], Awaitable[LoadSnapshot]], max_in_flight: int = 0, max_backlog: int = 0,
+                 queue_size: int = 0, queue_timeout_s: float = 5.0, refresh_interval_s: float = 1.0,
+                 default_retry_after_s: int = 5, max_retry_after_s: int = 60):
+        self.probe = probe
+        self.max_in_flight = max_in_flight
+        self.max_backlog = max_backlog
+        self.queue_size = queue_size
+        self.queue_timeout_s = queue_timeout_s
+        self.refresh_interval_s = refresh_interval_s
+        # used until two probes give a drain rate
+        self.default_retry_after_s = default_retry_after_s
+        self.max_retry_after_s = max_retry_after_s
+
+        self.load = LoadSnapshot(running=0, backlog=0)
+        self.admitted_since_probe = 0
+        self.probed_at = None
+        self.drain_rate = 0.0
+        self.waiters = deque()
+        self.lock = asyncio.Lock()
+        self.counters = {"admitted": 0, "queued": 0, "rejected": 0, "queue_timeouts": 0, "probe_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_in_flight or self.max_backlog)
+
+    @property
+    def in_flight(self) -> int:
+        return self.load.running + self.admitted_since_probe
+
+    def has_capacity(self) -> bool:
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return False
+        if self.max_backlog and self.load.backlog >= self.max_backlog:
+            return False
+        return True
+
+    async def refresh(self) -> None:
+        if self.probed_at is not None and time.monotonic() - self.probed_at < self.refresh_interval_s:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            if self.probed_at is not None and now - self.probed_at < self.refresh_interval_s:
+                return
+            try:
+                load = await self.probe()
+            except Exception as e:
+                self.counters["probe_errors"] += 1
+                print(f"Admission load probe failed, keeping the last known load: {e}")
+                self.probed_at = now
+                return
+
+            if self.probed_at is not None:
+                # workflows that closed since the last probe, smoothed into a completions per second rate
+                completed = max(0, self.in_flight - load.running)
+                rate = completed / max(now - self.probed_at, 1e-3)
+                self.drain_rate = rate if not self.drain_rate else 0.7 * self.drain_rate + 0.3 * rate
+            self.load = load
+            self.admitted_since_probe = 0
+            self.probed_at = now
+
+    def retry_after(self) -> int:
+        """
+        Seconds until the excess load, queued requests included, is expected to have drained.
+        """
+        wait = 1.0
+        if self.max_in_flight and self.drain_rate > 0:
+            excess = self.in_flight - self.max_in_flight + 1 + len(self.waiters)
+            wait = max(wait, excess / self.drain_rate)
+        elif self.max_in_flight:
+            wait = self.default_retry_after_s
+        if self.max_backlog and self.load.backlog >= self.max_backlog:
+            excess = self.load.backlog - self.max_backlog + 1
+            wait = max(wait, excess / self.load.dispatch_rate if self.load.dispatch_rate > 0 else self.default_retry_after_s)
+        return min(self.max_retry_after_s, math.ceil(wait))
+
+    def _admit(self) -> None:
+        self.admitted_since_probe += 1
+        self.counters["admitted"] += 1
+
+    def _reject(self, counter: str, reason: str) -> Overloaded:
+        self.counters[counter] += 1
+        return Overloaded(self.retry_after(), reason)
+
+    async def admit(self) -> None:
+        """
+        Returns once the request may start a workflow, raises Overloaded otherwise.
+        """
+        if not self.enabled:
+            self._admit()
+            return
+
+        await self.refresh()
+        if not self.waiters and self.has_capacity():
+            self._admit()
+            return
+        if len(self.waiters) >= self.queue_size:
+            raise self._reject("rejected", "Too many workflows in flight")
+
+        ticket = object()
+        self.waiters.append(ticket)
+        self.counters["queued"] += 1
+        deadline = time.monotonic() + self.queue_timeout_s
+        try:
+            while True:
+                # first in first out, only the head of the buffer may take a free slot
+                if self.waiters[0] is ticket and self.has_capacity():
+                    self._admit()
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._reject("queue_timeouts", "Timed out waiting for capacity")
+                await asyncio.sleep(min(self.refresh_interval_s / 4, remaining))
+                await self.refresh()
+        finally:
+            self.waiters.remove(ticket)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "backlog": self.load.backlog,
+            "waiting": len(self.waiters),
+            "drain_rate": round(self.drain_rate, 3),
+            "max_in_flight": self.max_in_flight,
+            "max_backlog": self.max_backlog,
+            "queue_size": self.queue_size,
+        }
@@ -0,0 +1,52 @@
+import json
+
+from fastapi import HTTPException, Response
+from pydantic import BaseModel, ValidationError
+
+# optional fast codecs, `uv sync --extra fast` installs both
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def _is_msgpack(media_type: str | None) -> bool:
+    return bool(media_type) and any(_ in media_type for _ in MSGPACK_MEDIA_TYPES)
+
+
+def decode_request(body: bytes, content_type: str | None, model: type[BaseModel]) -> BaseModel:
+    """
+    Parses a request body into `model` in a single pass, JSON or msgpack by content type.
+    """
+    try:
+        if _is_msgpack(content_type):
+            if msgpack is None:
+                raise HTTPException(status_code=415, detail="msgpack bodies need the msgpack package")
+            return model.model_validate(msgpack.unpackb(body, raw=False))
+        # pydantic parses and validates JSON in one pass in its rust core
+        return model.model_validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json(include_url=False)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed request body: {e}")
+
+
+def encode_response(content: BaseModel | dict, accept: str | None, status_code: int = 200, headers: dict | None = None) -> Response:
+    """
+    Serializes a response as msgpack when the client accepts it, otherwise as JSON (orjson when installed).
+    """
+    if isinstance(content, BaseModel):
+        content = content.model_dump(mode="json")
+
+    if _is_msgpack(accept) and msgpack is not None:
+        return Response(msgpack.packb(content, use_bin_type=True), status_code=status_code, media_type=MSGPACK_MEDIA_TYPES[0], headers=headers)
+    if orjson is not None:
+        return Response(orjson.dumps(content), status_code=status_code, media_type=JSON_MEDIA_TYPE, headers=headers)
+    return Response(json.dumps(content, separators=(",", ":")).encode(), status_code=status_code, media_type=JSON_MEDIA_TYPE, headers=headers)
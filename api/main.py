@@ -1,20 +1,78 @@
 import os
+import time
 import uuid 
 import json
-from fastapi import FastAPI, HTTPException
+from datetime import datetime, timedelta
+from typing import List, Literal
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from contextlib import asynccontextmanager
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from temporalio.client import Client, WorkflowExecutionStatus
+from temporalio.common import WorkflowIDConflictPolicy, WorkflowIDReusePolicy
+from temporalio.exceptions import WorkflowAlreadyStartedError
+from temporalio.service import RPCError, RPCStatusCode
 
-from worker.workflow import InformationExtraction
-from worker.shared import InvoiceData, INFORMATION_TASK_QUEUE_NAME
+from api import codecs
+from api import admission
+from api import visibility
+from api.result_cache import ResultCache, CachedResult
+from worker import utils
+from worker.shared import InvoiceData, INFORMATION_TASK_QUEUE_NAME, INFORMATION_WORKFLOW_NAME, PRIORITY_BULK, PRIORITY_INTERACTIVE, TASK_QUEUES
 
 
 class TriggerRequest(BaseModel):
     context_input: str
     output: str
+    profile: bool = False
+    idempotent: bool = False
+    batch_tag: str | None = None
+    priority: Literal["interactive", "bulk"] | None = None
+    timeout_seconds: float | None = None
+    cascade: List[str] | None = None
+    tenant: str | None = None
+    minimize: bool = False
+    pre_extract: bool = False
+class TriggerRequestV2(BaseModel):
+    """
+    native arrays instead of JSON encoded strings, fields default to the ground truth keys
+    """
+    invoices: List[str]
+    fields_to_extract: List[List[str]] | None = None
+    ground_truth: List[dict] | None = None
+    profile: bool = False
+    # derive the workflow id from the batch content, duplicates reuse the existing workflow
+    idempotent: bool = False
+    # searchable tag grouping the workflows of one ingestion job
+    batch_tag: str | None = None
+    # lane of the workflow, defaults to interactive for a single invoice and bulk otherwise
+    priority: Literal["interactive", "bulk"] | None = None
+    # the workflow gives up after this long, same as an `X-Deadline` header
+    timeout_seconds: float | None = None
+    # model tiers, cheapest first, defaults to LLM_CASCADE, [] turns the cascade off
+    cascade: List[str] | None = None
+    # caller charged for the tokens of the workflow, see TOKEN_BUDGET_PER_TENANT on the worker
+    tenant: str | None = None
+    # send text repeated across the invoices once and drop layout noise, validation still uses the original
+    minimize: bool = False
+    # resolve pattern like fields (invoice number, dates, totals, ...) locally, the model gets the rest
+    pre_extract: bool = False
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        if self.fields_to_extract is None:
+            if self.ground_truth is None:
+                raise ValueError("fields_to_extract is required when ground_truth is not given")
+            self.fields_to_extract = [list(_.keys()) for _ in self.ground_truth]
+        for name in ("fields_to_extract", "ground_truth"):
+            values = getattr(self, name)
+            if values is not None and len(values) != len(self.invoices):
+                raise ValueError(f"{name} has {len(values)} entries for {len(self.invoices)} invoices")
+        return self
 class TriggerResponse(BaseModel):
     workflow_id: str
+    deduplicated: bool = False
+    status: str | None = None
+    result: dict | None = None
 class StatusResponse(BaseModel):
     workflow_id: str
     status: str
@@ -23,11 +81,41 @@ class ResultResponse(BaseModel):
     status: str
     result: dict | None = None
     error: str | None = None
+class BatchStatusRequest(BaseModel):
+    workflow_ids: List[str]
+    include_results: bool = False
+    page_size: int = 100
+    page_token: str | None = None
+class WorkflowStatusItem(BaseModel):
+    workflow_id: str
+    status: str
+    start_time: datetime | None = None
+    close_time: datetime | None = None
+    result: dict | None = None
+class BatchStatusResponse(BaseModel):
+    workflows: List[WorkflowStatusItem]
+    next_page_token: str | None = None
 
 
 
 
 temporal_client = None
+# concurrent result() calls when a batch lookup includes results
+RESULT_FETCH_CONCURRENCY = int(os.getenv("RESULT_FETCH_CONCURRENCY", "16"))
+MAX_PAGE_SIZE = 1000
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "600")),
+)
+# 0 disables a limit, admission control is off unless one of the two limits is set
+admission_controller = admission.AdmissionController(
+    probe=lambda: admission.temporal_load(temporal_client, INFORMATION_TASK_QUEUE_NAME),
+    max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "0")),
+    max_backlog=int(os.getenv("ADMISSION_MAX_BACKLOG", "0")),
+    queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "0")),
+    queue_timeout_s=float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5")),
+    refresh_interval_s=float(os.getenv("ADMISSION_REFRESH_SECONDS", "1")),
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -47,34 +135,176 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan, title="LLM Temporal Orchestrator")
 
-@app.post("/workflows/trigger", response_model=TriggerResponse)
-async def trigger_workflow(request: TriggerRequest):
+# comma separated model tiers used when a request does not name its own
+DEFAULT_CASCADE = [_.strip() for _ in os.getenv("LLM_CASCADE", "").split(",") if _.strip()]
+
+def resolve_cascade(cascade: List[str] | None) -> List[str] | None:
+    tiers = DEFAULT_CASCADE if cascade is None else cascade
+    return list(tiers) or None
+
+def resolve_priority(priority: str | None, invoices: List[str]) -> str:
+    if priority:
+        return priority
+    return PRIORITY_INTERACTIVE if len(invoices) == 1 else PRIORITY_BULK
+
+def request_deadline(timeout_seconds: float | None, deadline_header: str | None) -> float | None:
     """
-    Starts the LLM workflow with the provided question.
+    Unix time the caller stops waiting, the earlier of `timeout_seconds` and the `X-Deadline`
+    header (unix seconds or an ISO 8601 timestamp with a timezone).
     """
-    if not temporal_client:
-        raise HTTPException(status_code=503, detail="Temporal client not connected")
-    
-    workflow_id = f"workflow-{str(uuid.uuid4())}"
+    now = time.time()
+    deadlines = []
+    if timeout_seconds is not None:
+        deadlines.append(now + timeout_seconds)
+    if deadline_header:
+        try:
+            deadlines.append(float(deadline_header))
+        except ValueError:
+            try:
+                parsed = datetime.fromisoformat(deadline_header)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid X-Deadline header: {deadline_header}")
+            if parsed.tzinfo is None:
+                raise HTTPException(status_code=400, detail="X-Deadline needs a timezone")
+            deadlines.append(parsed.timestamp())
+    if not deadlines:
+        return None
+    deadline = min(deadlines)
+    if deadline <= now:
+        raise HTTPException(status_code=400, detail="Deadline already passed")
+    return deadline
 
-    data: InvoiceData = InvoiceData(
-        context_input=json.loads(request.context_input),
-        fields_to_extract=[list(json.loads(_).keys()) for _ in json.loads(request.output)],
-        output=[json.loads(_) for _ in json.loads(request.output)],
-        workflow_id=workflow_id,
-    )
+def new_workflow_id(data: InvoiceData, idempotent: bool) -> str:
+    if idempotent:
+        # a submission only attaches to a run that gives the same result, not just one on the same invoices
+        options = {"ground_truth": data.output, "cascade": data.cascade, "minimize": data.minimize,
+                   "pre_extract": data.pre_extract, "tenant": data.tenant}
+        return f"workflow-{utils.batch_fingerprint(data.context_input, data.fields_to_extract, options)[:32]}"
+    return f"workflow-{str(uuid.uuid4())}"
+
+async def attach_existing(workflow_id: str) -> TriggerResponse:
+    """
+    Returns the workflow a duplicate submission maps to, with its result when it already completed.
+    """
+    cached = result_cache.get(workflow_id)
+    if cached:
+        return TriggerResponse(workflow_id=workflow_id, deduplicated=True, status=WorkflowExecutionStatus.COMPLETED.name, result=cached.result)
+
+    handle = temporal_client.get_workflow_handle(workflow_id)
+    description = await handle.describe()
+    result = None
+    if description.status == WorkflowExecutionStatus.COMPLETED:
+        result = result_cache.put(workflow_id, await handle.result()).result
+    return TriggerResponse(workflow_id=workflow_id, deduplicated=True, status=description.status.name, result=result)
+
+async def admit_request() -> None:
+    try:
+        await admission_controller.admit()
+    except admission.Overloaded as e:
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+async def start_extraction(data: InvoiceData, idempotent: bool = False, batch_tag: str | None = None) -> TriggerResponse:
+    # admission limits the bulk lane, interactive requests keep their reserved capacity
+    if data.priority == PRIORITY_BULK:
+        await admit_request()
     try:
         # Start the workflow
         handle = await temporal_client.start_workflow(
-            InformationExtraction.run,
+            INFORMATION_WORKFLOW_NAME,
             data,
-            id=workflow_id,
-            task_queue=INFORMATION_TASK_QUEUE_NAME,
+            id=data.workflow_id,
+            task_queue=TASK_QUEUES[data.priority],
+            # content addressed ids: a running or completed duplicate is reused, a failed one runs again
+            id_reuse_policy=WorkflowIDReusePolicy.ALLOW_DUPLICATE_FAILED_ONLY,
+            id_conflict_policy=WorkflowIDConflictPolicy.FAIL,
+            search_attributes=visibility.batch_tag_attributes(batch_tag),
+            # the server times the workflow out at the deadline, its activity timeouts are capped by it too
+            execution_timeout=timedelta(seconds=data.deadline - time.time()) if data.deadline else None,
         )
-        return TriggerResponse(workflow_id=handle.id)
+        return TriggerResponse(workflow_id=handle.id, status="RUNNING")
+    except WorkflowAlreadyStartedError:
+        if not idempotent:
+            raise HTTPException(status_code=409, detail=f"Workflow {data.workflow_id} already exists")
+        try:
+            return await attach_existing(data.workflow_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to read existing workflow: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start workflow: {str(e)}") 
+
+@app.get("/admission/metrics")
+async def get_admission_metrics():
+    """
+    Admission counters and the last observed load.
+    """
+    return admission_controller.stats()
+
+@app.post("/workflows/trigger", response_model=TriggerResponse, responses={429: {"description": "Overloaded, retry after the Retry-After header"}})
+async def trigger_workflow(request: TriggerRequest, x_deadline: str | None = Header(None)):
+    """
+    Starts the LLM workflow with the provided question.
+    """
+    if not temporal_client:
+        raise HTTPException(status_code=503, detail="Temporal client not connected")
+    
+    outputs = [json.loads(_) for _ in json.loads(request.output)]
+    data: InvoiceData = InvoiceData(
+        context_input=json.loads(request.context_input),
+        fields_to_extract=[list(_.keys()) for _ in outputs],
+        output=outputs,
+        workflow_id="",
+        profile=request.profile,
+    )
+    data.priority = resolve_priority(request.priority, data.context_input)
+    data.deadline = request_deadline(request.timeout_seconds, x_deadline)
+    data.cascade = resolve_cascade(request.cascade)
+    data.tenant = request.tenant
+    data.minimize = request.minimize
+    data.pre_extract = request.pre_extract
+    data.workflow_id = new_workflow_id(data, request.idempotent)
+    return await start_extraction(data, request.idempotent, request.batch_tag)
+
+@app.post("/v2/workflows/trigger", response_model=TriggerResponse, responses={429: {"description": "Overloaded, retry after the Retry-After header"}}, openapi_extra={
+    "requestBody": {"content": {
+        "application/json": {"schema": TriggerRequestV2.model_json_schema()},
+        "application/msgpack": {"schema": TriggerRequestV2.model_json_schema()},
+    }, "required": True},
+})
+async def trigger_workflow_v2(request: Request):
+    """
+    Starts the LLM workflow from native invoice, field and ground truth arrays.
+    The body is JSON or msgpack (`Content-Type: application/msgpack`), parsed once,
+    and the response is msgpack when the client sends `Accept: application/msgpack`.
+    """
+    if not temporal_client:
+        raise HTTPException(status_code=503, detail="Temporal client not connected")
+
+    body: TriggerRequestV2 = codecs.decode_request(await request.body(), request.headers.get("content-type"), TriggerRequestV2)
+
+    data: InvoiceData = InvoiceData(
+        context_input=body.invoices,
+        fields_to_extract=body.fields_to_extract,
+        output=body.ground_truth or [],
+        workflow_id="",
+        profile=body.profile,
+        priority=resolve_priority(body.priority, body.invoices),
+        deadline=request_deadline(body.timeout_seconds, request.headers.get("x-deadline")),
+        cascade=resolve_cascade(body.cascade),
+        tenant=body.tenant,
+        minimize=body.minimize,
+        pre_extract=body.pre_extract,
+    )
+    data.workflow_id = new_workflow_id(data, body.idempotent)
+    response = await start_extraction(data, body.idempotent, body.batch_tag)
+    return codecs.encode_response(response, request.headers.get("accept"))
     
+def cached_result_response(workflow_id: str, cached: CachedResult, request: Request) -> Response:
+    headers = {"ETag": cached.etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+    if request.headers.get("if-none-match") == cached.etag:
+        return Response(status_code=304, headers=headers)
+    response = ResultResponse(workflow_id=workflow_id, status=WorkflowExecutionStatus.COMPLETED.name, result=cached.result)
+    return codecs.encode_response(response, request.headers.get("accept"), headers=headers)
+
 @app.get("/workflows/{workflow_id}/status", response_model=StatusResponse)
 async def get_workflow_status(workflow_id: str):
     """
@@ -91,12 +321,34 @@ async def get_workflow_status(workflow_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/workflows/{workflow_id}/result", response_model=ResultResponse)
-async def get_workflow_result(workflow_id: str):
+@app.post("/workflows/{workflow_id}/cancel", response_model=StatusResponse)
+async def cancel_workflow(workflow_id: str):
+    """
+    Requests cancellation, the running LLM call notices it on its next heartbeat and frees its worker slot.
+    """
+    if not temporal_client:
+        raise HTTPException(status_code=503, detail="Temporal client not connected")
+
+    try:
+        await temporal_client.get_workflow_handle(workflow_id).cancel()
+        return StatusResponse(workflow_id=workflow_id, status="CANCEL_REQUESTED")
+    except RPCError as e:
+        if e.status == RPCStatusCode.NOT_FOUND:
+            raise HTTPException(status_code=404, detail=f"Workflow {workflow_id} not found")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/workflows/{workflow_id}/result", response_model=ResultResponse, responses={304: {"description": "Result unchanged (If-None-Match)"}})
+async def get_workflow_result(workflow_id: str, request: Request):
     """
     Fetches the final result of the workflow.
     If the workflow is not complete, it indicates the current status.
+    Completed results are cached and carry an ETag, repeat reads make no Temporal call.
     """
+    cached = result_cache.get(workflow_id)
+    if cached:
+        return cached_result_response(workflow_id, cached, request)
+
     if not temporal_client:
         raise HTTPException(status_code=503, detail="Temporal client not connected")
 
@@ -113,11 +365,7 @@ async def get_workflow_result(workflow_id: str):
             )
         # Workflow is complete, fetch the result
         result_data = await handle.result()
-        return ResultResponse(
-            workflow_id=workflow_id,
-            status=description.status.name,
-            result=result_data,
-        )
+        return cached_result_response(workflow_id, result_cache.put(workflow_id, result_data), request)
 
     except Exception as e:
         # This can catch application errors from within the workflow
@@ -126,4 +374,100 @@ async def get_workflow_result(workflow_id: str):
             status="FAILED", # Assuming an exception means failure
             result=None,
             error=str(e)
-        )
\ No newline at end of file
+        )
+
+
+async def status_items(executions, include_results: bool) -> List[WorkflowStatusItem]:
+    """
+    Status rows for one page of executions, completed results come from the cache
+    or are fetched concurrently with a bounded fan-out.
+    """
+    items = [
+        WorkflowStatusItem(
+            workflow_id=execution.id,
+            status=execution.status.name if execution.status else "UNKNOWN",
+            start_time=execution.start_time,
+            close_time=execution.close_time,
+        )
+        for execution in executions
+    ]
+    if not include_results:
+        return items
+
+    async def fetch(item: WorkflowStatusItem):
+        if item.status != WorkflowExecutionStatus.COMPLETED.name:
+            return
+        cached = result_cache.get(item.workflow_id)
+        if not cached:
+            try:
+                result = await temporal_client.get_workflow_handle(item.workflow_id).result()
+            except Exception:
+                return
+            cached = result_cache.put(item.workflow_id, result)
+        item.result = cached.result
+
+    await visibility.gather_bounded(items, fetch, RESULT_FETCH_CONCURRENCY)
+    return items
+
+
+@app.post("/workflows/status:batch", response_model=BatchStatusResponse)
+async def get_workflow_status_batch(request: BatchStatusRequest):
+    """
+    Statuses of many workflows by id, one visibility query per page of ids instead of one describe() per workflow.
+    Unknown ids are reported as NOT_FOUND.
+    """
+    if not temporal_client:
+        raise HTTPException(status_code=503, detail="Temporal client not connected")
+
+    page_size = max(1, min(request.page_size, MAX_PAGE_SIZE))
+    if request.page_token and not request.page_token.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid page_token")
+    offset = int(request.page_token or 0)
+    page_ids = list(dict.fromkeys(request.workflow_ids[offset:offset + page_size]))
+    next_offset = offset + page_size
+
+    executions = []
+    if page_ids:
+        try:
+            # room for several runs of a reused id
+            executions, _ = await visibility.list_page(temporal_client, visibility.ids_query(page_ids), MAX_PAGE_SIZE)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    latest = visibility.latest_runs(executions)
+    items = await status_items([latest[_] for _ in page_ids if _ in latest], request.include_results)
+    found = {item.workflow_id: item for item in items}
+    return BatchStatusResponse(
+        workflows=[found.get(_) or WorkflowStatusItem(workflow_id=_, status="NOT_FOUND") for _ in page_ids],
+        next_page_token=str(next_offset) if next_offset < len(request.workflow_ids) else None,
+    )
+
+
+@app.get("/workflows", response_model=BatchStatusResponse)
+async def list_workflow_statuses(
+    batch_tag: str | None = None,
+    started_after: datetime | None = None,
+    started_before: datetime | None = None,
+    status: str | None = Query(None, description="RUNNING, COMPLETED, FAILED, ..."),
+    include_results: bool = False,
+    page_size: int = 100,
+    page_token: str | None = None,
+):
+    """
+    Pages through extraction workflows by batch tag, start time range and status using a visibility query.
+    """
+    if not temporal_client:
+        raise HTTPException(status_code=503, detail="Temporal client not connected")
+
+    query = visibility.filter_query(batch_tag, started_after, started_before, status)
+    try:
+        executions, next_token = await visibility.list_page(
+            temporal_client, query, max(1, min(page_size, MAX_PAGE_SIZE)), visibility.decode_page_token(page_token),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return BatchStatusResponse(
+        workflows=await status_items(executions, include_results),
+        next_page_token=visibility.encode_page_token(next_token),
+    )
@@ -0,0 +1,62 @@
+import json
+import time
+import hashlib
+import threading
+
+from collections import OrderedDict
+from dataclasses import dataclass
+
+@dataclass
+class CachedResult:
+    result: dict
+    etag: str
+    expires_at: float
+
+
+def compute_etag(result: dict) -> str:
+    payload = json.dumps(result, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+
+
+class ResultCache:
+    """
+    Bounded LRU of completed workflow results with a TTL.
+
+    Only values a workflow returned are put here, completed results never change and the TTL only
+    bounds how long memory is held. Statuses are never answered from the cache, a workflow that has
+    not returned yet may still fail or be cancelled.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: OrderedDict[str, CachedResult] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, workflow_id: str) -> CachedResult | None:
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(workflow_id)
+            if entry and entry.expires_at > now:
+                self.entries.move_to_end(workflow_id)
+                self.hits += 1
+                return entry
+            if entry:
+                del self.entries[workflow_id]
+            self.misses += 1
+        return None
+
+    def put(self, workflow_id: str, result: dict) -> CachedResult:
+        entry = CachedResult(result=result, etag=compute_etag(result), expires_at=time.monotonic() + self.ttl_seconds)
+        with self.lock:
+            self.entries[workflow_id] = entry
+            self.entries.move_to_end(workflow_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
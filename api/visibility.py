@@ -0,0 +1,88 @@
+import base64
+import asyncio
+
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from temporalio.client import Client, WorkflowExecution
+from temporalio.common import SearchAttributeKey, SearchAttributePair, TypedSearchAttributes
+
+from worker.shared import BATCH_TAG_SEARCH_ATTRIBUTE, INFORMATION_WORKFLOW_NAME
+
+BATCH_TAG_KEY = SearchAttributeKey.for_keyword(BATCH_TAG_SEARCH_ATTRIBUTE)
+
+
+def batch_tag_attributes(batch_tag: str | None) -> TypedSearchAttributes:
+    if not batch_tag:
+        return TypedSearchAttributes.empty
+    return TypedSearchAttributes([SearchAttributePair(BATCH_TAG_KEY, batch_tag)])
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def ids_query(workflow_ids: List[str]) -> str:
+    return f"WorkflowId IN ({', '.join(_quote(_) for _ in workflow_ids)})"
+
+
+def filter_query(batch_tag: str | None = None, started_after: datetime | None = None,
+                 started_before: datetime | None = None, status: str | None = None, task_queue: str | None = None) -> str:
+    """
+    Visibility query over extraction workflows, filters are combined with AND.
+    """
+    clauses = [f"WorkflowType = {_quote(INFORMATION_WORKFLOW_NAME)}"]
+    if batch_tag:
+        clauses.append(f"{BATCH_TAG_SEARCH_ATTRIBUTE} = {_quote(batch_tag)}")
+    if started_after:
+        clauses.append(f"StartTime >= {_quote(started_after.isoformat())}")
+    if started_before:
+        clauses.append(f"StartTime < {_quote(started_before.isoformat())}")
+    if status:
+        # COMPLETED -> Completed, TIMED_OUT -> TimedOut
+        clauses.append(f"ExecutionStatus = {_quote(''.join(_.title() for _ in status.split('_')))}")
+    if task_queue:
+        clauses.append(f"TaskQueue = {_quote(task_queue)}")
+    return " AND ".join(clauses)
+
+
+def encode_page_token(token: bytes | None) -> str | None:
+    return base64.urlsafe_b64encode(token).decode("ascii") if token else None
+
+
+def decode_page_token(token: str | None) -> bytes | None:
+    return base64.urlsafe_b64decode(token.encode("ascii")) if token else None
+
+
+async def list_page(client: Client, query: str, page_size: int, page_token: bytes | None = None) -> Tuple[List[WorkflowExecution], bytes | None]:
+    """
+    Fetches a single page of a visibility query, one RPC however many workflows match.
+    """
+    iterator = client.list_workflows(query, page_size=page_size, next_page_token=page_token)
+    await iterator.fetch_next_page()
+    return list(iterator.current_page or []), iterator.next_page_token
+
+
+async def gather_bounded(items: List, func: Callable[..., Awaitable], limit: int) -> List:
+    """
+    Runs `func` over `items` with at most `limit` calls in flight, results keep the input order.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def one(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*(one(_) for _ in items))
+
+
+def latest_runs(executions: List[WorkflowExecution]) -> Dict[str, WorkflowExecution]:
+    """
+    Keeps the most recent run of every workflow id, reused ids have one entry per run.
+    """
+    latest: Dict[str, WorkflowExecution] = {}
+    for execution in executions:
+        current = latest.get(execution.id)
+        if current is None or (execution.start_time and current.start_time and execution.start_time > current.start_time):
+            latest[execution.id] = execution
+    return latest
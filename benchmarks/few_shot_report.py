@@ -0,0 +1,105 @@
+"""
+Prompt tokens and retry rates with the fixed few-shot example and with examples picked from a bank.
+
+Runs an evaluation set through the extraction pipeline once per mode and reports the prompt tokens
+sent, the share of invoices that failed their first validation and went to a retry, the accuracy
+and the selection time per prompt. Without a dataset or bank the synthetic corpus is used, without
+a model the simulated one (which ignores the examples, so its retry rates do not move).
+
+    python -m benchmarks.few_shot_report
+    python -m benchmarks.few_shot_report --dataset eval.jsonl --bank examples.jsonl --k 2 --model gemini-2.5-flash
+"""
+import sys
+import json
+import argparse
+
+from typing import Callable, Dict, List
+
+from worker import datasets
+from worker.examples import Example, ExampleBank
+from worker.field_extraction_metrics import evaluate_field_extraction
+from worker.llms import gemini
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+
+def run(rows: List, llm_factory: Callable[[], gemini], bank: ExampleBank | None, batch_size: int = 20) -> Dict:
+    predictions, prompt_tokens, first_failures, selection_ms = [], 0, 0, []
+    for index, batch in datasets.iter_batches(iter(rows), batch_size):
+        llm = llm_factory()
+        llm.examples = bank
+        llm.load_input(datasets.build_invoice_data(batch, f"few-shot-report-{index}"))
+        llm.construct_prompt()
+        prompt_tokens += llm.tokens.local(llm.prompt)
+        if llm.few_shot_report:
+            selection_ms.append(llm.few_shot_report["selection_ms"])
+        if llm.call_model()["status"] != "success":
+            predictions += [{} for _ in batch]
+            continue
+        if llm.parse_and_validate()["status"] == "failed" and llm.error_response:
+            first_failures += len(llm.error_response)
+            llm.retry_model_call()
+        predictions += llm.validated_response or [{} for _ in batch]
+
+    truth = [output or {} for _, output in rows]
+    metrics = evaluate_field_extraction(predictions, truth)["overall_metrics"]
+    selection_ms.sort()
+    return {
+        "prompt_tokens": prompt_tokens,
+        "retry_rate": first_failures / len(rows) if rows else 0.0,
+        "f1_score": metrics["f1_score"],
+        "normalized_match_accuracy": metrics["normalized_match_accuracy"],
+        "selection_ms_p50": selection_ms[len(selection_ms) // 2] if selection_ms else None,
+        "selection_ms_max": selection_ms[-1] if selection_ms else None,
+    }
+
+
+def report(rows: List, bank: ExampleBank, llm_factory: Callable[[], gemini], batch_size: int = 20) -> Dict:
+    fixed = run(rows, llm_factory, None, batch_size)
+    selected = run(rows, llm_factory, bank, batch_size)
+    return {
+        "invoices": len(rows),
+        "examples": len(bank.examples),
+        "k": bank.k,
+        "fixed": fixed,
+        "selected": selected,
+        "token_savings": 1 - selected["prompt_tokens"] / fixed["prompt_tokens"] if fixed["prompt_tokens"] else 0.0,
+        "retry_rate_change": selected["retry_rate"] - fixed["retry_rate"],
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compares the fixed few-shot example with examples selected from a bank")
+    parser.add_argument("--dataset", default=None, help="XLSX, CSV, JSONL or Parquet evaluation set, synthetic by default")
+    parser.add_argument("--bank", default=None, help="example bank in the same formats, synthetic by default")
+    parser.add_argument("--size", type=int, default=200, help="synthetic invoices when no dataset is given")
+    parser.add_argument("--k", type=int, default=1, help="examples per prompt")
+    parser.add_argument("--model", default=None, help="Gemini model, the simulated model by default")
+    parser.add_argument("--batch-size", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.dataset:
+        rows = list(datasets.iter_rows(args.dataset))
+    else:
+        contexts, outputs, _ = generate_corpus(args.size)
+        rows = list(zip(contexts, outputs))
+    if args.bank:
+        bank = ExampleBank.from_file(args.bank, k=args.k)
+    else:
+        contexts, outputs, _ = generate_corpus(100, seed=1)
+        bank = ExampleBank([Example(context, output) for context, output in zip(contexts, outputs)], k=args.k)
+
+    if args.model:
+        llm_factory = lambda: gemini(args.model)
+    else:
+        model = SimulatedModel(SimulationConfig(latency_median_s=0.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0))
+        llm_factory = lambda: SimulatedGemini(model)
+
+    result = report(rows, bank, llm_factory, args.batch_size)
+    print(json.dumps(result, indent=2))
+    print(f"Prompt tokens {result['token_savings']:.1%} lower, retry rate {result['retry_rate_change']:+.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Microbenchmarks for the CPU side hot paths of the pipeline.
+
+Runs every case on synthetic invoice corpora of several sizes, stores the timings as a JSON
+baseline and fails (exit code 1) when a case gets slower than the baseline by more than the
+configured threshold.
+
+    python -m benchmarks.hot_paths                       # compare against the saved baseline
+    python -m benchmarks.hot_paths --update-baseline     # record a new baseline
+    python -m benchmarks.hot_paths --require-baseline    # CI: a missing baseline fails instead of being recorded
+    python -m benchmarks.hot_paths --sizes 10 100 --threshold 0.3
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+
+from typing import Callable, Dict, List
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from worker import utils
+from worker import prompts
+from worker.llms import gemini
+from worker.shared import InvoiceData
+from worker.synthetic import generate_corpus, extract_labeled_fields, mock_model_response
+from worker.field_extraction_metrics import evaluate_field_extraction
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_THRESHOLD = 0.25
+# differences below this many seconds are treated as timer noise
+NOISE_FLOOR_SECONDS = 0.0005
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "hot_paths.json")
+
+
+def build_cases(size: int, seed: int = 0) -> Dict[str, Callable[[], object]]:
+    """
+    Builds the benchmark cases for a corpus of `size` invoices.
+    """
+    contexts, outputs, fields = generate_corpus(size, seed)
+    normalized = [utils.normalize_text(_) for _ in contexts]
+    predictions = [extract_labeled_fields(context, field) for context, field in zip(normalized, fields)]
+    errors = [["Value for key 'TOTAL_AMOUNT' not found in the original document text."] for _ in contexts]
+    model_response = mock_model_response(predictions)
+
+    llm = gemini()
+    llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="benchmark"))
+
+    def parse_and_validate():
+        llm.model_reponse = model_response
+        return llm.parse_and_validate()
+
+    return {
+        "get_batched_prompt_with_fields": lambda: prompts.get_batched_prompt_with_fields(normalized, fields),
+        "retry_prompt": lambda: prompts.retry_prompt(normalized, errors, fields),
+        "normalize_text": lambda: [utils.normalize_text(_) for _ in contexts],
+        "validate_extracted_data": lambda: [
+            utils.validate_extracted_data(pred, context, field) for pred, context, field in zip(predictions, contexts, fields)
+        ],
+        "parse_and_validate": parse_and_validate,
+        "evaluate_field_extraction": lambda: evaluate_field_extraction(predictions, outputs),
+        "utils_evaluate": lambda: utils.evaluate(outputs, predictions),
+    }
+
+
+def time_case(func: Callable[[], object], min_time: float = 0.2, max_repeats: int = 50) -> Dict:
+    """
+    Calls `func` until `min_time` seconds were spent (at least 3 times) and returns timing statistics.
+    """
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < 3 or (time.perf_counter() - started < min_time and len(timings) < max_repeats):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "repeats": len(timings),
+    }
+
+
+def run(sizes: List[int], cases: List[str] | None = None, seed: int = 0) -> Dict[str, Dict[str, Dict]]:
+    """
+    Runs the benchmark cases on every corpus size.
+
+    Returns:
+        {case: {size: timing}}
+    """
+    results: Dict[str, Dict[str, Dict]] = {}
+    for size in sizes:
+        for name, func in build_cases(size, seed).items():
+            if cases and name not in cases:
+                continue
+            results.setdefault(name, {})[str(size)] = time_case(func)
+    return results
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD, noise_floor: float = NOISE_FLOOR_SECONDS) -> List[Dict]:
+    """
+    Compares the median timings against a baseline.
+
+    Returns:
+        one entry per case and size present in both, with `regressed` set when the case got slower
+        than the baseline by more than `threshold` (relative) and `noise_floor` (absolute seconds)
+    """
+    report = []
+    for name, by_size in results.items():
+        for size, timing in by_size.items():
+            base = baseline.get(name, {}).get(size)
+            if not base:
+                continue
+            current, previous = timing["median_s"], base["median_s"]
+            change = (current - previous) / previous if previous else 0.0
+            report.append({
+                "case": name,
+                "size": int(size),
+                "baseline_s": previous,
+                "current_s": current,
+                "change": round(change, 4),
+                "regressed": change > threshold and current - previous > noise_floor,
+            })
+    return report
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def save_baseline(results: Dict, path: str = BASELINE_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }, f, indent=2)
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="CPU hot path microbenchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--cases", nargs="+", default=None)
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("BENCHMARK_THRESHOLD", DEFAULT_THRESHOLD)),
+                        help="allowed relative slowdown before a case counts as a regression")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="fail when the baseline is missing or lacks a case, instead of recording it (CI)")
+    parser.add_argument("--output", default=None, help="also write the raw results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.cases)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    print(f"{'case':<32} {'size':>6} {'median ms':>10}")
+    for name, by_size in results.items():
+        for size, timing in by_size.items():
+            print(f"{name:<32} {size:>6} {timing['median_s'] * 1000:>10.3f}")
+
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline or (not baseline and not args.require_baseline):
+        save_baseline(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    report = compare(results, baseline, args.threshold)
+    if args.require_baseline:
+        compared = {(row["case"], row["size"]) for row in report}
+        missing = [(name, int(size)) for name, by_size in results.items() for size in by_size if (name, int(size)) not in compared]
+        for name, size in missing:
+            print(f"NO BASELINE {name} size={size} in {args.baseline}, record it with --update-baseline")
+        if missing:
+            return 1
+    regressions = [_ for _ in report if _["regressed"]]
+    for row in regressions:
+        print(f"REGRESSION {row['case']} size={row['size']}: "
+              f"{row['baseline_s'] * 1000:.3f}ms -> {row['current_s'] * 1000:.3f}ms ({row['change']:+.1%})")
+    if regressions:
+        return 1
+    print(f"No regressions above {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
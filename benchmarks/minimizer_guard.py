@@ -0,0 +1,103 @@
+"""
+Accuracy guard for the prompt minimizer.
+
+Runs an evaluation set through the extraction pipeline twice, as sent today and minimized, and
+fails (exit code 1) when a guarded metric drops by more than the tolerance. Without a dataset the
+synthetic corpus is used, without a model the simulated one.
+
+    python -m benchmarks.minimizer_guard
+    python -m benchmarks.minimizer_guard --dataset eval.jsonl --model gemini-2.5-flash --tolerance 0.01
+"""
+import sys
+import json
+import argparse
+
+from typing import Callable, Dict, List
+
+from worker import datasets
+from worker.field_extraction_metrics import evaluate_field_extraction
+from worker.llms import gemini
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+GUARDED_METRICS = ("exact_match_accuracy", "normalized_match_accuracy", "f1_score")
+DEFAULT_TOLERANCE = 0.01
+
+
+def extract(rows: List, llm_factory: Callable[[], gemini], minimize: bool, batch_size: int = 20) -> Dict:
+    """
+    predictions of the pipeline for every row and the prompt tokens it sent
+    """
+    predictions, prompt_tokens, minimized_tokens = [], 0, 0
+    for index, batch in datasets.iter_batches(iter(rows), batch_size):
+        data = datasets.build_invoice_data(batch, f"minimizer-guard-{index}", minimize=minimize)
+        llm = llm_factory()
+        llm.load_input(data)
+        llm.construct_prompt()
+        report = llm.minimize_report or {}
+        prompt_tokens += report.get("prompt_tokens", llm.tokens.local(llm.prompt))
+        minimized_tokens += report.get("minimized_prompt_tokens", llm.tokens.local(llm.prompt))
+        if llm.call_model()["status"] != "success":
+            predictions += [{} for _ in batch]
+            continue
+        if llm.parse_and_validate()["status"] == "failed" and llm.error_response:
+            llm.retry_model_call()
+        predictions += llm.validated_response or [{} for _ in batch]
+    return {"predictions": predictions, "prompt_tokens": prompt_tokens, "minimized_prompt_tokens": minimized_tokens}
+
+
+def guard(rows: List, llm_factory: Callable[[], gemini], tolerance: float = DEFAULT_TOLERANCE, batch_size: int = 20) -> Dict:
+    truth = [output or {} for _, output in rows]
+    baseline = extract(rows, llm_factory, False, batch_size)
+    minimized = extract(rows, llm_factory, True, batch_size)
+    before = evaluate_field_extraction(baseline["predictions"], truth)["overall_metrics"]
+    after = evaluate_field_extraction(minimized["predictions"], truth)["overall_metrics"]
+
+    metrics = {
+        name: {"baseline": before[name], "minimized": after[name], "change": after[name] - before[name]}
+        for name in GUARDED_METRICS
+    }
+    tokens = minimized["prompt_tokens"]
+    return {
+        "invoices": len(rows),
+        "prompt_tokens": tokens,
+        "minimized_prompt_tokens": minimized["minimized_prompt_tokens"],
+        "token_reduction": 1 - minimized["minimized_prompt_tokens"] / tokens if tokens else 0.0,
+        "metrics": metrics,
+        "tolerance": tolerance,
+        "passed": all(_["change"] >= -tolerance for _ in metrics.values()),
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Checks that prompt minimization keeps the extraction metrics")
+    parser.add_argument("--dataset", default=None, help="XLSX, CSV, JSONL or Parquet evaluation set, synthetic by default")
+    parser.add_argument("--size", type=int, default=200, help="synthetic invoices when no dataset is given")
+    parser.add_argument("--model", default=None, help="Gemini model, the simulated model by default")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed absolute drop of each metric")
+    args = parser.parse_args(argv)
+
+    if args.dataset:
+        rows = list(datasets.iter_rows(args.dataset))
+    else:
+        contexts, outputs, _ = generate_corpus(args.size)
+        rows = list(zip(contexts, outputs))
+
+    if args.model:
+        llm_factory = lambda: gemini(args.model)
+    else:
+        model = SimulatedModel(SimulationConfig(latency_median_s=0.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0))
+        llm_factory = lambda: SimulatedGemini(model)
+
+    report = guard(rows, llm_factory, args.tolerance, args.batch_size)
+    print(json.dumps(report, indent=2))
+    if not report["passed"]:
+        print(f"Minimization changed a metric by more than {args.tolerance}")
+        return 1
+    print(f"Token reduction {report['token_reduction']:.1%}, metrics within {args.tolerance}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
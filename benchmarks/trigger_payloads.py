@@ -0,0 +1,66 @@
+"""
+Compares request handling time of the v1 and v2 trigger endpoints for large batches.
+
+Requests go through the full FastAPI stack in process, with a stub Temporal client,
+so the timings cover body parsing, validation, InvoiceData construction and the response.
+
+    python -m benchmarks.trigger_payloads --invoices 1000
+"""
+import json
+import argparse
+
+import msgpack
+from fastapi.testclient import TestClient
+
+import api.main as api_main
+from benchmarks.hot_paths import time_case
+from worker.synthetic import generate_corpus
+
+
+class _Handle:
+    def __init__(self, workflow_id):
+        self.id = workflow_id
+
+
+class _StubTemporalClient:
+    async def start_workflow(self, workflow, data, id, task_queue, **kwargs):
+        return _Handle(id)
+
+
+def build_cases(n: int):
+    contexts, outputs, fields = generate_corpus(n)
+    client = TestClient(api_main.app)
+
+    v1_body = json.dumps({
+        "context_input": json.dumps(contexts),
+        "output": json.dumps([json.dumps(_) for _ in outputs]),
+    }).encode()
+    v2_payload = {"invoices": contexts, "fields_to_extract": fields, "ground_truth": outputs}
+    v2_json = json.dumps(v2_payload).encode()
+    v2_msgpack = msgpack.packb(v2_payload)
+
+    def post(path, body, content_type, accept="application/json"):
+        response = client.post(path, content=body, headers={"Content-Type": content_type, "Accept": accept})
+        assert response.status_code == 200, response.text
+
+    return {
+        "v1_json_strings": (len(v1_body), lambda: post("/workflows/trigger", v1_body, "application/json")),
+        "v2_json": (len(v2_json), lambda: post("/v2/workflows/trigger", v2_json, "application/json")),
+        "v2_msgpack": (len(v2_msgpack), lambda: post("/v2/workflows/trigger", v2_msgpack, "application/msgpack", "application/msgpack")),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Trigger request handling benchmark")
+    parser.add_argument("--invoices", type=int, default=1000)
+    args = parser.parse_args()
+
+    api_main.temporal_client = _StubTemporalClient()
+    print(f"{'case':<18} {'body KB':>9} {'median ms':>10}")
+    for name, (size, func) in build_cases(args.invoices).items():
+        timing = time_case(func, min_time=1.0)
+        print(f"{name:<18} {size / 1024:>9.1f} {timing['median_s'] * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
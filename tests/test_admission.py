@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+
+from api.admission import AdmissionController, LoadSnapshot, Overloaded
+
+
+class FakeProbe:
+    def __init__(self, running=0, backlog=0, dispatch_rate=0.0):
+        self.load = LoadSnapshot(running, backlog, dispatch_rate)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return LoadSnapshot(self.load.running, self.load.backlog, self.load.dispatch_rate)
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def test_disabled_admits_without_probing(self):
+        probe = FakeProbe(running=10_000)
+        controller = AdmissionController(probe)
+        asyncio.run(controller.admit())
+        self.assertEqual(probe.calls, 0)
+        self.assertEqual(controller.stats()["admitted"], 1)
+
+    def test_burst_is_capped_between_probes(self):
+        probe = FakeProbe(running=2)
+        controller = AdmissionController(probe, max_in_flight=5, refresh_interval_s=60)
+
+        async def burst():
+            outcomes = []
+            for _ in range(6):
+                try:
+                    await controller.admit()
+                    outcomes.append("admitted")
+                except Overloaded as e:
+                    outcomes.append(e.retry_after)
+            return outcomes
+
+        outcomes = asyncio.run(burst())
+        self.assertEqual(outcomes[:3], ["admitted"] * 3)
+        self.assertTrue(all(isinstance(_, int) and _ >= 1 for _ in outcomes[3:]))
+        self.assertEqual(probe.calls, 1)
+        self.assertEqual(controller.stats()["rejected"], 3)
+
+    def test_backlog_limit_and_retry_after(self):
+        probe = FakeProbe(running=0, backlog=120, dispatch_rate=10.0)
+        controller = AdmissionController(probe, max_backlog=100)
+        with self.assertRaises(Overloaded) as context:
+            asyncio.run(controller.admit())
+        # 21 tasks over the limit drain at 10 per second
+        self.assertEqual(context.exception.retry_after, 3)
+
+    def test_buffered_request_waits_for_capacity(self):
+        probe = FakeProbe(running=1)
+        controller = AdmissionController(probe, max_in_flight=1, queue_size=1, queue_timeout_s=2, refresh_interval_s=0.02)
+
+        async def scenario():
+            waiter = asyncio.create_task(controller.admit())
+            await asyncio.sleep(0.05)
+            self.assertEqual(controller.stats()["waiting"], 1)
+            # the buffer is full, the next request is rejected right away
+            with self.assertRaises(Overloaded):
+                await controller.admit()
+            probe.load.running = 0
+            await asyncio.wait_for(waiter, 1)
+
+        asyncio.run(scenario())
+        stats = controller.stats()
+        self.assertEqual((stats["admitted"], stats["queued"], stats["rejected"]), (1, 1, 1))
+        self.assertGreater(stats["drain_rate"], 0)
+
+    def test_buffered_request_times_out(self):
+        controller = AdmissionController(FakeProbe(running=1), max_in_flight=1, queue_size=4, queue_timeout_s=0.05, refresh_interval_s=0.02)
+        with self.assertRaises(Overloaded):
+            asyncio.run(controller.admit())
+        self.assertEqual(controller.stats()["queue_timeouts"], 1)
+        self.assertEqual(controller.stats()["waiting"], 0)
+
+    def test_probe_failure_keeps_last_load(self):
+        class FailingProbe:
+            async def __call__(self):
+                raise RuntimeError("visibility unavailable")
+
+        controller = AdmissionController(FailingProbe(), max_in_flight=2, refresh_interval_s=0)
+        asyncio.run(controller.admit())
+        self.assertEqual(controller.stats()["probe_errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,388 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+
+import msgpack
+from fastapi.testclient import TestClient
+from temporalio.client import WorkflowExecutionStatus
+from temporalio.exceptions import WorkflowAlreadyStartedError
+
+import api.main as api_main
+from api import admission
+from api import visibility
+from api.result_cache import ResultCache
+from worker import utils
+from worker.shared import INFORMATION_TASK_QUEUE_NAME, INTERACTIVE_TASK_QUEUE_NAME, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from worker.synthetic import generate_corpus
+
+
+class FakeHandle:
+    def __init__(self, workflow_id, status=WorkflowExecutionStatus.RUNNING, result=None):
+        self.id = workflow_id
+        self.status = status
+        self._result = result
+        self.describe_calls = 0
+        self.result_calls = 0
+
+    async def describe(self):
+        self.describe_calls += 1
+        return SimpleNamespace(status=self.status)
+
+    async def result(self):
+        self.result_calls += 1
+        return self._result
+
+    async def cancel(self):
+        self.status = WorkflowExecutionStatus.CANCELED
+
+
+class FakeTemporalClient:
+    def __init__(self):
+        self.started = []
+        self.task_queues = []
+        self.workflows = {}
+        self.queries = []
+
+    async def start_workflow(self, workflow, data, id, task_queue, **kwargs):
+        if id in self.workflows:
+            raise WorkflowAlreadyStartedError(id, workflow)
+        self.started.append(data)
+        self.task_queues.append(task_queue)
+        self.workflows[id] = FakeHandle(id)
+        return self.workflows[id]
+
+    def get_workflow_handle(self, workflow_id):
+        return self.workflows[workflow_id]
+
+    def list_workflows(self, query, page_size, next_page_token=None):
+        self.queries.append(query)
+        ids = sorted(self.workflows)
+        if "WorkflowId IN" in query:
+            ids = [_ for _ in ids if f"'{_}'" in query]
+        offset = int(next_page_token or 0)
+        page = ids[offset:offset + page_size]
+        return FakeIterator([
+            SimpleNamespace(id=_, status=self.workflows[_].status, start_time=None, close_time=None) for _ in page
+        ], str(offset + page_size).encode() if offset + page_size < len(ids) else None)
+
+
+class FakeIterator:
+    def __init__(self, page, next_page_token):
+        self.current_page = None
+        self._page = page
+        self.next_page_token = next_page_token
+
+    async def fetch_next_page(self):
+        self.current_page = self._page
+
+
+class APITestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temporal = FakeTemporalClient()
+        self._previous_client = api_main.temporal_client
+        api_main.temporal_client = self.temporal
+        self._previous_cache = api_main.result_cache
+        api_main.result_cache = ResultCache()
+        # no context manager, the lifespan would connect to a real server
+        self.client = TestClient(api_main.app)
+        self.contexts, self.outputs, self.fields = generate_corpus(3, seed=7)
+
+    def tearDown(self):
+        api_main.temporal_client = self._previous_client
+        api_main.result_cache = self._previous_cache
+
+
+class TestTriggerV1(APITestCase):
+
+    def test_trigger_parses_string_payloads(self):
+        response = self.client.post("/workflows/trigger", json={
+            "context_input": json.dumps(self.contexts),
+            "output": json.dumps([json.dumps(_) for _ in self.outputs]),
+        })
+        self.assertEqual(response.status_code, 200)
+        data = self.temporal.started[0]
+        self.assertEqual(data.output, self.outputs)
+        self.assertEqual(data.fields_to_extract, self.fields)
+
+
+class TestTriggerV2(APITestCase):
+
+    def test_json_payload(self):
+        response = self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["workflow_id"].startswith("workflow-"))
+        data = self.temporal.started[0]
+        self.assertEqual(data.context_input, self.contexts)
+        self.assertEqual(data.fields_to_extract, self.fields)
+
+    def test_msgpack_request_and_response(self):
+        response = self.client.post(
+            "/v2/workflows/trigger",
+            content=msgpack.packb({"invoices": self.contexts, "fields_to_extract": self.fields}),
+            headers={"Content-Type": "application/msgpack", "Accept": "application/msgpack"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/msgpack")
+        self.assertIn("workflow_id", msgpack.unpackb(response.content))
+        self.assertEqual(self.temporal.started[0].output, [])
+
+    def test_missing_fields_and_ground_truth(self):
+        response = self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts})
+        self.assertEqual(response.status_code, 422)
+
+    def test_length_mismatch(self):
+        response = self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "fields_to_extract": self.fields[:1]})
+        self.assertEqual(response.status_code, 422)
+
+    def test_malformed_body(self):
+        response = self.client.post("/v2/workflows/trigger", content=b"{not json", headers={"Content-Type": "application/json"})
+        self.assertIn(response.status_code, (400, 422))
+
+    def test_temporal_unavailable(self):
+        api_main.temporal_client = None
+        response = self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs})
+        self.assertEqual(response.status_code, 503)
+
+
+class TestIdempotentTrigger(APITestCase):
+
+    def _trigger(self, contexts=None, **kwargs):
+        body = {"invoices": contexts or self.contexts, "ground_truth": self.outputs, "idempotent": True, **kwargs}
+        response = self.client.post("/v2/workflows/trigger", json=body)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_duplicate_attaches_to_running_workflow(self):
+        first = self._trigger()
+        # whitespace and case do not change the content hash
+        second = self._trigger([f"  {_.upper()} " for _ in self.contexts])
+        self.assertFalse(first["deduplicated"])
+        self.assertTrue(second["deduplicated"])
+        self.assertEqual(first["workflow_id"], second["workflow_id"])
+        self.assertEqual(second["status"], "RUNNING")
+        self.assertEqual(len(self.temporal.started), 1)
+
+    def test_duplicate_returns_completed_result(self):
+        first = self._trigger()
+        handle = self.temporal.workflows[first["workflow_id"]]
+        handle.status, handle._result = WorkflowExecutionStatus.COMPLETED, {"predictions": []}
+        second = self._trigger()
+        self.assertTrue(second["deduplicated"])
+        self.assertEqual(second["status"], "COMPLETED")
+        self.assertEqual(second["result"], {"predictions": []})
+
+    def test_different_fields_start_new_workflow(self):
+        first = self._trigger()
+        second = self._trigger(fields_to_extract=[["INVOICE_NUMBER"]] * len(self.contexts))
+        self.assertNotEqual(first["workflow_id"], second["workflow_id"])
+
+    def test_different_options_start_new_workflow(self):
+        first = self._trigger()
+        ids = {first["workflow_id"]}
+        for options in ({"minimize": True}, {"pre_extract": True}, {"tenant": "acme"}, {"cascade": ["gemini-2.5-flash"]},
+                        {"ground_truth": [{key: "x" for key in output} for output in self.outputs]}):
+            ids.add(self._trigger(**options)["workflow_id"])
+        self.assertEqual(len(ids), 6)
+        self.assertTrue(self._trigger()["deduplicated"])
+
+    def test_random_ids_without_idempotent_flag(self):
+        ids = {self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs}).json()["workflow_id"] for _ in range(2)}
+        self.assertEqual(len(ids), 2)
+
+
+class TestResultCache(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.result = {"evalution_result ": None, "predictions": [{"INVOICE_NUMBER": "#1"}]}
+        self.handle = FakeHandle("workflow-1", WorkflowExecutionStatus.COMPLETED, self.result)
+        self.temporal.workflows["workflow-1"] = self.handle
+
+    def test_repeat_reads_skip_temporal(self):
+        first = self.client.get("/workflows/workflow-1/result")
+        second = self.client.get("/workflows/workflow-1/result")
+        self.assertEqual(first.json()["result"], self.result)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual((self.handle.describe_calls, self.handle.result_calls), (1, 1))
+
+        # statuses are always asked from Temporal
+        status = self.client.get("/workflows/workflow-1/status")
+        self.assertEqual(status.json()["status"], "COMPLETED")
+        self.assertEqual(self.handle.describe_calls, 2)
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get("/workflows/workflow-1/result").headers["etag"]
+        response = self.client.get("/workflows/workflow-1/result", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_running_workflow_is_not_cached(self):
+        self.handle.status = WorkflowExecutionStatus.RUNNING
+        self.client.get("/workflows/workflow-1/result")
+        self.client.get("/workflows/workflow-1/result")
+        self.assertEqual(self.handle.describe_calls, 2)
+        self.assertEqual(self.handle.result_calls, 0)
+
+    def test_artifacts_are_not_served_as_results(self):
+        # the worker writes its artifacts before the workflow returns, it may still fail afterwards
+        self.handle.status = WorkflowExecutionStatus.FAILED
+        with tempfile.TemporaryDirectory() as tmp:
+            utils.save_json_artifact(self.result, os.path.join(tmp, "workflow-1"), "result.json")
+            response = self.client.get("/workflows/workflow-1/result")
+        self.assertEqual(response.json()["status"], "FAILED")
+        self.assertIsNone(response.json()["result"])
+        self.assertEqual(self.client.get("/workflows/workflow-1/status").json()["status"], "FAILED")
+
+    def test_lru_eviction_and_ttl(self):
+        cache = ResultCache(max_entries=2, ttl_seconds=60)
+        for i in range(3):
+            cache.put(f"workflow-{i}", {"i": i})
+        self.assertIsNone(cache.get("workflow-0"))
+        self.assertEqual(cache.get("workflow-2").result, {"i": 2})
+
+        expired = ResultCache(ttl_seconds=0)
+        expired.put("workflow-0", {})
+        self.assertIsNone(expired.get("workflow-0"))
+
+
+class TestDeadline(APITestCase):
+
+    def test_timeout_field_sets_deadline(self):
+        before = time.time()
+        response = self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs, "timeout_seconds": 30})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(before + 29 < self.temporal.started[0].deadline <= time.time() + 30)
+
+    def test_deadline_header_takes_the_earlier_deadline(self):
+        deadline = datetime.now(timezone.utc) + timedelta(seconds=10)
+        self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs, "timeout_seconds": 60},
+                         headers={"X-Deadline": deadline.isoformat()})
+        self.assertAlmostEqual(self.temporal.started[0].deadline, deadline.timestamp(), places=3)
+
+    def test_invalid_or_past_deadline(self):
+        for header in ("tomorrow", "2020-01-01T00:00:00+00:00", "2030-01-01T00:00:00"):
+            response = self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs},
+                                        headers={"X-Deadline": header})
+            self.assertEqual(response.status_code, 400, header)
+        self.assertEqual(self.temporal.started, [])
+
+    def test_cancel(self):
+        workflow_id = self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs}).json()["workflow_id"]
+        response = self.client.post(f"/workflows/{workflow_id}/cancel")
+        self.assertEqual(response.json()["status"], "CANCEL_REQUESTED")
+        self.assertEqual(self.temporal.workflows[workflow_id].status, WorkflowExecutionStatus.CANCELED)
+
+
+class TestCascade(APITestCase):
+
+    def test_request_tiers_override_the_default(self):
+        with patch("api.main.DEFAULT_CASCADE", ["flash", "pro"]):
+            self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs})
+            self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs, "cascade": ["lite", "flash"]})
+            self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs, "cascade": []})
+        self.assertEqual([_.cascade for _ in self.temporal.started], [["flash", "pro"], ["lite", "flash"], None])
+
+
+class TestBatchStatus(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            status = WorkflowExecutionStatus.COMPLETED if i % 2 == 0 else WorkflowExecutionStatus.RUNNING
+            self.temporal.workflows[f"workflow-{i}"] = FakeHandle(f"workflow-{i}", status, {"predictions": [i]})
+
+    def test_batch_status_pages_with_one_query_per_page(self):
+        ids = [f"workflow-{i}" for i in range(5)] + ["workflow-missing"]
+        first = self.client.post("/workflows/status:batch", json={"workflow_ids": ids, "page_size": 4}).json()
+        self.assertEqual([_["status"] for _ in first["workflows"]], ["COMPLETED", "RUNNING", "COMPLETED", "RUNNING"])
+        self.assertEqual(first["next_page_token"], "4")
+
+        second = self.client.post("/workflows/status:batch", json={"workflow_ids": ids, "page_size": 4, "page_token": "4"}).json()
+        self.assertEqual([_["status"] for _ in second["workflows"]], ["COMPLETED", "NOT_FOUND"])
+        self.assertIsNone(second["next_page_token"])
+        self.assertEqual(len(self.temporal.queries), 2)
+        self.assertTrue(all(handle.describe_calls == 0 for handle in self.temporal.workflows.values()))
+
+    def test_batch_status_includes_completed_results(self):
+        response = self.client.post("/workflows/status:batch", json={"workflow_ids": ["workflow-0", "workflow-1"], "include_results": True}).json()
+        self.assertEqual(response["workflows"][0]["result"], {"predictions": [0]})
+        self.assertIsNone(response["workflows"][1]["result"])
+
+    def test_list_by_batch_tag(self):
+        response = self.client.get("/workflows", params={"batch_tag": "job-1", "status": "COMPLETED", "page_size": 2}).json()
+        self.assertEqual(len(response["workflows"]), 2)
+        self.assertIsNotNone(response["next_page_token"])
+        self.assertIn("BatchTag = 'job-1'", self.temporal.queries[0])
+        self.assertIn("ExecutionStatus = 'Completed'", self.temporal.queries[0])
+
+        self.client.get("/workflows", params={"page_token": response["next_page_token"]})
+        self.assertEqual(len(self.temporal.queries), 2)
+
+    def test_trigger_sets_batch_tag(self):
+        captured = {}
+        original = self.temporal.start_workflow
+
+        async def start_workflow(*args, **kwargs):
+            captured.update(kwargs)
+            return await original(*args, **kwargs)
+
+        self.temporal.start_workflow = start_workflow
+        self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs, "batch_tag": "job-1"})
+        self.assertEqual(captured["search_attributes"][visibility.BATCH_TAG_KEY], "job-1")
+
+    def test_filter_query_escapes_values(self):
+        query = visibility.filter_query(batch_tag="o'brien", status="TIMED_OUT")
+        self.assertIn("BatchTag = 'o\\'brien'", query)
+        self.assertIn("ExecutionStatus = 'TimedOut'", query)
+
+
+class TestAdmission(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._previous_admission = api_main.admission_controller
+
+        async def probe():
+            return admission.LoadSnapshot(running=1, backlog=0)
+
+        api_main.admission_controller = admission.AdmissionController(probe, max_in_flight=1, refresh_interval_s=60)
+
+    def tearDown(self):
+        super().tearDown()
+        api_main.admission_controller = self._previous_admission
+
+    def test_overload_returns_429_with_retry_after(self):
+        response = self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+        self.assertEqual(self.temporal.started, [])
+        self.assertEqual(self.client.get("/admission/metrics").json()["rejected"], 1)
+
+    def test_interactive_lane_bypasses_admission(self):
+        response = self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts[:1], "ground_truth": self.outputs[:1]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.temporal.started[0].priority, PRIORITY_INTERACTIVE)
+        self.assertEqual(self.temporal.task_queues, [INTERACTIVE_TASK_QUEUE_NAME])
+
+
+class TestPriority(APITestCase):
+
+    def test_priority_defaults_by_batch_size(self):
+        self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs})
+        self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs, "priority": "interactive"})
+        self.assertEqual([_.priority for _ in self.temporal.started], [PRIORITY_BULK, PRIORITY_INTERACTIVE])
+        self.assertEqual(self.temporal.task_queues, [INFORMATION_TASK_QUEUE_NAME, INTERACTIVE_TASK_QUEUE_NAME])
+
+    def test_unknown_priority_is_rejected(self):
+        response = self.client.post("/v2/workflows/trigger", json={"invoices": self.contexts, "ground_truth": self.outputs, "priority": "urgent"})
+        self.assertEqual(response.status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+import os
+import json
+import uuid
+import asyncio
+import tempfile
+import unittest
+
+from temporalio import activity
+from temporalio.testing import WorkflowEnvironment
+from temporalio.worker import Worker
+
+from worker import datasets
+from worker import field_extraction_metrics as metrics
+from worker.shared import BatchJob, InvoiceData
+from worker.synthetic import generate_corpus
+from worker.workflow import BatchExtraction, InformationExtraction
+
+SUCCESS = {"status": "success", "error": "", "details": ""}
+# chunks whose model call fails, the parent records them as failed and carries on
+FAILING_CHUNKS = {"-chunk-3"}
+
+
+class TestMergeableSummary(unittest.TestCase):
+
+    def test_merged_chunks_match_full_evaluation(self):
+        _, outputs, _ = generate_corpus(30, seed=3)
+        predictions = [dict(_) for _ in outputs]
+        for i in range(0, 30, 4):
+            predictions[i]["total"] = "0.00"
+
+        full = metrics.evaluate_field_extraction(predictions, outputs)
+        summary = metrics.empty_summary()
+        for start in range(0, 30, 7):
+            chunk = metrics.summarize_extraction(predictions[start:start + 7], outputs[start:start + 7], len(outputs[start:start + 7]))
+            summary = metrics.merge_summaries(summary, chunk)
+        report = metrics.summary_report(summary)
+
+        for section in ("overall_metrics", "document_level_metrics"):
+            for key, value in full[section].items():
+                self.assertAlmostEqual(report[section][key], value, msg=key)
+        self.assertEqual(report["field_level_metrics"], {k: full["field_level_metrics"][k] for k in sorted(full["field_level_metrics"])})
+        self.assertEqual(report["batch"], {"invoices": 30, "chunks": 5, "failed_chunks": 0, "failed_invoices": 0})
+
+    def test_failed_and_unlabelled_chunks(self):
+        summary = metrics.merge_summaries(metrics.failed_summary(5), metrics.summarize_extraction([{}], None, 1))
+        self.assertEqual(summary["invoices"], 6)
+        self.assertEqual(summary["failed_invoices"], 5)
+        self.assertEqual(summary["documents"], 0)
+        # the summary survives a JSON round trip, as it does through continue-as-new
+        self.assertEqual(json.loads(json.dumps(summary)), summary)
+
+    def test_read_slice(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rows.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                for i in range(10):
+                    f.write(json.dumps({"Input": f"invoice {i}", "Final_Output": {"total": str(i)}}) + "\n")
+            self.assertEqual(datasets.count_rows(path), 10)
+            rows = datasets.read_slice(path, 8, 5)
+            self.assertEqual(rows, [("invoice 8", {"total": "8"}), ("invoice 9", {"total": "9"})])
+
+
+@activity.defn(name="count_rows")
+async def count_rows(job: BatchJob) -> int:
+    return datasets.count_rows(job.source, job.input_column, job.output_column)
+
+
+@activity.defn(name="load_input")
+async def load_input(data: InvoiceData) -> dict:
+    # the slice reference travels instead of the invoices
+    assert data.source is not None and not data.context_input
+    return SUCCESS
+
+
+@activity.defn(name="construct_prompt")
+async def construct_prompt(data: InvoiceData) -> dict:
+    return SUCCESS
+
+
+@activity.defn(name="call_model")
+async def call_model(data: InvoiceData) -> dict:
+    if any(data.workflow_id.endswith(_) for _ in FAILING_CHUNKS):
+        return {"status": "failed", "error": "API call failed", "details": "quota"}
+    return SUCCESS
+
+
+@activity.defn(name="parse_and_validate")
+async def parse_and_validate(data: InvoiceData) -> dict:
+    return SUCCESS
+
+
+@activity.defn(name="retry_model_call")
+async def retry_model_call(data: InvoiceData) -> dict:
+    return SUCCESS
+
+
+@activity.defn(name="persist_artifact")
+async def persist_artifact(data: InvoiceData) -> dict:
+    return SUCCESS
+
+
+@activity.defn(name="finalize")
+async def finalize(data: InvoiceData) -> dict:
+    truth = [{"total": str(data.source.offset + i)} for i in range(data.source.limit)]
+    return metrics.summarize_extraction(truth, truth, data.source.limit)
+
+
+class TestBatchExtraction(unittest.TestCase):
+
+    def test_50k_invoices_with_time_skipping(self):
+        invoices, chunk_size = 50_000, 500
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "invoices.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                for i in range(invoices):
+                    f.write(json.dumps({"Input": f"Invoice {i}", "Final_Output": {"total": str(i)}}) + "\n")
+
+            job = BatchJob(job_id=f"batch-{uuid.uuid4()}", source=path, chunk_size=chunk_size,
+                           max_concurrent_children=10, chunks_per_run=30)
+            try:
+                result, history_sizes = asyncio.run(self._run(job))
+            except RuntimeError as e:
+                self.skipTest(f"Temporal test server unavailable: {e}")
+
+        self.assertEqual(result["runs"], 4)
+        self.assertEqual(result["summary"]["invoices"], invoices)
+        self.assertEqual(result["summary"]["chunks"], invoices // chunk_size)
+        self.assertEqual(result["summary"]["failed_invoices"], chunk_size)
+        self.assertEqual(result["metrics"]["overall_metrics"]["total_samples"], invoices - chunk_size)
+        self.assertEqual(result["metrics"]["overall_metrics"]["exact_match_accuracy"], 1.0)
+        # every run of the parent stays small, whatever the size of the dataset
+        self.assertLess(max(history_sizes), 30 * 15)
+
+    async def _run(self, job: BatchJob):
+        async with await WorkflowEnvironment.start_time_skipping() as env:
+            task_queue = f"batch-test-{uuid.uuid4()}"
+            async with Worker(
+                env.client,
+                task_queue=task_queue,
+                workflows=[BatchExtraction, InformationExtraction],
+                activities=[count_rows, load_input, construct_prompt, call_model, parse_and_validate,
+                            retry_model_call, persist_artifact, finalize],
+                max_concurrent_activities=50,
+            ):
+                handle = await env.client.start_workflow(BatchExtraction.run, job, id=job.job_id, task_queue=task_queue)
+                result = await handle.result()
+
+                history_sizes = []
+                run_id = handle.first_execution_run_id
+                while run_id:
+                    history = await env.client.get_workflow_handle(job.job_id, run_id=run_id).fetch_history()
+                    history_sizes.append(len(history.events))
+                    last = history.events[-1]
+                    run_id = last.workflow_execution_continued_as_new_event_attributes.new_execution_run_id or None
+                return result, history_sizes
+
+
+if __name__ == "__main__":
+    unittest.main()
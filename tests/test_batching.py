@@ -0,0 +1,133 @@
+import os
+import json
+import tempfile
+import unittest
+
+from unittest import mock
+
+from worker.batching import BatchController
+from worker.shared import InvoiceData
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+FAST = SimulationConfig(latency_median_s=0.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+
+
+def feed(controller, size, latency, failed=0, n=3):
+    for _ in range(n):
+        controller.record(size, size, latency, 100 * size, failed)
+
+
+class TestBatchController(unittest.TestCase):
+
+    def test_explores_small_sizes_first(self):
+        controller = BatchController([20, 5, 10], min_samples=3)
+        self.assertEqual(controller.choose(100), 5)
+        feed(controller, 5, 1.0)
+        self.assertEqual(controller.choose(100), 10)
+
+    def test_picks_the_best_goodput_within_the_slo(self):
+        controller = BatchController([5, 10, 20, 40], slo_s=10, min_samples=3, probe_every=0)
+        feed(controller, 5, 1.0)
+        feed(controller, 10, 1.5)
+        # fastest per invoice, but half of it fails validation
+        feed(controller, 20, 2.0, failed=10)
+        feed(controller, 40, 12.0)
+        self.assertEqual(controller.choose(100), 10)
+
+        controller = BatchController([5, 10, 20, 40], slo_s=10, min_samples=3, probe_every=0)
+        feed(controller, 5, 1.0)
+        feed(controller, 10, 1.5)
+        # over the SLO, 40 is never tried
+        feed(controller, 20, 12.0)
+        self.assertEqual(controller.choose(100), 10)
+        self.assertEqual(controller.stats()[40]["samples"], 0)
+
+    def test_probes_the_next_larger_size(self):
+        controller = BatchController([5, 10], min_samples=1, probe_every=2)
+        feed(controller, 5, 1.0)
+        feed(controller, 10, 10.0)
+        self.assertEqual([controller.choose(50) for _ in range(4)], [5, 10, 5, 10])
+
+    def test_state_survives_a_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state", "batch.json")
+            controller = BatchController([5, 10], min_samples=2, state_path=path)
+            feed(controller, 5, 1.0, n=2)
+            feed(controller, 10, 1.0, n=2)
+            controller.flush()
+
+            restarted = BatchController([5, 10], min_samples=2, state_path=path)
+            self.assertEqual(restarted.stats(), controller.stats())
+            self.assertEqual(restarted.choose(50), 10)
+
+    def test_state_writes_are_throttled(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "batch.json")
+            controller = BatchController([5], state_path=path, save_every_s=60)
+            feed(controller, 5, 1.0, n=3)
+            with open(path) as f:
+                self.assertEqual(len(json.load(f)["samples"]["5"]), 1)
+            controller.flush()
+            with open(path) as f:
+                self.assertEqual(len(json.load(f)["samples"]["5"]), 3)
+
+    def test_state_path_per_worker(self):
+        with mock.patch.dict(os.environ, {"LLM_BATCH_SIZES": "5,10", "WORKER_ID": "worker-2"}):
+            self.assertEqual(BatchController.from_env().state_path, os.path.join("runs", "batch_controller.worker-2.json"))
+        with mock.patch.dict(os.environ, {"LLM_BATCH_SIZES": "5", "WORKER_ID": "a", "LLM_BATCH_STATE": "/state/{worker}.json"}):
+            self.assertEqual(BatchController.from_env().state_path, "/state/a.json")
+
+
+class TestBatchedPipeline(unittest.TestCase):
+
+    def setUp(self):
+        # decisions are logged to ./runs/<workflow_id>
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_batch_is_split_and_recorded(self):
+        contexts, outputs, fields = generate_corpus(10, seed=6)
+        controller = BatchController([4], min_samples=1)
+        results = {}
+        for batcher in (None, controller):
+            llm = SimulatedGemini(SimulatedModel(FAST))
+            llm.batcher = batcher
+            llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf"))
+            llm.construct_prompt()
+            self.assertEqual(llm.call_model()["status"], "success")
+            llm.parse_and_validate()
+            results[batcher is not None] = llm
+
+        self.assertEqual(results[True].metadata["requests"], 3)
+        self.assertEqual(results[True].metadata["batch_size"], 4)
+        self.assertEqual(results[True].validated_response, results[False].validated_response)
+        samples = list(controller.samples[4])
+        self.assertEqual([_[0] for _ in samples], [4, 4, 2])
+        self.assertEqual(sum(_[3] for _ in samples), len(results[True].error_response))
+        with open(os.path.join("runs", "wf", "workflow.log")) as f:
+            decision = json.loads(f.readline())
+        self.assertEqual((decision["batch_size"], decision["invoices"], decision["batch_size_reason"]), (4, 10, "explore"))
+
+    def test_requests_of_a_split_batch_run_side_by_side(self):
+        contexts, outputs, fields = generate_corpus(12, seed=6)
+        slow = SimulationConfig(latency_median_s=0.3, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+        llm = SimulatedGemini(SimulatedModel(slow))
+        llm.batcher = BatchController([4], min_samples=1)
+        llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf"))
+        llm.construct_prompt()
+        self.assertEqual(llm.call_model()["status"], "success")
+        self.assertEqual(llm.metadata["requests"], 3)
+        self.assertLess(llm.latency, 0.6)
+        self.assertEqual([ids for ids, _, _ in llm.chunks], [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]])
+        self.assertTrue(all(latency >= 0.3 for _, latency, _ in llm.chunks))
+        self.assertEqual(llm.parse_and_validate()["status"], "success")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from worker import utils
+from worker.synthetic import generate_corpus, extract_labeled_fields
+
+
+class TestSyntheticCorpus(unittest.TestCase):
+
+    def test_generate_corpus_is_deterministic(self):
+        self.assertEqual(generate_corpus(5, seed=3), generate_corpus(5, seed=3))
+
+    def test_labeled_fields_pass_validation(self):
+        contexts, outputs, fields = generate_corpus(20, seed=1)
+        for context, truth, required in zip(contexts, outputs, fields):
+            prediction = extract_labeled_fields(utils.normalize_text(context), required)
+            self.assertEqual(utils.validate_extracted_data(prediction, context, required), [])
+            self.assertEqual(prediction["INVOICE_NUMBER"], truth["INVOICE_NUMBER"].lower())
+
+
+class TestHotPathBenchmarks(unittest.TestCase):
+
+    @patch.dict('os.environ', {'GOOGLE_API_KEY': 'test_key'})
+    def test_run_covers_all_cases(self):
+        from benchmarks import hot_paths
+        with patch.object(hot_paths, "time_case", return_value={"median_s": 0.001, "min_s": 0.001, "repeats": 3}):
+            results = hot_paths.run([5])
+        self.assertEqual(set(results), {
+            "get_batched_prompt_with_fields", "retry_prompt", "normalize_text", "validate_extracted_data",
+            "parse_and_validate", "evaluate_field_extraction", "utils_evaluate",
+        })
+        self.assertIn("5", results["parse_and_validate"])
+
+    def test_compare_flags_regressions_past_threshold(self):
+        from benchmarks import hot_paths
+        baseline = {"normalize_text": {"1000": {"median_s": 0.010}}, "retry_prompt": {"1000": {"median_s": 0.010}}}
+        results = {"normalize_text": {"1000": {"median_s": 0.015}}, "retry_prompt": {"1000": {"median_s": 0.011}}}
+        report = {row["case"]: row for row in hot_paths.compare(results, baseline, threshold=0.25)}
+        self.assertTrue(report["normalize_text"]["regressed"])
+        self.assertFalse(report["retry_prompt"]["regressed"])
+
+    def test_compare_ignores_noise_below_floor(self):
+        from benchmarks import hot_paths
+        baseline = {"normalize_text": {"10": {"median_s": 0.0001}}}
+        results = {"normalize_text": {"10": {"median_s": 0.0003}}}
+        self.assertFalse(hot_paths.compare(results, baseline, threshold=0.25)[0]["regressed"])
+
+    @patch.dict('os.environ', {'GOOGLE_API_KEY': 'test_key'})
+    def test_missing_baseline_fails_when_required(self):
+        from benchmarks import hot_paths
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(hot_paths, "time_case", return_value={"median_s": 0.001, "min_s": 0.001, "repeats": 3}):
+            path = os.path.join(tmp, "hot_paths.json")
+            self.assertEqual(hot_paths.main(["--sizes", "5", "--baseline", path, "--require-baseline"]), 1)
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(hot_paths.main(["--sizes", "5", "--baseline", path]), 0)
+            self.assertEqual(hot_paths.main(["--sizes", "5", "--baseline", path, "--require-baseline"]), 0)
+
+    def test_committed_baseline_covers_every_case(self):
+        from benchmarks import hot_paths
+        baseline = hot_paths.load_baseline()
+        self.assertEqual(set(baseline), set(hot_paths.build_cases(5)))
+        self.assertTrue(all(set(_) == {str(size) for size in hot_paths.DEFAULT_SIZES} for _ in baseline.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
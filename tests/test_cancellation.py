@@ -0,0 +1,161 @@
+import os
+import time
+import uuid
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from temporalio.client import WorkflowFailureError
+from temporalio.testing import ActivityEnvironment, WorkflowEnvironment
+from temporalio.worker import Worker
+
+from worker.activities import LLMActivities
+from worker.lanes import LaneLimiter
+from worker.shared import InvoiceData
+from worker.synthetic import generate_corpus
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+from worker.workflow import InformationExtraction
+
+SLOW = SimulationConfig(latency_median_s=3.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+
+
+class InTempDir(unittest.TestCase):
+
+    def setUp(self):
+        # activities write ./runs/<workflow_id>
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+
+class TestDeadlines(unittest.TestCase):
+
+    def setUp(self):
+        self.contexts, self.outputs, self.fields = generate_corpus(2, seed=1)
+        self.data = InvoiceData(context_input=self.contexts, output=self.outputs, fields_to_extract=self.fields, workflow_id="wf")
+
+    def test_deadline_bounds_the_model_request(self):
+        model = MagicMock()
+        llm = SimulatedGemini(model)
+        self.data.deadline = time.time() + 30
+        llm.load_input(self.data)
+        llm.construct_prompt()
+        llm.call_model()
+        timeout = model.generate_content.call_args.kwargs["request_options"]["timeout"]
+        self.assertTrue(25 < timeout <= 30)
+
+    def test_requests_without_deadline_time_out(self):
+        model = MagicMock()
+        llm = SimulatedGemini(model)
+        llm.request_timeout_s = 60
+        llm.load_input(self.data)
+        llm.construct_prompt()
+        llm.call_model()
+        self.assertEqual(model.generate_content.call_args.kwargs["request_options"], {"timeout": 60})
+        # the earlier of the deadline and the request timeout
+        llm.deadline = time.time() + 600
+        llm.call_model()
+        self.assertEqual(model.generate_content.call_args.kwargs["request_options"], {"timeout": 60})
+
+    def test_simulated_request_times_out_at_deadline(self):
+        llm = SimulatedGemini(SimulatedModel(SLOW))
+        self.data.deadline = time.time() + 0.2
+        llm.load_input(self.data)
+        llm.construct_prompt()
+        started = time.perf_counter()
+        result = llm.call_model()
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(result["error"], "API call failed")
+
+    def test_cancelled_pipeline_makes_no_request(self):
+        model = MagicMock()
+        llm = SimulatedGemini(model)
+        llm.load_input(self.data)
+        llm.construct_prompt()
+        llm.cancel()
+        self.assertEqual(llm.call_model()["error"], "Request cancelled")
+        llm.error_response = [(0, ["missing field"])]
+        self.assertEqual(llm.retry_model_call()["error"], "Request cancelled")
+        model.generate_content.assert_not_called()
+
+
+class TestActivityCancellation(InTempDir):
+
+    def test_call_model_heartbeats_and_releases_on_cancel(self):
+        limiter = LaneLimiter(max_concurrency=1)
+        activities = LLMActivities(llm_factory=lambda: SimulatedGemini(SimulatedModel(SLOW)), limiter=limiter, heartbeat_interval_s=0.05)
+        contexts, outputs, fields = generate_corpus(1, seed=1)
+        data = InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf-cancel")
+        env = ActivityEnvironment()
+        heartbeats = []
+        env.on_heartbeat = lambda *details: heartbeats.append(details)
+
+        async def scenario():
+            await env.run(activities.load_input, data)
+            await env.run(activities.construct_prompt, data)
+            llm = activities.sessions[data.workflow_id]
+            asyncio.get_running_loop().call_later(0.3, env.cancel)
+            started = time.perf_counter()
+            with self.assertRaises(asyncio.CancelledError):
+                await env.run(activities.call_model, data)
+            return llm, time.perf_counter() - started
+
+        llm, elapsed = asyncio.run(scenario())
+        # the 3s model call is abandoned, the activity returns as soon as the cancellation arrives
+        self.assertLess(elapsed, 1.0)
+        self.assertTrue(heartbeats)
+        self.assertTrue(llm.cancelled.is_set())
+        self.assertNotIn(data.workflow_id, activities.sessions)
+        self.assertEqual(limiter.active, 0)
+
+
+class TestWorkflowCancellation(InTempDir):
+
+    def test_cancelled_workflow_frees_the_worker_slot(self):
+        try:
+            asyncio.run(self._run())
+        except RuntimeError as e:
+            self.skipTest(f"Temporal dev server unavailable: {e}")
+
+    async def _run(self):
+        slow = SimulationConfig(latency_median_s=60.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+        fast = SimulationConfig(latency_median_s=0.01, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+        # the first pipeline is the startup check, the second one serves the stuck workflow
+        models = iter([SimulatedModel(fast), SimulatedModel(slow)])
+        activities = LLMActivities(llm_factory=lambda: SimulatedGemini(next(models, None) or SimulatedModel(fast)))
+        contexts, outputs, fields = generate_corpus(1, seed=3)
+        task_queue = f"cancel-test-{uuid.uuid4()}"
+
+        env = await WorkflowEnvironment.start_local()
+        try:
+            async with Worker(
+                env.client,
+                task_queue=task_queue,
+                workflows=[InformationExtraction],
+                activities=[activities.load_input, activities.construct_prompt, activities.call_model, activities.parse_and_validate, activities.retry_model_call, activities.persist_artifact, activities.finalize],
+                # a single slot, the second workflow only runs once the first one let go of it
+                max_concurrent_activities=1,
+            ):
+                def data(workflow_id):
+                    return InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id=workflow_id)
+
+                stuck = await env.client.start_workflow(InformationExtraction.run, data("wf-stuck"), id="wf-stuck", task_queue=task_queue)
+                await asyncio.sleep(1.0)
+                await stuck.cancel()
+                started = time.perf_counter()
+                result = await env.client.execute_workflow(InformationExtraction.run, data("wf-next"), id="wf-next", task_queue=task_queue)
+                self.assertLess(time.perf_counter() - started, 10.0)
+                self.assertIsNotNone(result["predictions"])
+                with self.assertRaises(WorkflowFailureError):
+                    await stuck.result()
+        finally:
+            await env.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import unittest
+from types import SimpleNamespace
+
+from worker import cascade
+from worker.llms import gemini
+from worker.providers import ModelRoute, ModelRouter
+from worker.shared import InvoiceData
+from worker.simulated_llm import SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+FAST = SimulationConfig(latency_median_s=0.001, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+
+
+class WeakModel(SimulatedModel):
+    """
+    answers like the simulated model, but blanks the invoices at `blank` and invents a value for those at `wrong`
+    """
+
+    def __init__(self, blank=(), wrong=()):
+        super().__init__(FAST)
+        self.blank, self.wrong = set(blank), set(wrong)
+        self.calls = []
+
+    def generate_content(self, prompt, **kwargs):
+        response = super().generate_content(prompt, **kwargs)
+        predictions = json.loads(response.text)
+        self.calls.append(len(predictions))
+        for i, prediction in enumerate(predictions):
+            if i in self.blank:
+                predictions[i] = {key: None if key != "index" else value for key, value in prediction.items()}
+            if i in self.wrong:
+                predictions[i] = {key: "made up value" if key != "index" else value for key, value in prediction.items()}
+        response.text = json.dumps(predictions)
+        return response
+
+
+class TestLowConfidence(unittest.TestCase):
+
+    def test_mostly_empty_answers_are_low_confidence(self):
+        fields = ["TOTAL", "DATE", "BANK_NAME"]
+        self.assertIsNotNone(cascade.low_confidence({"total": None, "date": "", "bank_name": "x"}, fields))
+        self.assertIsNone(cascade.low_confidence({"total": "1", "date": None, "bank_name": "x"}, fields))
+        self.assertIsNone(cascade.low_confidence({}, []))
+
+
+class TestCascadePipeline(unittest.TestCase):
+
+    def setUp(self):
+        contexts, outputs, fields = generate_corpus(6, seed=8)
+        self.data = InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf",
+                                cascade=["flash", "pro"])
+
+    def _pipeline(self, flash, pro):
+        router = ModelRouter([
+            ModelRoute("flash", lambda: flash, cost_per_1k_input=0.1, cost_per_1k_output=0.1),
+            ModelRoute("pro", lambda: pro, cost_per_1k_input=1.0, cost_per_1k_output=1.0),
+        ])
+        llm = gemini(router=router)
+        llm.load_input(self.data)
+        llm.construct_prompt()
+        self.assertEqual(llm.call_model()["status"], "success")
+        return llm
+
+    def test_only_failing_invoices_are_escalated(self):
+        flash, pro = WeakModel(blank={1}, wrong={4}), WeakModel()
+        llm = self._pipeline(flash, pro)
+        result = llm.parse_and_validate()
+        self.assertEqual(result["status"], "failed")
+        self.assertEqual([i for i, _ in llm.error_response], [1, 4])
+
+        self.assertEqual(llm.escalate()["status"], "success")
+        self.assertEqual((flash.calls, pro.calls), ([6], [2]))
+        self.assertTrue(any(llm.validated_response[1].values()))
+        self.assertNotIn("made up value", llm.validated_response[4].values())
+        llm.finalize()
+
+        report = llm.final_result["cascade"]
+        self.assertEqual([_["model"] for _ in report["tiers"]], ["flash", "pro"])
+        self.assertEqual(report["escalated"], 2)
+        self.assertAlmostEqual(report["escalation_rate"], 2 / 6)
+        self.assertGreater(report["cost_saved_usd"], 0)
+        self.assertIsNotNone(report["latency_saved_s"])
+
+    def test_no_escalation_when_the_fast_tier_is_right(self):
+        flash, pro = WeakModel(), WeakModel()
+        llm = self._pipeline(flash, pro)
+        self.assertEqual(llm.parse_and_validate()["status"], "success")
+        report = llm.cascade_report()
+        self.assertEqual((report["escalated"], pro.calls), (0, []))
+        self.assertAlmostEqual(report["cost_saved_usd"], report["tiers"][0]["cost_usd"] * 9)
+
+    def test_last_tier_is_not_second_guessed(self):
+        # the strongest tier's empty answers are kept, only invalid ones go on to the retry
+        flash, pro = WeakModel(blank={0}), WeakModel(blank={0})
+        llm = self._pipeline(flash, pro)
+        llm.parse_and_validate()
+        self.assertEqual(llm.escalate()["status"], "success")
+        self.assertEqual(llm.escalate()["error"], "")
+        self.assertEqual(llm.tier, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
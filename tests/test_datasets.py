@@ -0,0 +1,212 @@
+import os
+import csv
+import json
+import asyncio
+import tempfile
+import unittest
+
+from itertools import islice
+from unittest import mock
+
+from openpyxl import Workbook
+from temporalio.exceptions import WorkflowAlreadyStartedError
+
+from worker import datasets, utils
+from worker.run_workflow import run_dataset
+from worker.synthetic import generate_corpus
+
+
+class FakeHandle:
+    def __init__(self, result):
+        self._result = result
+
+    async def result(self):
+        return self._result
+
+
+class FakeClient:
+    """
+    Records submitted batches, optionally failing one of them.
+    """
+    def __init__(self, fail_batches=(), already_started=()):
+        self.started = []
+        self.fail_batches = set(fail_batches)
+        self.already_started = set(already_started)
+
+    async def start_workflow(self, workflow, data, id, task_queue, **kwargs):
+        batch = int(id.rsplit("-", 1)[1])
+        if batch in self.already_started:
+            raise WorkflowAlreadyStartedError(id, workflow)
+        self.started.append((id, len(data.context_input)))
+        if batch in self.fail_batches:
+            raise RuntimeError("worker unavailable")
+        return FakeHandle({"predictions": [{}] * len(data.context_input)})
+
+    def get_workflow_handle(self, workflow_id):
+        return FakeHandle({"predictions": []})
+
+
+class TestDatasetReaders(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.contexts, self.outputs, _ = generate_corpus(7, seed=4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def _check(self, path):
+        rows = list(datasets.iter_rows(path))
+        self.assertEqual([_[0] for _ in rows], self.contexts)
+        self.assertEqual([_[1] for _ in rows], self.outputs)
+
+    def test_jsonl(self):
+        path = self._path("data.jsonl")
+        with open(path, "w") as f:
+            for context, output in zip(self.contexts, self.outputs):
+                f.write(json.dumps({"Input": context, "Final_Output": output}) + "\n")
+        self._check(path)
+
+    def test_csv(self):
+        path = self._path("data.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Input", "Final_Output"])
+            for context, output in zip(self.contexts, self.outputs):
+                writer.writerow([context, json.dumps(output)])
+        self._check(path)
+
+    def test_xlsx(self):
+        path = self._path("data.xlsx")
+        workbook = Workbook()
+        workbook.active.append(["Input", "Final_Output"])
+        for context, output in zip(self.contexts, self.outputs):
+            workbook.active.append([context, json.dumps(output)])
+        workbook.save(path)
+        self._check(path)
+
+    @mock.patch.object(datasets, "INDEX_STRIDE", 2)
+    def test_indexed_slices(self):
+        jsonl, csv_path = self._path("data.jsonl"), self._path("data.csv")
+        with open(jsonl, "w") as f, open(csv_path, "w", newline="") as g:
+            writer = csv.writer(g)
+            writer.writerow(["Input", "Final_Output"])
+            for i, (context, output) in enumerate(zip(self.contexts, self.outputs)):
+                if i == 3:
+                    # a row without an invoice text is not counted
+                    f.write(json.dumps({"Final_Output": output}) + "\n\n")
+                f.write(json.dumps({"Input": context, "Final_Output": output}) + "\n")
+                writer.writerow([context, json.dumps(output)])
+
+        for path in (jsonl, csv_path):
+            self.assertEqual(datasets.count_rows(path), 7)
+            self.assertTrue(os.path.exists(f"{path}.index.json"))
+            self.assertEqual(datasets._seek(path, 5, "Input")[0], 4)
+            for offset in range(8):
+                expected = list(islice(datasets.iter_rows(path), offset, offset + 3))
+                self.assertEqual(datasets.read_slice(path, offset, 3), expected)
+
+        # an index older than the file is ignored
+        with open(jsonl, "a") as f:
+            f.write(json.dumps({"Input": "new", "Final_Output": None}) + "\n")
+        self.assertEqual(datasets._seek(jsonl, 5, "Input"), (0, None))
+        self.assertEqual(datasets.read_slice(jsonl, 7, 3), [("new", None)])
+
+    @mock.patch.object(datasets, "INDEX_STRIDE", 2)
+    def test_xlsx_slices_read_the_copy(self):
+        path = self._path("data.xlsx")
+        workbook = Workbook()
+        workbook.active.append(["Input", "Final_Output"])
+        for context, output in zip(self.contexts, self.outputs):
+            workbook.active.append([context, json.dumps(output)])
+        workbook.save(path)
+
+        self.assertEqual(datasets.count_rows(path), 7)
+        self.assertTrue(os.path.exists(f"{path}.rows.jsonl"))
+        self.assertEqual(datasets._seek(path, 5, "Input")[0], 4)
+        with mock.patch.object(datasets, "_iter_xlsx", side_effect=AssertionError("the sheet was read again")):
+            for offset in range(8):
+                expected = [(c, o) for c, o in zip(self.contexts, self.outputs)][offset:offset + 3]
+                self.assertEqual(datasets.read_slice(path, offset, 3), expected)
+
+    def test_rows_without_ground_truth_get_the_fields(self):
+        rows = [(context, None) for context in self.contexts[:2]]
+        data = datasets.build_invoice_data(rows, "wf")
+        self.assertEqual(data.fields_to_extract, [utils.REQUIRED_FIELDS] * 2)
+        self.assertEqual(data.output, [])
+        data = datasets.build_invoice_data(rows + [(self.contexts[2], self.outputs[2])], "wf", ["INVOICE_NUMBER"])
+        self.assertEqual(data.fields_to_extract, [["INVOICE_NUMBER"], ["INVOICE_NUMBER"], list(self.outputs[2])])
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            list(datasets.iter_rows(self._path("data.txt")))
+
+    def test_iter_batches(self):
+        batches = list(datasets.iter_batches(iter(range(7)), 3))
+        self.assertEqual(batches, [(0, [0, 1, 2]), (1, [3, 4, 5]), (2, [6])])
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_out_of_order_completion_and_resume(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "run.checkpoint.json")
+            checkpoint = datasets.Checkpoint(path, "dataset-1", 10)
+            for index in (0, 2, 3, 1, 5):
+                checkpoint.mark_done(index)
+            checkpoint.save()
+
+            resumed = datasets.Checkpoint(path, "dataset-2", 10)
+            self.assertEqual(resumed.run_id, "dataset-1")
+            self.assertEqual(resumed.watermark, 4)
+            self.assertTrue(resumed.is_done(5))
+            self.assertFalse(resumed.is_done(4))
+
+            with self.assertRaises(ValueError):
+                datasets.Checkpoint(path, "dataset-3", 20)
+
+
+class TestRunDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "data.jsonl")
+        contexts, outputs, _ = generate_corpus(10, seed=1)
+        with open(self.path, "w") as f:
+            for context, output in zip(contexts, outputs):
+                f.write(json.dumps({"Input": context, "Final_Output": json.dumps(output)}) + "\n")
+        self.checkpoint = os.path.join(self.tmp.name, "data.checkpoint.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_batches_and_summary(self):
+        client = FakeClient()
+        summary = asyncio.run(run_dataset(client, self.path, batch_size=3, concurrency=2, checkpoint_path=self.checkpoint))
+        self.assertEqual([size for _, size in client.started], [3, 3, 3, 1])
+        self.assertEqual(summary["batches_succeeded"], 4)
+        self.assertEqual(summary["invoices_processed"], 10)
+
+    def test_resume_only_reruns_unfinished_batches(self):
+        summary = asyncio.run(run_dataset(FakeClient(fail_batches={2}), self.path, batch_size=3, checkpoint_path=self.checkpoint))
+        self.assertEqual(summary["batches_failed"], 1)
+        self.assertEqual(summary["failures"][0]["batch"], 2)
+
+        client = FakeClient()
+        summary = asyncio.run(run_dataset(client, self.path, batch_size=3, checkpoint_path=self.checkpoint))
+        self.assertEqual(summary["batches_skipped"], 3)
+        self.assertEqual(len(client.started), 1)
+        self.assertTrue(client.started[0][0].endswith("-batch-2"))
+
+    def test_attaches_to_already_started_batch(self):
+        client = FakeClient(already_started={0})
+        summary = asyncio.run(run_dataset(client, self.path, batch_size=5, checkpoint_path=self.checkpoint))
+        self.assertEqual(summary["batches_succeeded"], 2)
+        self.assertEqual(len(client.started), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import unittest
+
+from worker import utils
+from worker.examples import Example, ExampleBank, render
+from worker.shared import InvoiceData
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+FAST = SimulationConfig(latency_median_s=0.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+# median selection time for a batch of 20, override with SELECTION_BUDGET_MS on slow machines
+SELECTION_BUDGET_MS = float(os.getenv("SELECTION_BUDGET_MS", "1.0"))
+
+CATERING = Example("Borcelle Catering Services\nGrilled Chicken 2 $200\nBruschetta 2 $200\nTotal $400", {"TOTAL_AMOUNT": "$400", "BANK_NAME": None})
+FREIGHT = Example("Larana Freight Logistics\nContainer shipping Rotterdam\nPallet handling fee $90\nTotal $900", {"TOTAL_AMOUNT": "$900", "QTY": "1"})
+SOFTWARE = Example("Fauget Software Licence\nAnnual subscription seats 10\nSupport plan\nTotal $1200", {"TOTAL_AMOUNT": "$1200"})
+
+
+class TestExampleBank(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = ExampleBank([CATERING, FREIGHT, SOFTWARE], k=1)
+
+    def test_nearest_example_is_selected(self):
+        invoice = utils.normalize_text("Shipping invoice\nContainer freight Hamburg\nPallet handling $40")
+        self.assertEqual(self.bank.select([invoice]), [FREIGHT])
+        catering = utils.normalize_text("Catering for 40 guests, grilled chicken and bruschetta")
+        # the nearest example of every invoice of the batch
+        self.assertCountEqual(self.bank.select([invoice, catering], k=2), [CATERING, FREIGHT])
+
+    def test_batches_without_known_terms_get_the_first_examples(self):
+        self.assertEqual(self.bank.select(["zzz qqq"], k=1), [CATERING])
+        self.assertEqual(self.bank.select([], k=2), [CATERING, FREIGHT])
+
+    def test_render_keeps_the_fields_of_the_batch(self):
+        text = render([FREIGHT], [["TOTAL_AMOUNT", "INVOICE_NUMBER"]])
+        self.assertIn("<INVOICE_0>", text)
+        self.assertIn("[TOTAL_AMOUNT]", text)
+        self.assertNotIn("QTY", text)
+
+    def test_bank_and_query_stay_sparse(self):
+        self.assertEqual(self.bank.matrix.format, "csr")
+        self.assertEqual(self.bank._query(["freight container"]).nnz, 2)
+
+    def test_selection_is_fast(self):
+        contexts, outputs, _ = generate_corpus(200, seed=1)
+        bank = ExampleBank([Example(c, o) for c, o in zip(contexts, outputs)], k=2)
+        batch = [utils.normalize_text(_) for _ in generate_corpus(20, seed=2)[0]]
+        timings = []
+        for _ in range(50):
+            bank.select(batch)
+            timings.append(bank.last_selection_ms)
+        self.assertLess(sorted(timings)[25], SELECTION_BUDGET_MS)
+
+
+class TestSelectedPipeline(unittest.TestCase):
+
+    def test_prompt_carries_the_selected_example(self):
+        contexts, outputs, fields = generate_corpus(6, seed=3)
+        llm = SimulatedGemini(SimulatedModel(FAST))
+        llm.examples = ExampleBank([CATERING, FREIGHT, SOFTWARE])
+        llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf", minimize=True))
+        selections = []
+        select = llm.examples.select
+        llm.examples.select = lambda *args, **kwargs: selections.append(args) or select(*args, **kwargs)
+        llm.construct_prompt()
+        # one selection per prompt, shared by the report and the minimized prompt
+        self.assertEqual(len(selections), 1)
+        self.assertNotIn("Borcelle | Catering Services", llm.prompt)
+        self.assertEqual(llm.prompt.count("<EXAMPLE>"), 1)
+
+        llm.call_model()
+        self.assertEqual(llm.parse_and_validate()["status"], "success")
+        report = llm.finalize()["few_shot"]
+        self.assertGreater(report["tokens_saved"], 0)
+        self.assertEqual(report["examples"], 1)
+
+    def test_report_compares_both_modes(self):
+        from benchmarks import few_shot_report
+        contexts, outputs, _ = generate_corpus(20, seed=5)
+        model = SimulatedModel(FAST)
+        bank = ExampleBank([Example(c, o) for c, o in zip(*generate_corpus(30, seed=1)[:2])])
+        result = few_shot_report.report(list(zip(contexts, outputs)), bank, lambda: SimulatedGemini(model), batch_size=10)
+        self.assertEqual(result["selected"]["retry_rate"], result["fixed"]["retry_rate"])
+        self.assertLess(result["selected"]["prompt_tokens"], result["fixed"]["prompt_tokens"])
+        self.assertIsNotNone(result["selected"]["selection_ms_p50"])
+
+
+if __name__ == "__main__":
+    unittest.main()
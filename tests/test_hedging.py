@@ -0,0 +1,123 @@
+import os
+import time
+import unittest
+
+from unittest import mock
+
+from worker.hedging import Hedger
+from worker.llms import gemini
+from worker.providers import ModelRoute, ModelRouter
+from worker.shared import InvoiceData
+from worker.simulated_llm import SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+FAST = SimulationConfig(latency_median_s=0.001, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+SLOW = SimulationConfig(latency_median_s=0.5, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+
+
+def warm(hedger, model="m", samples=5, latency=0.01):
+    for _ in range(samples):
+        hedger._record(model, latency)
+
+
+def sleeper(seconds, value):
+    def call():
+        time.sleep(seconds)
+        return value
+    return call
+
+
+class TestHedger(unittest.TestCase):
+
+    def test_no_hedge_before_min_samples(self):
+        hedger = Hedger(min_samples=5, max_extra_load=1.0)
+        self.assertIsNone(hedger.delay("m"))
+        response, outcome = hedger.call("m", sleeper(0.05, "primary"), sleeper(0, "hedge"))
+        self.assertEqual(response, "primary")
+        self.assertFalse(outcome.hedged)
+
+    def test_slow_primary_is_hedged(self):
+        hedger = Hedger(min_samples=5, max_extra_load=1.0)
+        warm(hedger)
+        response, outcome = hedger.call("m", sleeper(0.5, "primary"), sleeper(0, "hedge"))
+        self.assertEqual(response, "hedge")
+        self.assertTrue(outcome.hedged and outcome.hedge_won)
+        self.assertEqual(hedger.stats()["hedge_win_rate"], 1.0)
+
+    def test_queue_time_is_not_latency(self):
+        hedger = Hedger(min_samples=5, max_extra_load=1.0, max_workers=1)
+        warm(hedger, latency=0.05)
+        blocker = hedger.executor.submit(time.sleep, 0.1)
+        # queued behind the blocker, the request itself is faster than the hedge delay
+        response, outcome = hedger.call("m", sleeper(0.01, "primary"), sleeper(0, "hedge"))
+        blocker.result()
+        self.assertEqual(response, "primary")
+        self.assertFalse(outcome.hedged)
+        self.assertLess(hedger.latencies["m"][-1], 0.05)
+
+    def test_pool_is_sized_from_the_worker_slots(self):
+        env = {"LLM_HEDGE_PERCENTILE": "95", "WORKER_MAX_CONCURRENT_ACTIVITIES": "50", "LLM_MAX_PARALLEL_REQUESTS": "2"}
+        with mock.patch.dict(os.environ, env):
+            self.assertEqual(Hedger.from_env().executor._max_workers, 200)
+
+    def test_extra_load_is_capped(self):
+        hedger = Hedger(min_samples=5, max_extra_load=0.25)
+        # enough fast samples that the slow calls below do not move the percentile
+        warm(hedger, samples=100)
+        outcomes = [hedger.call("m", sleeper(0.05, "primary"), sleeper(0, "hedge"))[1] for _ in range(8)]
+        self.assertEqual(sum(_.hedged for _ in outcomes), 2)
+        self.assertEqual(hedger.stats()["hedge_rate"], 0.25)
+
+    def test_both_failing_raise_the_primary_error(self):
+        def primary():
+            time.sleep(0.05)
+            raise ValueError("primary")
+
+        def hedge():
+            raise KeyError("hedge")
+
+        hedger = Hedger(min_samples=5, max_extra_load=1.0)
+        warm(hedger)
+        with self.assertRaisesRegex(ValueError, "primary"):
+            hedger.call("m", primary, hedge)
+
+    def test_failed_hedge_waits_for_the_primary(self):
+        def hedge():
+            raise KeyError("hedge")
+
+        hedger = Hedger(min_samples=5, max_extra_load=1.0)
+        warm(hedger)
+        response, outcome = hedger.call("m", sleeper(0.05, "primary"), hedge)
+        self.assertEqual(response, "primary")
+        self.assertTrue(outcome.hedged)
+        self.assertFalse(outcome.hedge_won)
+
+
+class TestPipelineWithHedging(unittest.TestCase):
+
+    def setUp(self):
+        contexts, outputs, fields = generate_corpus(3, seed=8)
+        self.data = InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf")
+
+    def test_hedge_to_the_alternate_route(self):
+        router = ModelRouter([
+            ModelRoute("slow", lambda: SimulatedModel(SLOW), prior_seconds_per_1k_tokens=0.1),
+            ModelRoute("fast", lambda: SimulatedModel(FAST), cost_per_1k_input=1.0),
+        ])
+        hedger = Hedger(min_samples=5, max_extra_load=1.0, alternate=True)
+        warm(hedger, model="slow")
+        llm = gemini(router=router, hedger=hedger)
+        llm.load_input(self.data)
+        llm.construct_prompt()
+
+        started = time.time()
+        self.assertEqual(llm.call_model()["status"], "success")
+        self.assertLess(time.time() - started, 0.4)
+        self.assertEqual(llm.parse_and_validate()["status"], "success")
+        self.assertEqual(llm.metadata["model"], "slow")
+        self.assertTrue(llm.metadata["hedged"])
+        self.assertTrue(llm.metadata["hedge_won"])
+
+
+if __name__ == "__main__":
+    unittest.main()
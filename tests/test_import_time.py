@@ -0,0 +1,57 @@
+import os
+import sys
+import subprocess
+import unittest
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# heavy libraries that must only load when the first model call or evaluation needs them
+LAZY_MODULES = ("google.generativeai", "sklearn", "pandas", "litellm")
+# cumulative import time budgets in milliseconds, override with IMPORT_BUDGET_MS_<MODULE>
+BUDGETS_MS = {
+    "api.main": 600,
+    "worker.run_worker": 500,
+}
+
+
+def import_times(module: str) -> dict:
+    """
+    Imports `module` in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        {module name: cumulative import time in microseconds}
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-W", "ignore", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+
+    def _check(self, module: str):
+        times = import_times(module)
+        loaded = [name for name in times if any(name == _ or name.startswith(_ + ".") for _ in LAZY_MODULES)]
+        self.assertEqual(loaded, [], f"{module} imports heavy modules at startup")
+
+        budget_ms = float(os.getenv(f"IMPORT_BUDGET_MS_{module.replace('.', '_').upper()}", BUDGETS_MS[module]))
+        self.assertLess(times[module] / 1000, budget_ms, f"{module} took {times[module] / 1000:.0f}ms to import")
+
+    def test_api_import_budget(self):
+        self._check("api.main")
+
+    def test_worker_import_budget(self):
+        self._check("worker.run_worker")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import re
+import json
+import unittest
+
+from worker import json_repair, schemas
+from worker.shared import InvoiceData
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+FAST = SimulationConfig(latency_median_s=0.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+
+
+class TestLoads(unittest.TestCase):
+
+    def test_valid_json_is_untouched(self):
+        self.assertEqual(json_repair.loads('[{"index": 1, "A": "x"}]'), [{"index": 1, "A": "x"}])
+
+    def test_truncated_answer_keeps_the_complete_objects(self):
+        text = '[{"index": 1, "A": "x, {y}"}, {"index": 2, "A": ["a", "b]"]}, {"index": 3, "A": "cut'
+        self.assertEqual(json_repair.loads(text), [{"index": 1, "A": "x, {y}"}, {"index": 2, "A": ["a", "b]"]}])
+
+    def test_python_style_list_of_strings(self):
+        text = """```json
+[
+  '{"index": 1, "A": null, "B": "it\\'s"}',
+  "{'index': 2, 'A': None, 'B': 'z',}",
+]
+```"""
+        self.assertEqual(json_repair.loads(text), [{"index": 1, "A": None, "B": "it's"}, {"index": 2, "A": None, "B": "z"}])
+
+    def test_trailing_commas_and_prose(self):
+        text = 'Here you go:\n[{"index": 1, "A": true,}, {"index": 2, "A": "null"},]\nDone.'
+        self.assertEqual(json_repair.loads(text), [{"index": 1, "A": True}, {"index": 2, "A": "null"}])
+
+    def test_no_json_at_all(self):
+        with self.assertRaises(json.JSONDecodeError):
+            json_repair.loads("invalid json")
+
+    def test_decode_reports_the_lost_invoices(self):
+        text = '[{"index": 2, "A": "y"}, {"index": 1, "A": "x"}, {"index": 3, "A": "z'
+        self.assertEqual(schemas.decode(text, [["A"], ["A"], ["A"]]), ([{"A": "x"}, {"A": "y"}, None], {2: schemas.MISSING}))
+        # untagged, only the cut off end is known to be missing
+        text = '["{\\"A\\": \\"x\\"}", "{\\"A\\": '
+        self.assertEqual(schemas.decode(text, [["A"], ["A"]]), ([{"A": "x"}, None], {1: schemas.MISSING}))
+
+
+class TestTruncatedPipeline(unittest.TestCase):
+
+    def test_only_the_lost_invoices_are_asked_again(self):
+        contexts, outputs, fields = generate_corpus(6, seed=8)
+        for structured in (True, False):
+            llm = SimulatedGemini(SimulatedModel(FAST))
+            llm.structured = structured
+            llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf"))
+            llm.construct_prompt()
+            llm.call_model()
+            complete = llm.model_reponse
+            # cut inside the fifth answer, as at the output token limit
+            llm.model_reponse = complete[:[m.start() for m in re.finditer("index", complete)][4] + 20]
+
+            result = llm.parse_and_validate()
+            self.assertEqual(result["error"], "Failed in validation criteria from model response")
+            self.assertEqual([i for i, _ in result["details"]], [4, 5])
+
+            sizes = []
+            generate = llm._generate
+            llm._generate = lambda prompt, invoices=None: sizes.append(invoices) or generate(prompt, invoices)
+            self.assertEqual(llm.retry_model_call()["status"], "success")
+            self.assertEqual(sizes, [2])
+            self.assertTrue(all(llm.validated_response))
+
+    def test_lost_invoices_asking_a_subset_of_fields(self):
+        contexts, outputs, _ = generate_corpus(4, seed=8)
+        fields = [["INVOICE_NUMBER", "TOTAL_AMOUNT"]] * len(contexts)
+        llm = SimulatedGemini(SimulatedModel(FAST))
+        llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf"))
+        llm.construct_prompt()
+        llm.call_model()
+        llm.model_reponse = llm.model_reponse[:[m.start() for m in re.finditer("index", llm.model_reponse)][3] + 20]
+
+        self.assertEqual([i for i, _ in llm.parse_and_validate()["details"]], [3])
+        self.assertEqual(llm.retry_model_call()["status"], "success")
+        self.assertEqual(sorted(llm.validated_response[3]), fields[3])
+
+
+if __name__ == "__main__":
+    unittest.main()
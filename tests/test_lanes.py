@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+
+from worker.lanes import LaneLimiter, lane_slots
+from worker.shared import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+class TestLaneLimiter(unittest.TestCase):
+
+    def test_bulk_cannot_take_reserved_slots(self):
+        limiter = LaneLimiter(max_concurrency=4, interactive_reserved=0.25)
+
+        async def scenario():
+            release = asyncio.Event()
+            started = []
+
+            async def call(lane, name):
+                async with limiter.slot(lane):
+                    started.append(name)
+                    await release.wait()
+
+            tasks = [asyncio.create_task(call(PRIORITY_BULK, f"bulk-{i}")) for i in range(5)]
+            await asyncio.sleep(0.01)
+            # 3 bulk calls hold the unreserved slots, the 4th is left to the interactive lane
+            self.assertEqual(len(started), 3)
+            tasks.append(asyncio.create_task(call(PRIORITY_INTERACTIVE, "interactive")))
+            await asyncio.sleep(0.01)
+            self.assertEqual(started[-1], "interactive")
+            release.set()
+            await asyncio.gather(*tasks)
+            return started
+
+        started = asyncio.run(scenario())
+        self.assertEqual(len(started), 6)
+        self.assertEqual(limiter.active, 0)
+
+    def test_rate_budget_is_reserved(self):
+        limiter = LaneLimiter(requests_per_minute=4, interactive_reserved=0.5)
+
+        async def scenario():
+            for _ in range(2):
+                async with limiter.slot(PRIORITY_BULK):
+                    pass
+            # the bulk share of the minute is used up, interactive calls still go through
+            self.assertGreater(limiter._wait_time(PRIORITY_BULK), 0)
+            for _ in range(2):
+                async with limiter.slot(PRIORITY_INTERACTIVE):
+                    pass
+            self.assertGreater(limiter._wait_time(PRIORITY_INTERACTIVE), 0)
+
+        asyncio.run(scenario())
+
+    def test_unlimited_by_default(self):
+        limiter = LaneLimiter()
+        self.assertEqual(limiter._wait_time(PRIORITY_BULK), 0)
+
+    def test_lane_slots(self):
+        self.assertEqual(lane_slots(100, 0.25), {PRIORITY_INTERACTIVE: 25, PRIORITY_BULK: 75})
+        self.assertEqual(lane_slots(4, 0.01), {PRIORITY_INTERACTIVE: 1, PRIORITY_BULK: 3})
+        self.assertEqual(lane_slots(4, 1.0), {PRIORITY_INTERACTIVE: 3, PRIORITY_BULK: 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import dataclasses
+import argparse
+import tempfile
+import unittest
+
+from google.api_core import exceptions
+from temporalio.common import RetryPolicy
+from temporalio.testing import ActivityEnvironment
+
+from worker import load_test
+from worker.activities import LLMActivities, Sessions
+from worker.shared import InvoiceData
+from worker.synthetic import generate_corpus
+from worker.prompts import get_batched_prompt_with_fields
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+
+FAST = SimulationConfig(latency_median_s=0.001, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+
+
+class TestSimulatedModel(unittest.TestCase):
+
+    def test_answers_every_invoice_in_prompt(self):
+        contexts, outputs, fields = generate_corpus(3, seed=2)
+        response = SimulatedModel(FAST).generate_content(get_batched_prompt_with_fields(contexts, fields))
+        self.assertIn(outputs[2]["INVOICE_NUMBER"], response.text)
+        self.assertGreater(response.usage_metadata.prompt_token_count, 0)
+
+    def test_rate_limit_injection(self):
+        model = SimulatedModel(SimulationConfig(rate_limit_rate=1.0))
+        with self.assertRaises(exceptions.ResourceExhausted):
+            model.generate_content("prompt")
+
+    def test_pipeline_validates_synthetic_invoices(self):
+        contexts, outputs, fields = generate_corpus(4, seed=5)
+        llm = SimulatedGemini(SimulatedModel(FAST))
+        llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="sim"))
+        llm.construct_prompt()
+        self.assertEqual(llm.call_model()["status"], "success")
+        self.assertEqual(llm.parse_and_validate()["status"], "success")
+        self.assertEqual(llm.finalize()["evalution_result "]["overall_metrics"]["normalized_match_accuracy"], 1.0)
+
+
+class TestLLMActivitiesSessions(unittest.TestCase):
+
+    def test_workflows_do_not_share_pipeline_state(self):
+        model = SimulatedModel(FAST)
+        activities = LLMActivities(llm_factory=lambda: SimulatedGemini(model))
+        env = ActivityEnvironment()
+        first = InvoiceData(context_input=["a"], output=[], fields_to_extract=[["A"]], workflow_id="wf-1")
+        second = InvoiceData(context_input=["b", "c"], output=[], fields_to_extract=[["A"], ["A"]], workflow_id="wf-2")
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            # activities log to ./runs/<workflow_id>
+            os.chdir(tmp)
+            try:
+                asyncio.run(env.run(activities.load_input, first))
+                asyncio.run(env.run(activities.load_input, second))
+            finally:
+                os.chdir(cwd)
+
+        self.assertEqual(activities.sessions["wf-1"].inovices, ["a"])
+        self.assertEqual(activities.sessions["wf-2"].inovices, ["b", "c"])
+
+    def test_terminal_failure_drops_the_pipeline(self):
+        activities = LLMActivities(llm_factory=lambda: SimulatedGemini(SimulatedModel(FAST)))
+        data = InvoiceData(context_input=["a"], output=[], fields_to_extract=[["A"]], workflow_id="wf-1")
+
+        def construct_prompt():
+            raise RuntimeError("boom")
+
+        env = ActivityEnvironment()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                asyncio.run(env.run(activities.load_input, data))
+                activities.sessions[data.workflow_id].construct_prompt = construct_prompt
+                for attempt in (1, 2):
+                    env.info = dataclasses.replace(env.info, attempt=attempt, retry_policy=RetryPolicy(maximum_attempts=2))
+                    with self.assertRaises(RuntimeError):
+                        asyncio.run(env.run(activities.construct_prompt, data))
+                    # a retried attempt still needs the pipeline, the last one does not
+                    self.assertEqual(data.workflow_id in activities.sessions, attempt == 1)
+            finally:
+                os.chdir(cwd)
+
+    def test_sessions_are_bounded(self):
+        sessions = Sessions(max_sessions=2, ttl_s=60)
+        pipelines = [SimulatedGemini(SimulatedModel(FAST)) for _ in range(4)]
+        sessions["wf-1"], sessions["wf-2"] = pipelines[:2]
+        sessions.touch("wf-1")
+        sessions["wf-3"] = pipelines[2]
+        # the least recently used one goes
+        self.assertEqual(list(sessions), ["wf-1", "wf-3"])
+        self.assertTrue(pipelines[1].cancelled.is_set())
+
+        sessions.last_used["wf-1"] = time.monotonic() - 61
+        sessions["wf-4"] = pipelines[3]
+        self.assertEqual(list(sessions), ["wf-3", "wf-4"])
+        self.assertEqual(set(sessions.last_used), {"wf-3", "wf-4"})
+
+
+class TestLoadTestReport(unittest.TestCase):
+
+    def test_percentile(self):
+        values = [float(_) for _ in range(1, 101)]
+        self.assertAlmostEqual(load_test.percentile(values, 50), 50.5)
+        self.assertAlmostEqual(load_test.percentile(values, 99), 99.01)
+        self.assertEqual(load_test.percentile([], 95), 0.0)
+
+    def test_end_to_end_with_local_server(self):
+        args = argparse.Namespace(
+            corpus=None, workflows=4, concurrency=2, batch_size=2, seed=0,
+            latency_median=0.01, latency_sigma=0.0, tokens_per_second=1e6,
+            rate_limit_rate=0.0, error_rate=0.0, max_concurrent_activities=10, temporal_cli=None,
+        )
+        try:
+            report = asyncio.run(load_test.run_load_test(args))
+        except RuntimeError as e:
+            self.skipTest(f"Temporal dev server unavailable: {e}")
+        self.assertEqual(report["outcomes"]["success"], 4)
+        self.assertIn("call_model", report["activities"])
+
+
+if __name__ == "__main__":
+    unittest.main()
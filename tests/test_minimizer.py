@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from worker import minimizer
+from worker.batching import BatchController
+from worker.shared import InvoiceData
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus, FIELD_LABELS
+
+FAST = SimulationConfig(latency_median_s=0.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+FOOTER = "Notes: Thank you for your business!\nPayment is due 30 days from the invoice date."
+
+
+class TestMinimizeBatch(unittest.TestCase):
+
+    def test_shared_blocks_are_sent_once(self):
+        contexts = [f"Invoice No: #{i}\n-----\nTotal Due: ${i}\nTotal Due: ${i}\nPage 1 of 2\n{FOOTER}" for i in range(3)]
+        batch = minimizer.minimize_batch(contexts)
+        self.assertEqual(batch.blocks, [FOOTER.lower()])
+        self.assertEqual(batch.contexts[1], "invoice no: #1\ntotal due: $1\ntotal due: $1\n[[B1]]")
+        # separator and page number are dropped
+        self.assertEqual(batch.lines_removed, 6)
+
+    def test_short_or_unique_lines_stay_inline(self):
+        batch = minimizer.minimize_batch(["INVOICE\nBill to: Avery", "INVOICE\nBill to: Helena", f"Other\n{FOOTER}"])
+        self.assertEqual(batch.blocks, [])
+        self.assertEqual(batch.contexts[0], "invoice\nbill to: avery")
+
+    def test_repeated_values_of_an_invoice_are_kept(self):
+        contexts = ["QTY\n\n100\n\n100\n\n100\nAMOUNT\n$5\n$5", "QTY\n2\nAMOUNT\n$7"]
+        batch = minimizer.minimize_batch(contexts)
+        self.assertEqual(batch.contexts[0], "qty\n100\n100\n100\namount\n$5\n$5")
+        self.assertEqual(batch.lines_removed, 0)
+
+
+class TestMinimizedPipeline(unittest.TestCase):
+
+    def setUp(self):
+        # batch size decisions are logged to ./runs/<workflow_id>
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_minimized_prompt_extracts_the_same_values(self):
+        contexts, outputs, fields = generate_corpus(8, seed=4)
+        results = {}
+        for minimize in (False, True):
+            llm = SimulatedGemini(SimulatedModel(FAST))
+            llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf", minimize=minimize))
+            llm.construct_prompt()
+            llm.call_model()
+            self.assertEqual(llm.parse_and_validate()["status"], "success")
+            results[minimize] = llm.finalize()
+
+        self.assertEqual(results[True]["predictions"], results[False]["predictions"])
+        report = results[True]["minimization"]
+        self.assertGreater(report["token_reduction"], 0.05)
+        self.assertGreaterEqual(report["shared_blocks"], 1)
+        self.assertNotIn("minimization", results[False])
+
+    def test_split_batches_stay_minimized(self):
+        contexts, outputs, fields = generate_corpus(8, seed=4)
+        llm = SimulatedGemini(SimulatedModel(FAST))
+        llm.batcher = BatchController([4])
+        llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf", minimize=True))
+        llm.construct_prompt()
+        prompts = []
+        generate = llm._generate
+        llm._generate = lambda prompt, invoices=None: prompts.append(prompt) or generate(prompt, invoices)
+        llm.call_model()
+
+        self.assertEqual(len(prompts), 2)
+        for prompt, ids in zip(prompts, ([0, 1, 2, 3], [4, 5, 6, 7])):
+            # each chunk sends the footers its invoices share once
+            self.assertIn("<SHARED_B1>", prompt)
+            self.assertLess(len(prompt), len(llm._prompt([llm.inovices[_] for _ in ids], [llm.model_fields[_] for _ in ids])))
+        self.assertEqual(llm.parse_and_validate()["status"], "success")
+
+
+class TestAccuracyGuard(unittest.TestCase):
+
+    def setUp(self):
+        contexts, outputs, _ = generate_corpus(40, seed=2)
+        self.rows = list(zip(contexts, outputs))
+        model = SimulatedModel(FAST)
+        self.factory = lambda: SimulatedGemini(model)
+
+    def test_guard_passes(self):
+        from benchmarks import minimizer_guard
+        report = minimizer_guard.guard(self.rows, self.factory, batch_size=10)
+        self.assertTrue(report["passed"])
+        self.assertGreater(report["token_reduction"], 0)
+
+    def test_guard_catches_a_lossy_minimizer(self):
+        from benchmarks import minimizer_guard
+        lossy = minimizer.minimize_batch
+
+        def drop_bank(contexts, **kwargs):
+            return lossy([_.replace(f"{FIELD_LABELS['BANK_NAME']}:", "") for _ in contexts], **kwargs)
+
+        with patch("worker.minimizer.minimize_batch", drop_bank):
+            report = minimizer_guard.guard(self.rows, self.factory, batch_size=10)
+        self.assertFalse(report["passed"])
+        self.assertLess(report["metrics"]["f1_score"]["change"], -0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import json
+import tempfile
+import threading
+import unittest
+import tracemalloc
+
+from concurrent.futures import ThreadPoolExecutor
+
+from worker import profiling
+
+
+def _busy(n):
+    return [str(i) * 4 for i in range(n)]
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.runs_dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_disabled_runs_without_artifacts(self):
+        output_dir = os.path.join(self.runs_dir, "workflow-off")
+        result = profiling.run_profiled(_busy, 10, enabled=False, output_dir=output_dir, name="finalize")
+        self.assertEqual(len(result), 10)
+        self.assertFalse(os.path.exists(output_dir))
+
+    def test_enabled_saves_profile_and_allocations(self):
+        output_dir = os.path.join(self.runs_dir, "workflow-on")
+        result = profiling.run_profiled(_busy, 1000, enabled=True, output_dir=output_dir, name="finalize")
+        self.assertEqual(len(result), 1000)
+
+        profile_dir = os.path.join(output_dir, "profile")
+        self.assertTrue(os.path.exists(os.path.join(profile_dir, "finalize.prof")))
+        with open(os.path.join(profile_dir, "finalize_memory.json")) as f:
+            memory = json.load(f)
+        self.assertGreater(memory["peak_bytes"], 0)
+        self.assertTrue(memory["top_allocations"])
+
+    def test_enabled_saves_profile_on_exception(self):
+        output_dir = os.path.join(self.runs_dir, "workflow-err")
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            profiling.run_profiled(fail, enabled=True, output_dir=output_dir, name="parse_and_validate")
+        self.assertTrue(os.path.exists(os.path.join(output_dir, "profile", "parse_and_validate.prof")))
+
+    def test_concurrent_runs_do_not_fail(self):
+        started, release = threading.Event(), threading.Event()
+
+        def blocked():
+            started.set()
+            release.wait(5)
+            return "first"
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(profiling.run_profiled, blocked, enabled=True, output_dir=os.path.join(self.runs_dir, "wf-1"), name="finalize")
+            started.wait(5)
+            # the overlapping run is not profiled and still returns its result
+            second = profiling.run_profiled(_busy, 10, enabled=True, output_dir=os.path.join(self.runs_dir, "wf-2"), name="finalize")
+            release.set()
+            self.assertEqual(first.result(), "first")
+        self.assertEqual(len(second), 10)
+        self.assertTrue(os.path.exists(os.path.join(self.runs_dir, "wf-1", "profile", "finalize.prof")))
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_aggregate_profiles_across_runs(self):
+        for i in range(3):
+            output_dir = os.path.join(self.runs_dir, f"workflow-{i}")
+            profiling.run_profiled(_busy, 500, enabled=True, output_dir=output_dir, name="finalize")
+
+        rows = profiling.aggregate_profiles(self.runs_dir, activity="finalize", top=5)
+        self.assertLessEqual(len(rows), 5)
+        busy = [row for row in rows if "(_busy)" in row["function"]]
+        self.assertEqual(busy[0]["total_calls"], 3)
+
+    def test_aggregate_profiles_empty(self):
+        self.assertEqual(profiling.aggregate_profiles(self.runs_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from worker.llms import gemini
+from worker.providers import LiteLLMProvider, ModelRoute, ModelRouter, ProviderAPIError, router_from_config
+from worker.shared import InvoiceData
+from worker.simulated_llm import SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+FAST = SimulationConfig(latency_median_s=0.001, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+
+
+def route(name, cost, prior=5.0, max_input_tokens=1_000_000, config=FAST):
+    return ModelRoute(name, lambda: SimulatedModel(config), cost_per_1k_input=cost, cost_per_1k_output=cost,
+                      max_input_tokens=max_input_tokens, prior_seconds_per_1k_tokens=prior)
+
+
+class TestModelRouter(unittest.TestCase):
+
+    def test_cheapest_route_on_target(self):
+        router = ModelRouter([route("pro", 1.0, prior=2.0), route("flash", 0.1, prior=4.0)], latency_target_s=10)
+        self.assertEqual(router.select(prompt_tokens=1000, batch_size=5).name, "flash")
+        # 20k tokens at 4s per 1k miss the target, the faster route is picked despite its cost
+        self.assertEqual(router.select(prompt_tokens=20_000, batch_size=5).name, "pro")
+
+    def test_observed_latency_replaces_the_prior(self):
+        pro, flash = route("pro", 1.0, prior=2.0), route("flash", 0.1, prior=1.0)
+        router = ModelRouter([pro, flash], latency_target_s=10)
+        self.assertEqual(router.select(2000, 1).name, "flash")
+        for _ in range(10):
+            router.record(flash, latency_s=30.0, tokens=2000, ok=True)
+        self.assertEqual(router.select(2000, 1).name, "pro")
+
+    def test_unhealthy_and_too_small_routes_are_skipped(self):
+        pro, flash, small = route("pro", 1.0), route("flash", 0.1), route("small", 0.01, max_input_tokens=500)
+        router = ModelRouter([pro, flash, small], max_error_rate=0.2)
+        for ok in (False, False, True):
+            router.record(flash, latency_s=1.0, tokens=1000, ok=ok)
+        self.assertEqual(router.select(1000, 1).name, "pro")
+
+    def test_config(self):
+        router = router_from_config({
+            "latency_target_s": 30,
+            "routes": [
+                {"name": "sim", "provider": "simulated", "options": {"latency_median_s": 0.001}, "cost_per_1k_input": 0.1},
+                {"provider": "litellm", "model": "openai/gpt-4o-mini"},
+            ],
+        })
+        self.assertEqual([_.name for _ in router.routes], ["sim", "openai/gpt-4o-mini"])
+        self.assertIsInstance(router.routes[0].get_provider(), SimulatedModel)
+        with self.assertRaises(ValueError):
+            router_from_config({"routes": [{"provider": "unknown", "model": "x"}]})
+
+
+class TestPipelineWithRouter(unittest.TestCase):
+
+    def setUp(self):
+        contexts, outputs, fields = generate_corpus(3, seed=8)
+        self.data = InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf")
+
+    def _run(self, router):
+        llm = gemini(router=router)
+        llm.load_input(self.data)
+        llm.construct_prompt()
+        return llm, llm.call_model()
+
+    def test_call_goes_to_the_routed_model(self):
+        flash = route("flash", 0.1)
+        router = ModelRouter([flash])
+        llm, result = self._run(router)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(llm.parse_and_validate()["status"], "success")
+        self.assertEqual(llm.metadata["model"], "flash")
+        self.assertGreater(llm.metadata["cost_usd"], 0)
+        self.assertEqual(len(router.stats["flash"].calls), 1)
+
+    def test_failures_steer_the_router_away(self):
+        failing = route("flaky", 0.01, config=SimulationConfig(rate_limit_rate=1.0))
+        router = ModelRouter([failing, route("pro", 1.0)], max_error_rate=0.5)
+        llm, result = self._run(router)
+        self.assertEqual(result["error"], "API call failed")
+        self.assertEqual(router.stats["flaky"].error_rate(), 1.0)
+        self.assertEqual(self._run(router)[0].metadata["model"], "pro")
+
+
+class TestLiteLLMProvider(unittest.TestCase):
+
+    def test_response_is_converted(self):
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content='["{}"]'))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=3, total_tokens=13),
+        )
+        calls = []
+        fake = SimpleNamespace(completion=lambda **kwargs: calls.append(kwargs) or response)
+        with patch("worker.providers.litellm", fake):
+            result = LiteLLMProvider("openai/gpt-4o-mini").generate_content("prompt", request_options={"timeout": 5})
+        self.assertEqual(result.text, '["{}"]')
+        self.assertEqual(result.usage_metadata.total_token_count, 13)
+        self.assertEqual(calls[0]["timeout"], 5)
+
+    def test_errors_become_provider_errors(self):
+        def completion(**kwargs):
+            raise RuntimeError("429 rate limited")
+
+        with patch("worker.providers.litellm", SimpleNamespace(completion=completion)):
+            with self.assertRaises(ProviderAPIError):
+                LiteLLMProvider("openai/gpt-4o-mini").generate_content("prompt")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import MagicMock
+
+from worker import prompts, rules, utils
+from worker.shared import InvoiceData
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+FAST = SimulationConfig(latency_median_s=0.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+INVOICE = utils.normalize_text(
+    "INVOICE\nInvoice No: #61234\nDate: 12 March 2024\nDue Date: 12 April 2024\nBilled To: Avery Davis\n"
+    "Subtotal: $900.00\nTotal Due: $1,000.00\nAccount No.: 123-456-7890\nhello@reallygreatsite.com"
+)
+
+
+class TestRules(unittest.TestCase):
+
+    def test_label_anchored_fields(self):
+        found = rules.pre_extract(INVOICE, ["INVOICE_NUMBER", "DATE_OF_ISSUE", "TOTAL_AMOUNT", "ACCOUNT_NUMBER", "EMAIL", "BILLED_TO"])
+        self.assertEqual(found, {
+            "INVOICE_NUMBER": "#61234",
+            "DATE_OF_ISSUE": "12 march 2024",
+            "TOTAL_AMOUNT": "$1,000.00",
+            "ACCOUNT_NUMBER": "123-456-7890",
+            "EMAIL": "hello@reallygreatsite.com",
+        })
+
+    def test_ambiguous_values_are_left_to_the_model(self):
+        context = INVOICE + " contact: billing@borcelle.com total amount: $1,100.00"
+        found = rules.pre_extract(context, ["EMAIL", "TOTAL_AMOUNT", "INVOICE_NUMBER"])
+        self.assertEqual(found, {"INVOICE_NUMBER": "#61234"})
+
+    def test_amount_due_is_not_the_total(self):
+        # the few shot invoice: "TOTAL $1000 ... Amount due $550", the total is $1000
+        found = rules.pre_extract(utils.normalize_text(prompts.few_shot()), ["TOTAL_AMOUNT", "INVOICE_NUMBER"])
+        self.assertEqual(found, {"INVOICE_NUMBER": "#612345"})
+        self.assertIsNone(rules.extract_field("subtotal: $900 balance due: $400", "TOTAL_AMOUNT"))
+        # a plain total next to a labeled one is ambiguous
+        self.assertIsNone(rules.extract_field("total: $900 total amount: $1,000", "TOTAL_AMOUNT"))
+        self.assertEqual(rules.extract_field("total: $1,000 total amount: $1,000", "TOTAL_AMOUNT"), "$1,000")
+
+    def test_values_pass_validation(self):
+        contexts, outputs, fields = generate_corpus(50, seed=3)
+        for context, output, required in zip(contexts, outputs, fields):
+            found = rules.pre_extract(utils.normalize_text(context), required)
+            self.assertEqual(utils.validate_extracted_data(found, context, list(found)), [])
+            for field, value in found.items():
+                self.assertEqual(value, utils.normalize_text(output[field]))
+
+
+class TestPreExtractedPipeline(unittest.TestCase):
+
+    def run_pipeline(self, contexts, outputs, fields, pre_extract):
+        llm = SimulatedGemini(SimulatedModel(FAST))
+        llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf", pre_extract=pre_extract))
+        llm.construct_prompt()
+        self.assertEqual(llm.call_model()["status"], "success")
+        self.assertEqual(llm.parse_and_validate()["status"], "success")
+        return llm, llm.finalize()
+
+    def test_model_only_gets_the_remaining_fields(self):
+        contexts, outputs, fields = generate_corpus(8, seed=4)
+        _, baseline = self.run_pipeline(contexts, outputs, fields, False)
+        llm, result = self.run_pipeline(contexts, outputs, fields, True)
+
+        self.assertEqual(result["predictions"], baseline["predictions"])
+        self.assertNotIn("pre_extraction", baseline)
+        report = result["pre_extraction"]
+        self.assertGreater(report["fields_avoided"], 0)
+        self.assertEqual(report["calls_avoided"], 0)
+        self.assertTrue(all(field not in llm.local_values[i] for i in llm.sent for field in llm.model_fields[i]))
+        self.assertNotIn("Required fields:\n [INVOICE_NUMBER", llm.prompt)
+
+    def test_fully_resolved_batch_skips_the_model(self):
+        outputs = [{"INVOICE_NUMBER": "#61234", "EMAIL": "hello@reallygreatsite.com"}]
+        llm = SimulatedGemini(SimulatedModel(FAST))
+        llm.load_input(InvoiceData(context_input=[INVOICE], output=outputs, fields_to_extract=[list(outputs[0])], workflow_id="wf", pre_extract=True))
+        llm.construct_prompt()
+        llm._create_model = MagicMock()
+
+        self.assertEqual(llm.call_model()["status"], "success")
+        llm._create_model.assert_not_called()
+        self.assertEqual(llm.parse_and_validate()["status"], "success")
+        result = llm.finalize()
+        self.assertEqual(result["predictions"], outputs)
+        self.assertEqual(result["pre_extraction"], {"fields": 2, "fields_avoided": 2, "invoices_skipped": 1, "calls_avoided": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from worker import schemas
+from worker.llms import merge_responses
+from worker.providers import GeminiProvider, LiteLLMProvider
+from worker.shared import InvoiceData
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+FAST = SimulationConfig(latency_median_s=0.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+
+
+def usage(tokens):
+    return SimpleNamespace(prompt_token_count=tokens, candidates_token_count=tokens, total_token_count=2 * tokens)
+
+
+class TestResponseSchema(unittest.TestCase):
+
+    def test_schema_from_required_fields(self):
+        schema = schemas.response_schema([["TOTAL_AMOUNT", "QTY"], ["TOTAL_AMOUNT", "BANK_NAME"]])
+        properties = schema["items"]["properties"]
+        self.assertEqual(schema["type"], "array")
+        self.assertEqual(list(properties), ["index", "BANK_NAME", "QTY", "TOTAL_AMOUNT"])
+        self.assertEqual(properties["TOTAL_AMOUNT"], {"type": "string", "nullable": True})
+        self.assertEqual(properties["QTY"]["type"], "array")
+        self.assertEqual(schema["items"]["required"], ["index"])
+
+    def test_json_schema_conversion(self):
+        converted = schemas.to_json_schema(schemas.response_schema([["QTY", "BANK_NAME"]]))
+        properties = converted["items"]["properties"]
+        self.assertEqual(properties["BANK_NAME"], {"type": ["string", "null"]})
+        self.assertEqual(properties["QTY"]["type"], ["array", "null"])
+        self.assertFalse(converted["items"]["additionalProperties"])
+        # strict mode wants every property listed
+        self.assertEqual(converted["items"]["required"], ["index", "BANK_NAME", "QTY"])
+
+    def test_decode_orders_by_index(self):
+        text = json.dumps([
+            {"index": 2, "TOTAL": "$5", "QTY": ["1", "2"], "BANK_NAME": None},
+            {"index": 1, "TOTAL": "$3", "QTY": ["4"], "BANK_NAME": "Fauget Bank"},
+        ])
+        self.assertEqual(schemas.decode(text, [["TOTAL", "QTY"], ["TOTAL", "QTY", "BANK_NAME"]]), ([
+            {"TOTAL": "$3", "QTY": "4"},
+            {"TOTAL": "$5", "QTY": ["1", "2"], "BANK_NAME": None},
+        ], {}))
+
+    def test_unconstrained_answers_still_decode(self):
+        text = json.dumps([json.dumps({"TOTAL": "$3"})])
+        self.assertEqual(schemas.decode(text, [["TOTAL"]]), ([{"TOTAL": "$3"}], {}))
+        self.assertEqual(schemas.decode('[{"TOTAL": "$3"}]', [["TOTAL"]]), ([{"TOTAL": "$3"}], {}))
+
+    def test_answers_are_aligned_by_index(self):
+        fields = [["TOTAL"], ["TOTAL"], ["TOTAL"], ["TOTAL"]]
+        text = json.dumps([
+            json.dumps({"index": 4, "TOTAL": "$4"}),
+            json.dumps({"index": 1, "TOTAL": "$1"}),
+            json.dumps({"index": 3, "TOTAL": "$3"}),
+            json.dumps({"index": 3, "TOTAL": "$9"}),
+            json.dumps({"index": 1, "TOTAL": "$1"}),
+            json.dumps({"index": 7, "TOTAL": "$7"}),
+        ])
+        predictions, unaligned = schemas.decode(text, fields)
+        self.assertEqual(predictions, [{"TOTAL": "$1"}, None, None, {"TOTAL": "$4"}])
+        self.assertEqual(unaligned, {1: schemas.MISSING, 2: schemas.DUPLICATED})
+
+    def test_split_responses_keep_their_index(self):
+        first = SimpleNamespace(text=json.dumps([{"index": 1, "A": "x"}, {"index": 2, "A": "y"}]), usage_metadata=usage(1))
+        second = SimpleNamespace(text=json.dumps([{"index": 1, "A": "z"}]), usage_metadata=usage(2))
+        merged = merge_responses([first, second], [2, 1])
+        self.assertEqual([_["index"] for _ in json.loads(merged.text)], [1, 2, 3])
+        self.assertEqual(merged.usage_metadata.total_token_count, 6)
+
+    def test_undecodable_split_response_is_missing(self):
+        first = SimpleNamespace(text="the model refused", usage_metadata=usage(1))
+        second = SimpleNamespace(text=json.dumps([json.dumps({"A": "z"})]), usage_metadata=usage(2))
+        merged = merge_responses([first, second], [2, 1])
+        predictions, unaligned = schemas.decode(merged.text, [["A"], ["A"], ["A"]])
+        self.assertEqual(predictions, [None, None, {"A": "z"}])
+        self.assertEqual(unaligned, {0: schemas.MISSING, 1: schemas.MISSING})
+
+
+class TestStructuredPipeline(unittest.TestCase):
+
+    def test_structured_answer_is_smaller_and_the_same(self):
+        contexts, outputs, fields = generate_corpus(10, seed=6)
+        results = {}
+        for structured in (False, True):
+            llm = SimulatedGemini(SimulatedModel(FAST))
+            llm.structured = structured
+            llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf"))
+            llm.construct_prompt()
+            llm.call_model()
+            self.assertEqual(llm.parse_and_validate()["status"], "success")
+            results[structured] = (llm.validated_response, llm.metadata["candidates_token_count"])
+
+        self.assertEqual(results[True][0], results[False][0])
+        self.assertLess(results[True][1], results[False][1])
+        # a single parse, no JSON strings inside the array
+        self.assertIsInstance(json.loads(llm.model_reponse)[0], dict)
+
+    def test_dropped_invoice_is_asked_again_alone(self):
+        contexts, outputs, fields = generate_corpus(10, seed=6)
+        llm = SimulatedGemini(SimulatedModel(FAST))
+        llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf"))
+        llm.construct_prompt()
+        llm.call_model()
+        answers = json.loads(llm.model_reponse)
+        llm.model_reponse = json.dumps(answers[:3] + answers[4:])
+
+        result = llm.parse_and_validate()
+        self.assertEqual(result["details"], [(3, [schemas.MISSING])])
+        self.assertEqual(llm.validated_response[4], {k: v for k, v in answers[4].items() if k != "index"})
+
+        prompts = []
+        generate = llm._generate
+        llm._generate = lambda prompt, invoices=None: prompts.append(invoices) or generate(prompt, invoices)
+        self.assertEqual(llm.retry_model_call()["status"], "success")
+        self.assertEqual(prompts, [1])
+        self.assertEqual(llm.validated_response[3], {k: v for k, v in answers[3].items() if k != "index"})
+
+    @patch.dict("os.environ", {"GOOGLE_API_KEY": "test_key"})
+    @patch("worker.providers.genai.GenerativeModel")
+    def test_gemini_gets_the_schema(self, model_class):
+        model = MagicMock()
+        model_class.return_value = model
+        schema = schemas.response_schema([["TOTAL"]])
+        GeminiProvider("gemini-2.5-flash").generate_content("prompt", response_schema=schema)
+        config = model.generate_content.call_args.kwargs["generation_config"]
+        self.assertEqual(config, {"response_mime_type": "application/json", "response_schema": schema})
+
+    def test_litellm_wraps_the_array(self):
+        calls = []
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content='{"invoices": [{"index": 1, "TOTAL": "$3"}]}'))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=3, total_tokens=13),
+        )
+        fake = SimpleNamespace(completion=lambda **kwargs: calls.append(kwargs) or response)
+        with patch("worker.providers.litellm", fake):
+            result = LiteLLMProvider("openai/gpt-4o-mini").generate_content("prompt", response_schema=schemas.response_schema([["TOTAL"]]))
+        self.assertEqual(json.loads(result.text), [{"index": 1, "TOTAL": "$3"}])
+        self.assertEqual(calls[0]["response_format"]["type"], "json_schema")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from worker.batching import BatchController
+from worker.llms import gemini
+from worker.providers import ModelRoute, ModelRouter
+from worker.shared import InvoiceData
+from worker.simulated_llm import SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+from worker.tokens import TokenBudget, TokenBudgetExceeded, TokenEstimator
+
+FAST = SimulationConfig(latency_median_s=0.001, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+
+
+class CountingModel(SimulatedModel):
+
+    def __init__(self):
+        super().__init__(FAST)
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return super().generate_content(prompt, **kwargs)
+
+
+class TestTokenEstimator(unittest.TestCase):
+
+    def test_local_estimate_calibrates_on_actual_usage(self):
+        estimator = TokenEstimator(use_provider=False)
+        prompt = "x" * 4000
+        self.assertEqual(estimator.estimate(prompt), (1000, "local"))
+        for _ in range(5):
+            estimator.record(prompt, 1000, "local", actual=1250)
+        self.assertEqual(estimator.local(prompt), 1250)
+        self.assertAlmostEqual(estimator.stats()["local"]["mean_abs_error"], 0.2)
+        self.assertAlmostEqual(estimator.stats()["local"]["bias"], -0.2)
+
+    def test_provider_count_with_local_fallback(self):
+        estimator = TokenEstimator()
+        self.assertEqual(estimator.estimate("prompt", SimpleNamespace(count_tokens=lambda _: 42)), (42, "provider"))
+
+        def broken(_):
+            raise RuntimeError("count failed")
+
+        self.assertEqual(estimator.estimate("x" * 40, SimpleNamespace(count_tokens=broken)), (10, "local"))
+        self.assertEqual(TokenEstimator(use_provider=False).estimate("x" * 40, SimpleNamespace(count_tokens=lambda _: 42))[1], "local")
+
+
+class TestTokenBudget(unittest.TestCase):
+
+    def test_workflow_and_tenant_limits(self):
+        budget = TokenBudget(per_workflow=1000, per_tenant=1500)
+        with self.assertRaises(TokenBudgetExceeded):
+            budget.reserve(600, workflow_used=500)
+
+        budget.reserve(800, tenant="acme")
+        budget.settle(800, 700, tenant="acme")
+        self.assertEqual(budget.stats(), {"acme": 700})
+        with self.assertRaises(TokenBudgetExceeded):
+            budget.reserve(900, tenant="acme")
+        # other tenants and calls without a tenant are not affected
+        budget.reserve(900, tenant="other")
+        budget.reserve(900)
+
+    def test_tenant_window_resets(self):
+        budget = TokenBudget(per_tenant=100, window_s=0)
+        budget.reserve(100, tenant="acme")
+        budget.reserve(100, tenant="acme")
+
+
+class TestPipelineBudgets(unittest.TestCase):
+
+    def setUp(self):
+        # batch size decisions are logged to ./runs/<workflow_id>
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        contexts, outputs, fields = generate_corpus(6, seed=8)
+        self.data = InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf", tenant="acme")
+        self.model = CountingModel()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def _run(self, budget):
+        llm = gemini(router=ModelRouter([ModelRoute("sim", lambda: self.model)]), budget=budget)
+        llm.load_input(self.data)
+        llm.construct_prompt()
+        return llm, llm.call_model()
+
+    def test_oversized_batch_is_split(self):
+        llm, _ = self._run(TokenBudget())
+        full = llm.tokens.local(llm.prompt)
+
+        self.model.prompts.clear()
+        llm, result = self._run(TokenBudget(per_call=full - 100))
+        self.assertEqual(result["status"], "success")
+        self.assertGreater(len(self.model.prompts), 1)
+        self.assertEqual(llm.metadata["requests"], len(self.model.prompts))
+        self.assertEqual(llm.parse_and_validate()["status"], "success")
+        self.assertEqual(len(llm.validated_response), 6)
+
+    def test_refused_before_any_request(self):
+        llm, result = self._run(TokenBudget(per_call=500))
+        self.assertEqual(result["error"], "Batch too large")
+
+        llm, result = self._run(TokenBudget(per_workflow=100))
+        self.assertEqual(result["error"], "Token budget exceeded")
+
+        budget = TokenBudget(per_tenant=10_000_000)
+        budget.reserve(10_000_000, tenant="acme")
+        llm, result = self._run(budget)
+        self.assertEqual(result["error"], "Token budget exceeded")
+        self.assertEqual(self.model.prompts, [])
+
+    def test_parallel_requests_reserve_the_workflow_budget(self):
+        self.model.config = SimulationConfig(latency_median_s=0.2, latency_sigma=0.0, tokens_per_second=1e9, seed=0)
+        llm = gemini(router=ModelRouter([ModelRoute("sim", lambda: self.model)]), batcher=BatchController([2]))
+        llm.load_input(self.data)
+        llm.construct_prompt()
+        chunk = max(llm.tokens.local(llm._chunk_prompt(llm.sent[k:k + 2])) for k in range(0, 6, 2)) + llm.tokens.output(2)
+        # room for one chunk in flight, the other two are refused although nothing was used yet
+        llm.budget = TokenBudget(per_workflow=chunk + chunk // 2)
+        self.assertEqual(llm.call_model()["error"], "Token budget exceeded")
+        self.assertEqual(len(self.model.prompts), 1)
+        self.assertEqual(llm.tokens_reserved, 0)
+
+    def test_estimate_is_reported(self):
+        llm, result = self._run(TokenBudget(per_tenant=10_000_000))
+        self.assertEqual(llm.metadata["token_estimate_source"], "local")
+        self.assertIsNotNone(llm.metadata["token_estimate_error"])
+        self.assertEqual(llm.budget.stats()["acme"], llm.metadata["total_token_count"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+from enum import Enum
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from worker.lanes import LaneLimiter, ThreadSlots
+from worker.providers import finish_reason, truncated
+from worker.shared import PRIORITY_BULK, InvoiceData
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+from worker.synthetic import generate_corpus
+
+
+class FinishReason(Enum):
+    STOP = 1
+    MAX_TOKENS = 2
+
+
+def prepared(contexts, outputs, fields, structured=True, **config):
+    llm = SimulatedGemini(SimulatedModel(SimulationConfig(latency_median_s=0.0, latency_sigma=0.0, tokens_per_second=1e9, seed=0, **config)))
+    llm.structured = structured
+    llm.load_input(InvoiceData(context_input=contexts, output=outputs, fields_to_extract=fields, workflow_id="wf"))
+    llm.construct_prompt()
+    return llm
+
+
+def run(contexts, outputs, fields, structured=True, **config):
+    llm = prepared(contexts, outputs, fields, structured, **config)
+    confirmation = llm.call_model()
+    return llm, confirmation
+
+
+class TestFinishReason(unittest.TestCase):
+
+    def test_reasons_of_every_provider(self):
+        gemini = SimpleNamespace(candidates=[SimpleNamespace(finish_reason=FinishReason.MAX_TOKENS)])
+        self.assertEqual(finish_reason(gemini), "MAX_TOKENS")
+        self.assertTrue(truncated(gemini))
+        self.assertTrue(truncated(SimpleNamespace(finish_reason="length")))
+        self.assertFalse(truncated(SimpleNamespace(finish_reason="stop")))
+        self.assertFalse(truncated(MagicMock()))
+
+
+class TestSplitAndContinue(unittest.TestCase):
+
+    def setUp(self):
+        self.contexts, self.outputs, self.fields = generate_corpus(10, seed=9)
+        # follow ups are logged to ./runs/<workflow_id>
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_cut_off_batches_are_continued(self):
+        for structured in (True, False):
+            full, _ = run(self.contexts, self.outputs, self.fields, structured)
+            full.parse_and_validate()
+            limit = len(full.model_reponse) // 4 // 3
+
+            llm, confirmation = run(self.contexts, self.outputs, self.fields, structured, max_output_tokens=limit)
+            self.assertEqual(confirmation["status"], "success")
+            self.assertGreater(llm.truncation["truncated_responses"], 0)
+            self.assertGreater(llm.truncation["continuation_calls"], 1)
+            self.assertEqual(llm.metadata["requests"], 1 + llm.truncation["continuation_calls"])
+            self.assertEqual(llm.parse_and_validate()["status"], "success")
+            self.assertEqual(llm.validated_response, full.validated_response)
+            self.assertEqual(llm.finalize()["truncation"], llm.truncation)
+
+    def test_an_invoice_that_does_not_fit_alone_is_left_missing(self):
+        llm, confirmation = run(self.contexts[:2], self.outputs[:2], self.fields[:2], max_output_tokens=5)
+        self.assertEqual(confirmation["status"], "success")
+        result = llm.parse_and_validate()
+        self.assertEqual([i for i, _ in result["details"]], [0, 1])
+        self.assertEqual(llm.truncation["continuation_calls"], 2)
+
+    def test_follow_ups_stay_within_the_limiter(self):
+        full, _ = run(self.contexts, self.outputs, self.fields)
+        llm = prepared(self.contexts, self.outputs, self.fields, max_output_tokens=len(full.model_reponse) // 4 // 4)
+        llm.max_parallel_requests = 4
+        limiter = LaneLimiter(max_concurrency=4, requests_per_minute=1000, interactive_reserved=0.5)
+        running, peak, lock = [0], [0], threading.Lock()
+        generate = llm._generate
+
+        def counted(prompt, invoices=None):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            try:
+                time.sleep(0.01)
+                return generate(prompt, invoices)
+            finally:
+                with lock:
+                    running[0] -= 1
+
+        llm._generate = counted
+
+        async def scenario():
+            async with limiter.slot(PRIORITY_BULK):
+                llm.slots = ThreadSlots(limiter, PRIORITY_BULK, asyncio.get_running_loop())
+                confirmation = await asyncio.to_thread(llm.call_model)
+                self.assertEqual(limiter.active, 1)
+            return confirmation
+
+        self.assertEqual(asyncio.run(scenario())["status"], "success")
+        self.assertGreater(llm.truncation["continuation_calls"], 2)
+        # the bulk share of 4 slots is 2, the call's own and one free beside it
+        self.assertEqual(peak[0], 2)
+        # every follow up counted against the requests per minute
+        self.assertEqual(len(limiter.started), 1 + llm.truncation["continuation_calls"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,21 +1,152 @@
+import os
+import time
 import asyncio
+import dataclasses
+
+from collections import OrderedDict
 
 from temporalio import activity
 
 from worker import utils
+from worker import datasets
+from worker import profiling
+from worker import field_extraction_metrics
+from worker.lanes import LaneLimiter, ThreadSlots
 from worker.llms import gemini
-from worker.shared import InvoiceData
+from worker.shared import BatchJob, InvoiceData
+
+
+class Sessions(OrderedDict):
+    """
+    pipelines by workflow id, least recently used first. persist_artifact and terminal failures drop
+    theirs, runs that never get there (timed out, abandoned) are dropped after `ttl_s` or past `max_sessions`
+    """
+    def __init__(self, max_sessions: int = 1000, ttl_s: float = 7200.0):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self.last_used = {}
+
+    @classmethod
+    def from_env(cls) -> "Sessions":
+        return cls(
+            max_sessions=int(os.getenv("WORKER_MAX_SESSIONS", "1000")),
+            ttl_s=float(os.getenv("WORKER_SESSION_TTL_SECONDS", "7200")),
+        )
+
+    def __setitem__(self, workflow_id, llm):
+        super().__setitem__(workflow_id, llm)
+        self.touch(workflow_id)
+        self.evict()
+
+    def pop(self, workflow_id, *default):
+        self.last_used.pop(workflow_id, None)
+        return super().pop(workflow_id, *default)
+
+    def touch(self, workflow_id) -> None:
+        self.last_used[workflow_id] = time.monotonic()
+        self.move_to_end(workflow_id)
+
+    def evict(self) -> None:
+        now = time.monotonic()
+        while self:
+            workflow_id = next(iter(self))
+            idle = now - self.last_used[workflow_id]
+            if len(self) <= self.max_sessions and idle <= self.ttl_s:
+                break
+            # a request still running for it must not send more
+            self.pop(workflow_id).cancel()
+            print(f"Dropped the pipeline of {workflow_id}, unused for {idle:.0f}s, {len(self)} left")
 
 
 class LLMActivities:
-    def __init__(self):
-        self.llm = gemini()
+    def __init__(self, llm_factory=gemini, limiter: LaneLimiter | None = None, heartbeat_interval_s: float = 1.0,
+                 sessions: Sessions | None = None):
+        # every workflow gets its own pipeline, the steps keep state between activities
+        self.llm_factory = llm_factory
+        self.sessions = sessions or Sessions()
+        # LLM concurrency and rate budget shared by the interactive and bulk lanes
+        self.limiter = limiter or LaneLimiter()
+        # below the workflow heartbeat timeout, cancellations are only delivered with a heartbeat
+        self.heartbeat_interval_s = heartbeat_interval_s
+        # fail fast at worker start when the provider is not configured
+        llm_factory()
+
+    def _llm(self, data: InvoiceData):
+        if data.workflow_id not in self.sessions:
+            self.sessions[data.workflow_id] = self.llm_factory()
+        else:
+            self.sessions.touch(data.workflow_id)
+            self.sessions.evict()
+        llm = self.sessions[data.workflow_id]
+        # follow up requests sent from the call's worker threads stay within the limiter budget
+        llm.slots = ThreadSlots(self.limiter, data.priority, asyncio.get_running_loop())
+        return llm
+
+    def _failed(self, data: InvoiceData) -> None:
+        """
+        drops the pipeline when the failed activity is not retried, the workflow fails with it
+        """
+        info = activity.info()
+        policy = info.retry_policy
+        if policy and policy.maximum_attempts and info.attempt >= policy.maximum_attempts:
+            self.sessions.pop(data.workflow_id, None)
+
+    def _to_thread(self, data: InvoiceData, func, *args):
+        """
+        runs an llm step in a worker thread, profiled when the workflow asked for it
+        """
+        return asyncio.to_thread(
+            profiling.run_profiled, func, *args,
+            enabled=data.profile and func.__name__ in profiling.PROFILED_ACTIVITIES,
+            output_dir=f"./runs/{data.workflow_id}",
+            name=func.__name__,
+        )
+
+    async def _heartbeating(self, data: InvoiceData, func):
+        """
+        runs a model call in a worker thread and heartbeats until it returns. On cancellation the
+        pipeline refuses further requests, the session is dropped and the slot is freed right away,
+        the request already in flight ends at its deadline timeout and its answer is discarded.
+        """
+        task = asyncio.ensure_future(self._to_thread(data, func))
+        # a cancelled call is abandoned, keep its late error out of the event loop log
+        task.add_done_callback(lambda _: _.cancelled() or _.exception())
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.heartbeat_interval_s)
+                if done:
+                    return task.result()
+                activity.heartbeat()
+        except asyncio.CancelledError:
+            llm = self.sessions.pop(data.workflow_id, None)
+            if llm:
+                llm.cancel()
+            utils.log_structured(data.workflow_id, func.__name__, attempt=activity.info().attempt, status="cancelled")
+            raise
+
+    def _materialize(self, data: InvoiceData) -> InvoiceData:
+        """
+        reads the invoices of a dataset slice, the workflow input only carries the reference
+        """
+        source = data.source
+        rows = datasets.read_slice(source.path, source.offset, source.limit, source.input_column, source.output_column)
+        loaded = datasets.build_invoice_data(rows, data.workflow_id, source.fields)
+        return dataclasses.replace(data, context_input=loaded.context_input, output=loaded.output,
+                                   fields_to_extract=loaded.fields_to_extract)
+
+    @activity.defn
+    async def count_rows(self, job: BatchJob) -> int:
+        return await asyncio.to_thread(datasets.count_rows, job.source, job.input_column, job.output_column)
 
     @activity.defn
     async def load_input(self, data: InvoiceData):
         try:
-            confirmation = await asyncio.to_thread(
-                self.llm.load_input, data,
+            self.sessions[data.workflow_id] = self.llm_factory()
+            if data.source:
+                data = await asyncio.to_thread(self._materialize, data)
+            confirmation = await self._to_thread(
+                data, self._llm(data).load_input, data,
             )
             utils.log_structured(
                 data.workflow_id, "load_input",
@@ -23,39 +154,59 @@ class LLMActivities:
             )
             return confirmation
         except Exception:
+            self._failed(data)
             activity.logger.exception("load input failed")
             raise
 
     @activity.defn
     async def construct_prompt(self, data: InvoiceData):
         try:
-            confirmation = await asyncio.to_thread(
-                self.llm.construct_prompt,
+            confirmation = await self._to_thread(
+                data, self._llm(data).construct_prompt,
             )
+            minimization = self._llm(data).minimize_report or {}
+            pre_extraction = self._llm(data).pre_extract_report or {}
+            few_shot = self._llm(data).few_shot_report or {}
             utils.log_structured(
                 data.workflow_id, "construct_prompt",
-                attempt=activity.info().attempt, status=confirmation['status']
+                attempt=activity.info().attempt, status=confirmation['status'],
+                token_reduction=minimization.get('token_reduction'), shared_blocks=minimization.get('shared_blocks'),
+                fields_avoided=pre_extraction.get('fields_avoided'), invoices_skipped=pre_extraction.get('invoices_skipped'),
+                calls_avoided=pre_extraction.get('calls_avoided'),
+                few_shot_tokens_saved=few_shot.get('tokens_saved'), few_shot_selection_ms=few_shot.get('selection_ms'),
             )
             return confirmation
         except Exception:
+            self._failed(data)
             activity.logger.exception("prompts constuction failed")
             raise
 
     @activity.defn
     async def call_model(self, data: InvoiceData):
         try:
-            confirmation = await asyncio.to_thread(
-                self.llm.call_model
-            )
+            llm = self._llm(data)
+            if llm.pre_extract and not llm.sent:
+                # the rules resolved every field, nothing is sent and no slot is taken
+                confirmation = llm.call_model()
+            else:
+                async with self.limiter.slot(data.priority):
+                    confirmation = await self._heartbeating(data, llm.call_model)
 
-            metadata = getattr(self.llm, 'metadata', {})
-            latency_ms = getattr(self.llm, 'latency', 0)
+            metadata = getattr(llm, 'metadata', {})
+            latency_ms = getattr(llm, 'latency', 0)
+            hedging = llm.hedger.stats() if llm.hedger else {}
             utils.log_structured(
                 data.workflow_id, "call_model",
                 attempt=activity.info().attempt, latency_ms=latency_ms,
+                model=metadata.get('model'), cost_usd=metadata.get('cost_usd'),
+                hedged=metadata.get('hedged'), hedge_won=metadata.get('hedge_won'),
+                hedge_rate=hedging.get('hedge_rate'), hedge_win_rate=hedging.get('hedge_win_rate'),
                 token_in=metadata.get('prompt_token_count', 0),
                 token_out=metadata.get('candidates_token_count', 0),
-                status=confirmation['status']
+                token_estimate=metadata.get('token_estimate'), token_estimate_error=metadata.get('token_estimate_error'),
+                requests=metadata.get('requests'), batch_size=metadata.get('batch_size'), tenant=data.tenant,
+                truncated_responses=metadata.get('truncated_responses'), continuation_calls=metadata.get('continuation_calls'),
+                status=confirmation['status'], error=confirmation['error'] or None
             )
 
             return confirmation
@@ -65,14 +216,15 @@ class LLMActivities:
                 attempt=activity.info().attempt, status="failed",
                 error=str(e)
             )
+            self._failed(data)
             activity.logger.exception("call model failed")
             raise 
 
     @activity.defn
     async def parse_and_validate(self,data: InvoiceData):
         try:
-            confirmation = await asyncio.to_thread(
-                self.llm.parse_and_validate,
+            confirmation = await self._to_thread(
+                data, self._llm(data).parse_and_validate,
             )
             utils.log_structured(
                 data.workflow_id, "parse_and_validate",
@@ -81,30 +233,52 @@ class LLMActivities:
             )
             return confirmation
         except Exception:
+            self._failed(data)
             activity.logger.exception("parse_and_validate failed")
             raise
 
     @activity.defn
-    async def retry_model_call(self,data: InvoiceData):
+    async def escalate(self, data: InvoiceData):
         try:
-            confirmation = await asyncio.to_thread(
-                self.llm.retry_model_call,
+            async with self.limiter.slot(data.priority):
+                confirmation = await self._heartbeating(data, self._llm(data).escalate)
+            llm = self._llm(data)
+            call = llm.tier_calls[-1] if llm.tier_calls else {}
+            utils.log_structured(
+                data.workflow_id, "escalate",
+                attempt=activity.info().attempt, tier=llm.tier, model=call.get('model'),
+                invoices=call.get('invoices'), latency_ms=call.get('latency_s'), cost_usd=call.get('cost_usd'),
+                status=confirmation['status']
             )
+            return confirmation
+        except Exception:
+            self._failed(data)
+            activity.logger.exception("escalate failed")
+            raise
+
+    @activity.defn
+    async def retry_model_call(self,data: InvoiceData):
+        try:
+            async with self.limiter.slot(data.priority):
+                confirmation = await self._heartbeating(data, self._llm(data).retry_model_call)
             utils.log_structured(
                 data.workflow_id, "retry_model_call",
                 attempt=activity.info().attempt, status=confirmation['status']
             )
             return confirmation
         except Exception:
+            self._failed(data)
             activity.logger.exception("retry_model_call failed")
             raise
 
     @activity.defn
     async def persist_artifact(self, data: InvoiceData):
         try:
-            confirmation = await asyncio.to_thread(
-                self.llm.persist_artifact, f"./runs/{data.workflow_id}",
+            confirmation = await self._to_thread(
+                data, self._llm(data).persist_artifact, f"./runs/{data.workflow_id}",
             )
+            # artifacts are the last step of a run, the pipeline state is no longer needed
+            self.sessions.pop(data.workflow_id, None)
             utils.log_structured(
                 data.workflow_id, "persist_artifact",
                 path=f"./runs/{data.workflow_id}",
@@ -112,21 +286,32 @@ class LLMActivities:
             )
             return confirmation
         except Exception:
+            self._failed(data)
             activity.logger.exception("persist_artifact failed")
             raise
     
     @activity.defn
     async def finalize(self, data: InvoiceData):
         try:
-            confirmation = await asyncio.to_thread(
-                self.llm.finalize,
+            confirmation = await self._to_thread(
+                data, self._llm(data).finalize,
             )
+            cascade = confirmation.get("cascade", {})
+            pre_extraction = confirmation.get("pre_extraction", {})
             utils.log_structured(
                 data.workflow_id, "finalize",
                 attempt=activity.info().attempt,
+                escalation_rate=cascade.get("escalation_rate"),
+                latency_saved_s=cascade.get("latency_saved_s"), cost_saved_usd=cascade.get("cost_saved_usd"),
+                fields_avoided=pre_extraction.get("fields_avoided"), calls_avoided=pre_extraction.get("calls_avoided"),
                 status="success"
             )
+            if data.summary_only:
+                # the full result still goes to the run artifacts, the parent only merges counters
+                llm = self._llm(data)
+                return field_extraction_metrics.summarize_extraction(llm.validated_response, llm.output, len(llm.inovices))
             return confirmation
         except Exception:
+            self._failed(data)
             activity.logger.exception("finalize failed")
             raise
@@ -0,0 +1,153 @@
+import os
+import json
+import math
+import time
+import socket
+import threading
+
+from collections import deque
+from typing import Dict, List
+
+from worker import utils
+
+
+class BatchController:
+    """
+    Picks the number of invoices sent per model request from what recent requests of each size cost.
+
+    Every request records its latency, tokens and how many of its invoices failed validation under
+    the size that was chosen for it. The chosen size maximises valid invoices per second of model time
+    among the sizes whose p95 latency is within `slo_s`, sizes with fewer than `min_samples` requests
+    are tried first, smallest first, and every `probe_every` decisions the next larger size is tried
+    again so the controller notices when it became affordable. The samples are kept in `state_path`
+    across worker restarts, written at most every `save_every_s`.
+    """
+
+    def __init__(self, sizes: List[int], slo_s: float = 30.0, min_samples: int = 5, window: int = 200,
+                 probe_every: int = 50, state_path: str | None = None, save_every_s: float = 30.0):
+        self.sizes = sorted(set(sizes))
+        self.slo_s = slo_s
+        self.min_samples = min_samples
+        self.window = window
+        self.probe_every = probe_every
+        self.state_path = state_path
+        self.save_every_s = save_every_s
+        self.saved_at = None
+        # size -> (invoices, latency_s, tokens, failed) of the last `window` requests
+        self.samples: Dict[int, deque] = {size: deque(maxlen=window) for size in self.sizes}
+        self.decisions = 0
+        self.lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def from_env(cls) -> "BatchController | None":
+        """
+        `LLM_BATCH_SIZES` (comma separated candidates) turns the controller on, unset keeps the caller's batches.
+        Replicas share `runs/`, every worker keeps its own state, `{worker}` in `LLM_BATCH_STATE` is
+        `WORKER_ID` or the host name
+        """
+        sizes = [int(_) for _ in os.getenv("LLM_BATCH_SIZES", "").split(",") if _.strip()]
+        if not sizes:
+            return None
+        worker = os.getenv("WORKER_ID") or socket.gethostname()
+        state_path = os.getenv("LLM_BATCH_STATE") or os.path.join("runs", "batch_controller.{worker}.json")
+        return cls(
+            sizes,
+            slo_s=float(os.getenv("LLM_BATCH_LATENCY_SLO_SECONDS", "30")),
+            min_samples=int(os.getenv("LLM_BATCH_MIN_SAMPLES", "5")),
+            state_path=state_path.replace("{worker}", worker),
+        )
+
+    def _summary(self, size: int) -> dict:
+        samples = list(self.samples[size])
+        invoices = sum(_[0] for _ in samples)
+        latency = sum(_[1] for _ in samples)
+        latencies = sorted(_[1] for _ in samples)
+        return {
+            "samples": len(samples),
+            "p95_latency_s": latencies[math.ceil(0.95 * len(latencies)) - 1] if latencies else None,
+            "failure_rate": sum(_[3] for _ in samples) / invoices if invoices else None,
+            "tokens_per_invoice": sum(_[2] for _ in samples) / invoices if invoices else None,
+            # valid invoices per second of model time
+            "goodput": (invoices - sum(_[3] for _ in samples)) / latency if latency else None,
+        }
+
+    def choose(self, pending: int, workflow_id: str | None = None) -> int:
+        """
+        invoices per request for a batch of `pending` invoices, the decision is logged with the workflow
+        """
+        with self.lock:
+            summaries = {size: self._summary(size) for size in self.sizes}
+            # latency grows with the size, the first size over the SLO rules out the larger ones
+            allowed = []
+            for size in self.sizes:
+                p95 = summaries[size]["p95_latency_s"]
+                if summaries[size]["samples"] >= self.min_samples and p95 > self.slo_s:
+                    break
+                allowed.append(size)
+            allowed = allowed or self.sizes[:1]
+
+            unexplored = [_ for _ in allowed if summaries[_]["samples"] < self.min_samples]
+            best = max(allowed, key=lambda _: summaries[_]["goodput"] or 0.0)
+            self.decisions += 1
+            if unexplored:
+                size, reason = unexplored[0], "explore"
+            elif self.probe_every and self.decisions % self.probe_every == 0 and best != self.sizes[-1]:
+                size, reason = self.sizes[self.sizes.index(best) + 1], "probe"
+            else:
+                size, reason = best, "best"
+
+        summary = summaries[size]
+        if workflow_id:
+            utils.log_structured(
+                workflow_id, "call_model", batch_size=size, invoices=pending, batch_size_reason=reason,
+                p95_latency_s=summary["p95_latency_s"], failure_rate=summary["failure_rate"], goodput=summary["goodput"],
+            )
+        return size
+
+    def record(self, size: int, invoices: int, latency: float, tokens: int, failed: int) -> None:
+        if size not in self.samples:
+            return
+        with self.lock:
+            self.samples[size].append((invoices, latency, tokens, failed))
+            due = self.saved_at is None or time.monotonic() - self.saved_at >= self.save_every_s
+            if due:
+                self.saved_at = time.monotonic()
+        if due:
+            self._save()
+
+    def flush(self) -> None:
+        """
+        writes the state now, `record` only writes every `save_every_s`
+        """
+        self._save()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {size: self._summary(size) for size in self.sizes}
+
+    def _load(self) -> None:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring batch controller state {self.state_path}: {e}")
+            return
+        for size, samples in state.get("samples", {}).items():
+            if int(size) in self.samples:
+                self.samples[int(size)].extend(tuple(_) for _ in samples)
+        self.decisions = state.get("decisions", 0)
+
+    def _save(self) -> None:
+        if not self.state_path:
+            return
+        with self.lock:
+            state = {"decisions": self.decisions, "samples": {size: list(samples) for size, samples in self.samples.items()}}
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp_path = f"{self.state_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        # atomic replace, a restart never reads a half written state
+        os.replace(tmp_path, self.state_path)
@@ -0,0 +1,62 @@
+"""
+Model cascade: a batch goes to the first, cheapest tier, and only the invoices it gets wrong
+move on to the next one. These helpers decide what counts as wrong beyond validation and
+report what the cascade saved against running the whole batch on the strongest tier.
+"""
+from typing import List
+
+# a valid answer with more empty required fields than this share is escalated anyway
+MAX_EMPTY_SHARE = 0.5
+
+
+def low_confidence(extracted: dict, required_fields: List[str], max_empty_share: float = MAX_EMPTY_SHARE) -> str | None:
+    """
+    reason to escalate a valid answer, None when it looks complete enough
+    """
+    if not required_fields or not isinstance(extracted, dict):
+        return None
+    values = {key.upper(): value for key, value in extracted.items()}
+    empty = [_ for _ in required_fields if values.get(_.upper()) in (None, "", [], "None", "null")]
+    if len(empty) / len(required_fields) > max_empty_share:
+        return f"Low confidence: {len(empty)} of {len(required_fields)} required fields empty ({', '.join(empty)})"
+    return None
+
+
+def _baseline(calls: List[dict], invoices: int, tiers: List[str], router=None) -> tuple:
+    """
+    estimated (latency, cost) of the whole batch on the strongest tier, None when unknown
+    """
+    strongest = tiers[-1]
+    route = router.route(strongest) if router else None
+    first = calls[0]
+
+    latency = None
+    observed = [_ for _ in calls if _["model"] == strongest]
+    if observed:
+        # latency grows with the output, i.e. roughly with the invoices in the batch
+        latency = observed[-1]["latency_s"] / observed[-1]["invoices"] * invoices
+    elif route:
+        latency = router.expected_latency(route, first["prompt_token_count"] + first["candidates_token_count"])
+
+    cost = route.cost(first["prompt_token_count"], first["candidates_token_count"]) if route else None
+    return latency, cost
+
+
+def report(calls: List[dict], invoices: int, tiers: List[str], router=None) -> dict:
+    """
+    escalation rate, latency and cost of a cascade run, and the savings against the strongest tier alone
+    """
+    escalated = calls[1]["invoices"] if len(calls) > 1 else 0
+    latency = sum(_["latency_s"] for _ in calls)
+    costs = [_["cost_usd"] for _ in calls]
+    cost = sum(costs) if costs and None not in costs else None
+    baseline_latency, baseline_cost = _baseline(calls, invoices, tiers, router) if calls else (None, None)
+    return {
+        "tiers": calls,
+        "escalated": escalated,
+        "escalation_rate": escalated / invoices if invoices else 0.0,
+        "latency_s": latency,
+        "cost_usd": cost,
+        "latency_saved_s": baseline_latency - latency if baseline_latency is not None else None,
+        "cost_saved_usd": baseline_cost - cost if baseline_cost is not None and cost is not None else None,
+    }
@@ -0,0 +1,300 @@
+import os
+import csv
+import sys
+import json
+import bisect
+
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from worker.shared import InvoiceData
+from worker.utils import REQUIRED_FIELDS
+
+SUPPORTED_FORMATS = (".xlsx", ".csv", ".jsonl", ".parquet")
+# rows between two positions of the index count_rows writes
+INDEX_STRIDE = 1024
+
+
+def _parse_output(value) -> Dict | None:
+    """
+    Ground truth cells hold a JSON object, either already decoded (JSONL/Parquet) or as a string.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, dict):
+        return value
+    return json.loads(value)
+
+
+def _iter_xlsx(path: str, start: int | None = None) -> Iterator[Tuple[int | None, Dict]]:
+    from openpyxl import load_workbook
+
+    # read only mode streams rows from the sheet xml instead of building the whole workbook
+    workbook = load_workbook(path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(_) if _ is not None else "" for _ in next(rows, [])]
+        # no position to seek to, count_rows copies the sheet to JSONL once for the slices
+        for values in rows:
+            yield None, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def _iter_csv(path: str, start: int | None = None) -> Iterator[Tuple[int, Dict]]:
+    # invoice texts are long, lift the default 128KB field limit
+    csv.field_size_limit(sys.maxsize)
+    with open(path, "rb") as f:
+        position = 0
+
+        def lines():
+            # the reader pulls one record's lines at a time, position is where the next record starts
+            nonlocal position
+            for line in f:
+                position += len(line)
+                yield line.decode("utf-8")
+
+        reader = csv.reader(lines())
+        header = next(reader, None)
+        if header is None:
+            return
+        if start:
+            f.seek(start)
+            position = start
+            reader = csv.reader(lines())
+        while True:
+            record_start = position
+            values = next(reader, None)
+            if values is None:
+                break
+            if values:
+                yield record_start, dict(zip(header, values))
+
+
+def _iter_jsonl(path: str, start: int | None = None) -> Iterator[Tuple[int, Dict]]:
+    with open(path, "rb") as f:
+        position = f.seek(start or 0)
+        for line in f:
+            if line.strip():
+                yield position, json.loads(line)
+            position += len(line)
+
+
+def _iter_parquet(path: str, start: int | None = None, batch_rows: int = 1024) -> Iterator[Tuple[int, Dict]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Reading parquet datasets requires pyarrow, install it with `uv add pyarrow`") from e
+
+    # the position of a row is its row group, the unit a read can start from
+    parquet = pq.ParquetFile(path)
+    for group in range(start or 0, parquet.num_row_groups):
+        for record_batch in parquet.iter_batches(batch_size=batch_rows, row_groups=[group]):
+            for row in record_batch.to_pylist():
+                yield group, row
+
+
+_READERS = {
+    ".xlsx": _iter_xlsx,
+    ".csv": _iter_csv,
+    ".jsonl": _iter_jsonl,
+    ".parquet": _iter_parquet,
+}
+
+
+def iter_rows(path: str, input_column: str = "Input", output_column: str = "Final_Output") -> Iterator[Tuple[str, Dict | None]]:
+    """
+    Streams (invoice text, ground truth) pairs from an XLSX, CSV, JSONL or Parquet file
+    without loading the whole file. The ground truth is decoded once and is None when missing.
+    """
+    for _, row in _rows(path, input_column):
+        yield str(row[input_column]), _parse_output(row.get(output_column))
+
+
+def _rows(path: str, input_column: str, start: int | None = None) -> Iterator[Tuple[int | None, Dict]]:
+    """
+    (position, row) of the rows with an invoice text, the reader resumes at a position with `start`
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix not in _READERS:
+        raise ValueError(f"Unsupported dataset format '{suffix}', expected one of {SUPPORTED_FORMATS}")
+
+    for position, row in _READERS[suffix](path, start):
+        if row.get(input_column) is not None:
+            yield position, row
+
+
+def iter_batches(rows: Iterator[Tuple[str, Dict | None]], batch_size: int) -> Iterator[Tuple[int, List[Tuple[str, Dict | None]]]]:
+    """
+    Groups rows into (batch index, rows) chunks of `batch_size`.
+    """
+    batch, index = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield index, batch
+            batch, index = [], index + 1
+    if batch:
+        yield index, batch
+
+
+def build_invoice_data(rows: List[Tuple[str, Dict | None]], workflow_id: str, fields: List[str] | None = None, **kwargs) -> InvoiceData:
+    """
+    Builds the workflow input for one batch, fields to extract come from the ground truth keys,
+    `fields` (REQUIRED_FIELDS by default) for the rows without ground truth.
+    """
+    outputs = [output or {} for _, output in rows]
+    return InvoiceData(
+        context_input=[context for context, _ in rows],
+        # without any ground truth there is nothing to evaluate against
+        output=outputs if any(outputs) else [],
+        fields_to_extract=[list(output.keys()) or list(fields or REQUIRED_FIELDS) for output in outputs],
+        workflow_id=workflow_id,
+        **kwargs,
+    )
+
+
+class Checkpoint:
+    """
+    Tracks which batches of a dataset run finished, so an interrupted run resumes where it stopped.
+
+    Batches finish out of order, the file keeps a watermark (every batch below it is done)
+    plus the finished batch indices above it.
+    """
+
+    def __init__(self, path: str, run_id: str, batch_size: int):
+        self.path = path
+        self.run_id = run_id
+        self.batch_size = batch_size
+        self.watermark = 0
+        self.completed = set()
+
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state["batch_size"] != batch_size:
+                raise ValueError(f"Checkpoint {path} was written with batch size {state['batch_size']}, not {batch_size}")
+            self.run_id = state["run_id"]
+            self.watermark = state["watermark"]
+            self.completed = set(state["completed"])
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark or index in self.completed
+
+    def mark_done(self, index: int) -> None:
+        self.completed.add(index)
+        while self.watermark in self.completed:
+            self.completed.remove(self.watermark)
+            self.watermark += 1
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "run_id": self.run_id,
+                "batch_size": self.batch_size,
+                "watermark": self.watermark,
+                "completed": sorted(self.completed),
+            }, f)
+        # atomic replace, an interruption never leaves a half written checkpoint
+        os.replace(tmp_path, self.path)
+
+
+def _index_path(path: str) -> str:
+    return f"{path}.index.json"
+
+
+def _rows_path(path: str) -> str:
+    return f"{path}.rows.jsonl"
+
+
+def _index_key(path: str, input_column: str) -> Dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "input_column": input_column}
+
+
+def count_rows(path: str, input_column: str = "Input", output_column: str = "Final_Output") -> int:
+    """
+    Counts the rows and writes the index read_slice seeks with: the position of every
+    INDEX_STRIDE-th row (byte offset for JSONL/CSV, row group for Parquet). An XLSX sheet has
+    no position to seek to, its rows are copied to `<path>.rows.jsonl` on the same pass and
+    indexed by their offset in the copy.
+    """
+    copy, rows_path = None, None
+    if Path(path).suffix.lower() == ".xlsx":
+        rows_path = _rows_path(path)
+        try:
+            copy = open(f"{rows_path}.tmp", "wb")
+        except OSError as e:
+            print(f"Could not copy the rows of {path}: {e}")
+
+    checkpoints, count, last = [], 0, None
+    try:
+        for position, row in _rows(path, input_column):
+            if copy:
+                position = copy.tell()
+                copy.write(json.dumps(row, default=str).encode("utf-8") + b"\n")
+            if position is not None and position != last:
+                last = position
+                if not checkpoints or count - checkpoints[-1][0] >= INDEX_STRIDE:
+                    checkpoints.append([count, position])
+            count += 1
+    finally:
+        if copy:
+            copy.close()
+    if copy:
+        os.replace(f"{rows_path}.tmp", rows_path)
+
+    index_path = _index_path(path)
+    try:
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**_index_key(path, input_column), "rows": count, "checkpoints": checkpoints,
+                       "rows_path": rows_path if copy else None}, f)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        # a read only dataset directory, slices stream from the first row
+        print(f"Could not write the row index of {path}: {e}")
+    return count
+
+
+def _index(path: str, input_column: str) -> Dict | None:
+    """
+    the index count_rows wrote, None when there is none or the file changed since
+    """
+    try:
+        with open(_index_path(path), encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if any(index.get(key) != value for key, value in _index_key(path, input_column).items()):
+        return None
+    if index.get("rows_path") and not os.path.exists(index["rows_path"]):
+        return None
+    return index
+
+
+def _seek(path: str, offset: int, input_column: str) -> Tuple[int, int | None]:
+    """
+    the last indexed (row, position) at or before `offset`, the start of the file without a current index
+    """
+    index = _index(path, input_column)
+    if index is None:
+        return 0, None
+    at = bisect.bisect_right([row for row, _ in index["checkpoints"]], offset) - 1
+    return tuple(index["checkpoints"][at]) if at >= 0 else (0, None)
+
+
+def read_slice(path: str, offset: int, limit: int, input_column: str = "Input", output_column: str = "Final_Output") -> List[Tuple[str, Dict | None]]:
+    """
+    Rows [offset, offset + limit) in the order iter_rows yields them. With the index count_rows
+    wrote, the read starts at most INDEX_STRIDE rows before the slice, an XLSX slice is read from its JSONL copy.
+    """
+    index = _index(path, input_column)
+    row, start = _seek(path, offset, input_column)
+    rows = _rows((index or {}).get("rows_path") or path, input_column, start)
+    return [(str(item[input_column]), _parse_output(item.get(output_column))) for _, item in islice(rows, offset - row, offset - row + limit)]
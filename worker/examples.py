@@ -0,0 +1,113 @@
+"""
+Few-shot examples picked per batch from an indexed example bank.
+
+The bank is a dataset of solved invoices (the `Input` and `Final_Output` columns, any format
+`worker.datasets` reads). It is indexed once, as TF-IDF vectors of the normalized invoice texts,
+when the worker starts. Each prompt then gets the `k` examples closest to any invoice of its batch
+instead of the fixed example of `prompts.few_shot()`. Bank and queries are sparse: a query only tokenizes
+the invoices and scores the rows of their terms, so selection stays well under a millisecond for a batch.
+"""
+import os
+import re
+import json
+import time
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List
+
+from worker import datasets, utils
+
+# loaded when a bank is built, not at worker import
+np = utils.LazyModule("numpy")
+sparse = utils.LazyModule("scipy.sparse")
+sklearn_text = utils.LazyModule("sklearn.feature_extraction.text")
+
+# the contexts are normalized (lower case) before indexing and before every query
+_TOKEN = re.compile(r"\b[a-z][a-z]+\b")
+
+
+@dataclass
+class Example:
+    context: str
+    output: Dict
+
+
+class ExampleBank:
+
+    def __init__(self, examples: List[Example], k: int = 1):
+        if not examples:
+            raise ValueError("The example bank is empty")
+        self.examples = examples
+        self.k = k
+        vectorizer = sklearn_text.TfidfVectorizer(sublinear_tf=True, token_pattern=_TOKEN.pattern, lowercase=False)
+        # sparse (CSR), a large bank has far more terms than any one invoice, stored transposed for the product
+        self.matrix = vectorizer.fit_transform([utils.normalize_text(_.context) for _ in examples]).T.tocsr()
+        self.vocabulary = vectorizer.vocabulary_
+        self.idf = vectorizer.idf_
+        self.last_selection_ms = 0.0
+
+    @classmethod
+    def from_file(cls, path: str, k: int = 1, input_column: str = "Input", output_column: str = "Final_Output") -> "ExampleBank":
+        examples = [Example(context, output) for context, output in datasets.iter_rows(path, input_column, output_column) if output]
+        return cls(examples, k)
+
+    @classmethod
+    def from_env(cls) -> "ExampleBank | None":
+        """
+        `FEW_SHOT_BANK` (a dataset file) turns selection on, unset keeps the fixed example
+        """
+        path = os.getenv("FEW_SHOT_BANK")
+        if not path:
+            return None
+        bank = cls.from_file(path, k=int(os.getenv("FEW_SHOT_K", "1")))
+        print(f"Indexed {len(bank.examples)} few-shot examples from {path}, {len(bank.vocabulary)} terms")
+        return bank
+
+    def _query(self, contexts: List[str]):
+        """
+        TF-IDF rows of the invoices (sparse), computed like the vectorizer does without its per call overhead
+        """
+        columns, counts, indptr = [], [], [0]
+        for context in contexts:
+            for term, count in Counter(_TOKEN.findall(context)).items():
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    columns.append(column)
+                    counts.append(count)
+            indptr.append(len(columns))
+        columns = np.array(columns, dtype=np.int32)
+        values = (np.log(np.array(counts, dtype=float)) + 1) * self.idf[columns]
+        rows = np.repeat(np.arange(len(contexts)), np.diff(indptr))
+        norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=len(contexts)))
+        values /= norms[rows]
+        return sparse.csr_matrix((values, columns, indptr), shape=(len(contexts), len(self.vocabulary)))
+
+    def select(self, contexts: List[str], k: int | None = None) -> List[Example]:
+        """
+        the `k` examples most similar to any of the (normalized) invoices, the first ones without invoices
+        """
+        started = time.perf_counter()
+        k = min(k or self.k, len(self.examples))
+        if contexts:
+            # invoices x examples is small, dense before the max
+            best = (self._query(contexts) @ self.matrix).toarray().max(axis=0)
+            chosen = [self.examples[_] for _ in np.argsort(-best, kind="stable")[:k]]
+        else:
+            chosen = self.examples[:k]
+        self.last_selection_ms = (time.perf_counter() - started) * 1000
+        return chosen
+
+
+def render(examples: List[Example], required_fields: List[List[str]] | None = None) -> str:
+    """
+    the examples in the layout of `prompts.few_shot()`, outputs limited to the fields the batch asks for
+    """
+    wanted = {field for fields in required_fields or [] for field in fields}
+    text = "\nyou can follow below example, \n"
+    for example in examples:
+        output = {key: value for key, value in example.output.items() if key in wanted} or example.output
+        text += "\n<EXAMPLE>\n    <INVOICE_0>\n    Required fields:\n"
+        text += f"    [{', '.join(output)}]\n\n    Context :\n{example.context.strip()}\n\n    </INVOICE_0>\n"
+        text += f"\n    <OUTPUT_0>\n{json.dumps(output, indent=4)}\n    </OUTPUT_0>\n\n</EXAMPLE>\n"
+    return text
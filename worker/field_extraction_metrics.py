@@ -1,6 +1,6 @@
 import re
 from typing import Dict, List, Any, Tuple
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 
 
 @dataclass
@@ -50,16 +50,9 @@ def normalize_value(value: Any) -> str:
     return text
 
 
-def evaluate_field_extraction(predictions: List[Dict], ground_truths: List[Dict]) -> Dict[str, Any]:
+def _accumulate(predictions: List[Dict], ground_truths: List[Dict]) -> Tuple[Dict[str, FieldMetrics], FieldMetrics, List[Dict], int, int]:
     """
-    Evaluate field extraction performance with multiple metrics
-    
-    Args:
-        predictions: List of predicted field dictionaries
-        ground_truths: List of ground truth field dictionaries
-    
-    Returns:
-        Dictionary containing evaluation metrics
+    Counts matches per field, overall and per sample, shared by the full evaluation and the mergeable summary
     """
     if len(predictions) != len(ground_truths):
         raise ValueError("Predictions and ground truths must have same length")
@@ -169,16 +162,44 @@ def evaluate_field_extraction(predictions: List[Dict], ground_truths: List[Dict]
             'normalized_match_rate': normalized_match_rate,
             'incorrect_fields': sample_details
         })
+
+    return field_metrics, overall_metrics, sample_results, document_exact_matches, document_normalized_matches
+
+
+def evaluate_field_extraction(predictions: List[Dict], ground_truths: List[Dict]) -> Dict[str, Any]:
+    """
+    Evaluate field extraction performance with multiple metrics
+    
+    Args:
+        predictions: List of predicted field dictionaries
+        ground_truths: List of ground truth field dictionaries
+    
+    Returns:
+        Dictionary containing evaluation metrics
+    """
+    field_metrics, overall_metrics, sample_results, document_exact_matches, document_normalized_matches = _accumulate(predictions, ground_truths)
     
     # Calculate document-level statistics
-    total_documents = len(predictions)
-    avg_exact_match_rate = sum(sample['exact_match_rate'] for sample in sample_results) / total_documents if total_documents > 0 else 0.0
-    avg_normalized_match_rate = sum(sample['normalized_match_rate'] for sample in sample_results) / total_documents if total_documents > 0 else 0.0
+    results = _report(
+        field_metrics, overall_metrics, len(predictions), document_exact_matches, document_normalized_matches,
+        sum(sample['exact_match_rate'] for sample in sample_results),
+        sum(sample['normalized_match_rate'] for sample in sample_results),
+    )
+    results['sample_level_results'] = sample_results
+    
+    return results
+
+
+def _report(field_metrics: Dict[str, FieldMetrics], overall_metrics: FieldMetrics, total_documents: int,
+            document_exact_matches: int, document_normalized_matches: int,
+            sum_exact_match_rate: float, sum_normalized_match_rate: float) -> Dict[str, Any]:
+    avg_exact_match_rate = sum_exact_match_rate / total_documents if total_documents > 0 else 0.0
+    avg_normalized_match_rate = sum_normalized_match_rate / total_documents if total_documents > 0 else 0.0
     
     # Compile results
-    results = {
+    return {
         'overall_metrics': {
-            'total_samples': len(predictions),
+            'total_samples': total_documents,
             'total_fields_evaluated': overall_metrics.total_fields,
             'exact_match_accuracy': overall_metrics.exact_match_rate,
             'normalized_match_accuracy': overall_metrics.normalized_match_rate,
@@ -206,10 +227,83 @@ def evaluate_field_extraction(predictions: List[Dict], ground_truths: List[Dict]
             }
             for field, metrics in field_metrics.items()
         },
-        'sample_level_results': sample_results
     }
-    
-    return results
+
+
+def empty_summary() -> Dict[str, Any]:
+    """
+    Mergeable evaluation summary: raw counters only, so summaries of separate chunks add up
+    to the metrics of the whole batch without keeping any per sample result
+    """
+    return {
+        'invoices': 0,
+        'chunks': 0,
+        'failed_chunks': 0,
+        'failed_invoices': 0,
+        'documents': 0,
+        'documents_exact_match': 0,
+        'documents_normalized_match': 0,
+        'sum_exact_match_rate': 0.0,
+        'sum_normalized_match_rate': 0.0,
+        'overall': asdict(FieldMetrics()),
+        'fields': {},
+    }
+
+
+def summarize_extraction(predictions: List[Dict] | None, ground_truths: List[Dict] | None, invoices: int) -> Dict[str, Any]:
+    """Summary of one extraction run, only the invoice count when there is no ground truth"""
+    summary = empty_summary()
+    summary['invoices'] = invoices
+    summary['chunks'] = 1
+    if predictions is None or not ground_truths:
+        return summary
+
+    field_metrics, overall_metrics, sample_results, document_exact_matches, document_normalized_matches = _accumulate(predictions, ground_truths)
+    summary.update({
+        'documents': len(predictions),
+        'documents_exact_match': document_exact_matches,
+        'documents_normalized_match': document_normalized_matches,
+        'sum_exact_match_rate': sum(sample['exact_match_rate'] for sample in sample_results),
+        'sum_normalized_match_rate': sum(sample['normalized_match_rate'] for sample in sample_results),
+        'overall': asdict(overall_metrics),
+        'fields': {field: asdict(metrics) for field, metrics in field_metrics.items()},
+    })
+    return summary
+
+
+def failed_summary(invoices: int) -> Dict[str, Any]:
+    summary = empty_summary()
+    summary.update({'invoices': invoices, 'chunks': 1, 'failed_chunks': 1, 'failed_invoices': invoices})
+    return summary
+
+
+def _add_counters(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: a.get(key, 0) + b.get(key, 0) for key in a.keys() | b.keys()}
+
+
+def merge_summaries(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    merged = {key: a[key] + b[key] for key in a if key not in ('overall', 'fields')}
+    merged['overall'] = _add_counters(a['overall'], b['overall'])
+    merged['fields'] = {
+        field: _add_counters(a['fields'].get(field, {}), b['fields'].get(field, {}))
+        for field in a['fields'].keys() | b['fields'].keys()
+    }
+    return merged
+
+
+def summary_report(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Same metrics as evaluate_field_extraction, without the sample level results"""
+    report = _report(
+        {field: FieldMetrics(**counters) for field, counters in sorted(summary['fields'].items())},
+        FieldMetrics(**summary['overall']),
+        summary['documents'],
+        summary['documents_exact_match'],
+        summary['documents_normalized_match'],
+        summary['sum_exact_match_rate'],
+        summary['sum_normalized_match_rate'],
+    )
+    report['batch'] = {key: summary[key] for key in ('invoices', 'chunks', 'failed_chunks', 'failed_invoices')}
+    return report
 
 
 def print_evaluation_summary(results: Dict[str, Any]):
@@ -0,0 +1,130 @@
+import os
+import math
+import time
+import threading
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict
+
+
+@dataclass
+class HedgeOutcome:
+    hedged: bool = False
+    hedge_won: bool = False
+
+
+class Hedger:
+    """
+    Sends a duplicate model request when the first one is slower than the `percentile` of recent
+    calls to the same model, and returns whichever answers first.
+
+    Hedges are capped at `max_extra_load` of the last `window` requests, and no hedge is sent
+    before `min_samples` latencies were seen. The losing request cannot be aborted by the SDKs,
+    its answer is dropped when it arrives and it is not sent again. Requests run on the pool, `from_env`
+    sizes it for a primary and a hedge of every request the worker's activities may send at once.
+    """
+
+    def __init__(self, percentile: float = 95.0, max_extra_load: float = 0.1, min_samples: int = 20,
+                 window: int = 500, alternate: bool = False, max_workers: int = 32):
+        self.percentile = percentile
+        # hedge to the next best routed model instead of the same one
+        self.alternate = alternate
+        self.max_extra_load = max_extra_load
+        self.min_samples = min_samples
+        self.window = window
+        self.latencies: Dict[str, deque] = {}
+        self.requests = deque(maxlen=window)
+        self.counters = {"requests": 0, "hedged": 0, "hedge_won": 0}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    @classmethod
+    def from_env(cls) -> "Hedger | None":
+        """
+        `LLM_HEDGE_PERCENTILE` turns hedging on, 0 or unset keeps a single request per call
+        """
+        percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+        if not percentile:
+            return None
+        # every activity slot may run its parallel follow up requests, each with a hedge
+        requests = int(os.getenv("WORKER_MAX_CONCURRENT_ACTIVITIES", "100")) * int(os.getenv("LLM_MAX_PARALLEL_REQUESTS", "4"))
+        return cls(
+            percentile=percentile,
+            max_extra_load=float(os.getenv("LLM_HEDGE_MAX_EXTRA_LOAD", "0.1")),
+            min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+            alternate=os.getenv("LLM_HEDGE_ALTERNATE", "").lower() in ("1", "true", "yes"),
+            max_workers=2 * requests,
+        )
+
+    def delay(self, model: str) -> float | None:
+        """
+        seconds after which a request to `model` is hedged, None while there are too few samples
+        """
+        with self.lock:
+            values = sorted(self.latencies.get(model, ()))
+        if len(values) < self.min_samples:
+            return None
+        return values[min(len(values) - 1, math.ceil(self.percentile / 100 * len(values)) - 1)]
+
+    def _record(self, model: str, latency: float) -> None:
+        with self.lock:
+            self.latencies.setdefault(model, deque(maxlen=self.window)).append(latency)
+
+    def _may_hedge(self) -> bool:
+        with self.lock:
+            return sum(self.requests) < self.max_extra_load * max(len(self.requests), 1)
+
+    def call(self, model: str, primary: Callable, hedge: Callable) -> tuple:
+        """
+        runs `primary`, and `hedge` once the hedge delay passed, returns (response, HedgeOutcome)
+        """
+        outcome = HedgeOutcome()
+        started = threading.Event()
+        clock = []
+
+        def timed():
+            # the clock starts with the request, not while it waits for a pool thread
+            clock.append(time.monotonic())
+            started.set()
+            response = primary()
+            # the full latency of every primary request feeds the percentile, also when it lost
+            self._record(model, time.monotonic() - clock[0])
+            return response
+
+        first = self.executor.submit(timed)
+        delay = self.delay(model)
+        if delay is not None:
+            started.wait()
+            delay = max(0.0, delay - (time.monotonic() - clock[0]))
+        done, _ = wait([first], timeout=delay)
+        if not done and self._may_hedge():
+            outcome.hedged = True
+            second = self.executor.submit(hedge)
+            pending = {first, second}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                winner = next((f for f in (second, first) if f in done and f.exception() is None), None)
+                if winner is not None:
+                    outcome.hedge_won = winner is second
+                    break
+            else:
+                # both failed, surface the error of the original request
+                winner = first
+        else:
+            winner = first
+
+        with self.lock:
+            self.requests.append(1 if outcome.hedged else 0)
+            self.counters["requests"] += 1
+            self.counters["hedged"] += outcome.hedged
+            self.counters["hedge_won"] += outcome.hedge_won
+        return winner.result(), outcome
+
+    def stats(self) -> dict:
+        with self.lock:
+            counters = dict(self.counters)
+        counters["hedge_rate"] = counters["hedged"] / counters["requests"] if counters["requests"] else 0.0
+        counters["hedge_win_rate"] = counters["hedge_won"] / counters["hedged"] if counters["hedged"] else 0.0
+        return counters
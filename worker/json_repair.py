@@ -0,0 +1,98 @@
+"""
+Tolerant parsing of the model's JSON answer.
+
+The answer is a list of invoice objects, or of JSON strings holding them. When it does not parse,
+the text is scanned once and every element that is complete is kept: an answer truncated at the
+output token limit loses only its last invoices. Python style elements (single quotes, None, True,
+False) and trailing commas are accepted, markdown code fences are ignored.
+"""
+import re
+import ast
+import json
+
+from typing import List
+
+_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+_JSON_WORDS = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|\b(null|true|false)\b""")
+_PYTHON = {"null": "None", "true": "True", "false": "False"}
+
+
+def _literal(text: str):
+    """
+    a JSON or Python literal, JSON's null, true and false are read outside of strings only
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    python = _JSON_WORDS.sub(lambda m: m.group(1) or _PYTHON[m.group(2)], text)
+    try:
+        return ast.literal_eval(python)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def load_object(value):
+    """
+    the invoice object of an element, None when it is not one
+    """
+    # a string element holds an invoice object, the same repairs apply to it
+    if isinstance(value, str):
+        value = _literal(value.strip())
+    return value if isinstance(value, dict) else None
+
+
+def elements(text: str) -> List[str]:
+    """
+    source of every complete top level element, of the outer array or of a sequence of objects
+    """
+    start = min([_ for _ in (text.find("["), text.find("{")) if _ >= 0], default=-1)
+    if start < 0:
+        return []
+    base = 1 if text[start] == "[" else 0
+    found, depth, quote, escaped, begin = [], 0, None, False, None
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+                if depth == base and begin is not None and text[begin] in "'\"":
+                    found.append(text[begin:i + 1])
+                    begin = None
+            continue
+        if char in "'\"":
+            quote = char
+            if depth == base and begin is None:
+                begin = i
+        elif char in "[{":
+            if depth == base and begin is None:
+                begin = i
+            depth += 1
+        elif char in "]}":
+            depth -= 1
+            if depth == base and begin is not None:
+                found.append(text[begin:i + 1])
+                begin = None
+            if depth < base:
+                break
+    return found
+
+
+def loads(text: str) -> list:
+    """
+    the invoice objects of the answer that could be recovered, JSONDecodeError when it holds no JSON at all
+    """
+    if "```" in text:
+        text = _FENCE.sub("", text)
+    value = _literal(text.strip())
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, list):
+        if "[" not in text and "{" not in text:
+            raise json.JSONDecodeError("No JSON array or object in the model response", text, 0)
+        value = [_literal(_) for _ in elements(text)]
+    return [_ for _ in map(load_object, value) if _ is not None]
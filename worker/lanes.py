@@ -0,0 +1,131 @@
+import math
+import time
+import asyncio
+
+from collections import deque
+from contextlib import asynccontextmanager
+
+from worker.shared import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+class LaneLimiter:
+    """
+    Shares the LLM concurrency and requests per minute between the interactive and bulk lanes.
+
+    `interactive_reserved` of both budgets is held back for interactive calls: bulk calls stop at
+    the unreserved part while interactive calls may use the whole budget, so a running batch job
+    never takes the last slots an interactive request needs. A budget of 0 is unlimited.
+    """
+
+    def __init__(self, max_concurrency: int = 0, requests_per_minute: int = 0, interactive_reserved: float = 0.25):
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.interactive_reserved = interactive_reserved
+        self.active = 0
+        self.started = deque()
+        self.condition = None
+
+    def _limits(self, lane: str):
+        if lane == PRIORITY_INTERACTIVE:
+            return self.max_concurrency, self.requests_per_minute
+        share = 1 - self.interactive_reserved
+        # a non zero budget always leaves bulk at least one slot
+        concurrency = max(1, math.floor(self.max_concurrency * share)) if self.max_concurrency else 0
+        rate = max(1, math.floor(self.requests_per_minute * share)) if self.requests_per_minute else 0
+        return concurrency, rate
+
+    def _wait_time(self, lane: str, concurrency: bool = True) -> float | None:
+        """
+        0 when a call may start now, seconds until a rate slot frees up, None while all slots are busy.
+        """
+        limit, rate = self._limits(lane)
+        if concurrency and limit and self.active >= limit:
+            return None
+        if rate:
+            now = time.monotonic()
+            while self.started and now - self.started[0] >= 60:
+                self.started.popleft()
+            if len(self.started) >= rate:
+                return 60 - (now - self.started[len(self.started) - rate])
+        return 0
+
+    async def _acquire(self, lane: str, concurrency: bool = True) -> None:
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            while True:
+                wait = self._wait_time(lane, concurrency)
+                if wait == 0:
+                    break
+                try:
+                    await asyncio.wait_for(self.condition.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            if concurrency:
+                self.active += 1
+            if self.requests_per_minute:
+                self.started.append(time.monotonic())
+
+    @asynccontextmanager
+    async def slot(self, lane: str):
+        await self._acquire(lane)
+        try:
+            yield
+        finally:
+            await self.release()
+
+    async def request(self, lane: str) -> None:
+        """
+        waits for the rate budget of one more request of a call that already holds a slot
+        """
+        await self._acquire(lane, concurrency=False)
+
+    async def try_acquire(self, lane: str) -> bool:
+        """
+        a slot only when one is free now, for requests beside a call that already holds one.
+        Waiting for it could deadlock calls that each hold a slot.
+        """
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            limit, _ = self._limits(lane)
+            if limit and self.active >= limit:
+                return False
+            self.active += 1
+            return True
+
+    async def release(self) -> None:
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+
+class ThreadSlots:
+    """
+    the limiter of a lane as the worker threads of a model call use it, through the event loop
+    """
+
+    def __init__(self, limiter: LaneLimiter, lane: str, loop: asyncio.AbstractEventLoop):
+        self.limiter = limiter
+        self.lane = lane
+        self.loop = loop
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def request(self) -> None:
+        self._run(self.limiter.request(self.lane))
+
+    def try_acquire(self) -> bool:
+        return self._run(self.limiter.try_acquire(self.lane))
+
+    def release(self) -> None:
+        self._run(self.limiter.release())
+
+
+def lane_slots(total: int, interactive_weight: float) -> dict:
+    """
+    Splits `total` worker slots between the lane task queues, every lane keeps at least one.
+    """
+    interactive = min(total - 1, max(1, round(total * interactive_weight)))
+    return {PRIORITY_INTERACTIVE: interactive, PRIORITY_BULK: total - interactive}
@@ -1,41 +1,165 @@
 import os
 import json
 import pickle 
+import math
 import time
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import SimpleNamespace
 from typing import Optional
 from dotenv import load_dotenv
-import google.generativeai as genai
 from google.api_core import exceptions
 
 from worker import utils
 from worker.field_extraction_metrics import evaluate_field_extraction
 from worker.shared import InvoiceData
 from worker.prompts import retry_prompt
-from worker.prompts import get_batched_prompt,get_batched_prompt_with_fields
+from worker.prompts import get_batched_prompt,get_batched_prompt_with_fields,few_shot
+from worker import cascade
+from worker import minimizer
+from worker import rules
+from worker import schemas
+from worker import json_repair
+from worker import examples as few_shot_examples
 
 
 
 load_dotenv() 
 
+# the SDK is imported when the first model is created, not at worker or API startup
+from worker.providers import genai, GeminiProvider, ModelRouter, ProviderAPIError, estimate_tokens, truncated
+from worker.batching import BatchController
+from worker.hedging import Hedger, HedgeOutcome
+from worker.tokens import PromptTooLarge, TokenBudget, TokenBudgetExceeded, TokenEstimator
+
+class RequestCancelled(Exception):
+    pass
+
+def merge_responses(responses: list, sizes: list):
+    """
+    one response for the requests of a split batch, every request decoded on its own and its index
+    tags shifted by the invoices of the requests before
+    """
+    predictions, offset = [], 0
+    for response, size in zip(responses, sizes):
+        try:
+            chunk = json_repair.loads(response.text)
+        except json.JSONDecodeError:
+            # nothing recovered, its invoices are reported missing
+            chunk = []
+        for position, prediction in enumerate(chunk, start=1):
+            # untagged answers are in the order of their request
+            tag = prediction.get(schemas.INDEX_KEY)
+            prediction[schemas.INDEX_KEY] = (tag if isinstance(tag, int) else position) + offset
+            predictions.append(prediction)
+        offset += size
+    text = json.dumps(predictions)
+    usage = [_.usage_metadata for _ in responses]
+    return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(
+        prompt_token_count=sum(_.prompt_token_count for _ in usage),
+        candidates_token_count=sum(_.candidates_token_count for _ in usage),
+        total_token_count=sum(_.total_token_count for _ in usage),
+    ))
+
 class gemini:
-    def __init__(self,name:str = "gemini-2.5-pro"):
+    """
+    extraction pipeline, calls `name` on Gemini or, with a router, the model it picks for each batch
+    """
+    def __init__(self,name:str = "gemini-2.5-pro", router: ModelRouter | None = None, hedger: Hedger | None = None,
+                 tokens: TokenEstimator | None = None, budget: TokenBudget | None = None, structured_output: bool = True,
+                 batcher: BatchController | None = None, examples: few_shot_examples.ExampleBank | None = None,
+                 max_parallel_requests: int = 4, request_timeout_s: float | None = 300.0):
         self.name = name 
+        self.router = router
+        self.hedger = hedger
+        # splits the batch into the request size the controller picks, fed back from parse_and_validate
+        self.batcher = batcher
+        # few-shot examples picked per prompt from the bank, the fixed example without one
+        self.examples = examples
+        self.few_shot_report = None
+        # the rendered examples of the batch, selected once per prompt and reused by its chunk prompts
+        self.few_shot = None
+        self.batch_size = None
+        self.chunks = []
+        # answers cut off at the output token limit and the follow up requests they took, for the run
+        self.truncation = {"truncated_responses": 0, "continuation_calls": 0, "invoices_continued": 0}
+        # follow up requests running at once, the ones beside the call's own take the free limiter slots
+        self.max_parallel_requests = max(1, max_parallel_requests)
+        self.slots = None
+        self.workflow_id = None
+        # prompt sizes are estimated before every request, the budget refuses calls over its limits
+        self.tokens = tokens or TokenEstimator(use_provider=False)
+        self.budget = budget or TokenBudget()
+        # constrain the answer with a response schema built from the required fields of the batch
+        self.structured = structured_output
+        self.schema = None
+        self.tenant = None
+        self.minimize = False
+        self.minimize_report = None
+        # fields resolved by the rules are not asked from the model, `sent` are the invoices in the prompt
+        self.pre_extract = False
+        self.pre_extract_report = None
+        self.local_values = []
+        self.model_fields = []
+        self.sent = []
+        self.tokens_used = 0
+        # tokens held by the requests in flight, parallel requests check the workflow budget against both
+        self.tokens_reserved = 0
+        self.tokens_lock = threading.Lock()
+        self.estimates = []
+        self.last_hedge = HedgeOutcome()
+        self.route = None
+        self.model_name = name
+        self.tiers = []
+        self.tier = 0
+        self.tier_calls = []
+        if router is None:
+            self._configure()
+
+        # set from the activity when the workflow is cancelled, checked before every model request
+        self.cancelled = threading.Event()
+        self.deadline = None
+        # a cancelled request keeps its thread until it returns, without a deadline this bounds it
+        self.request_timeout_s = request_timeout_s
+
+        self.model_reponse=None
+        self.required_fields=[]
+        self.retry_prompt=""
+        self.evalution_result=None
+        self.validated_response=None
+        self.final_result=None
+
+    def _configure(self):
         try:
             api_key = os.getenv("GOOGLE_API_KEY")
             if not api_key:
                 raise ValueError("GOOGLE_API_KEY environment variable not set.")
-            genai.configure(api_key=api_key)
+            self.api_key = api_key
         except ValueError as e:
             print(f"Error: {e}")
             print("Please set your GOOGLE_API_KEY environment variable.")
             exit() 
 
-        self.model_reponse=None
-        self.retry_prompt=""
-        self.evalution_result=None
-        self.validated_response=None
+    def _create_model(self):
+        if self.tiers:
+            return self._tier_model(self.tier)
+        if self.router:
+            self.route = self.router.select(self.tokens.local(self.prompt), len(self.sent))
+            self.model_name = self.route.name
+            return self.route.get_provider()
+        return GeminiProvider(self.name, self.api_key)
+
+    def _tier_model(self, tier: int):
+        """
+        model of a cascade tier, a route of the router when it has one of that name, Gemini otherwise
+        """
+        self.model_name = self.tiers[tier]
+        self.route = self.router.route(self.model_name) if self.router else None
+        if self.route:
+            return self.route.get_provider()
+        return GeminiProvider(self.model_name, getattr(self, "api_key", None))
         
     def load_input(self,data:InvoiceData) -> dict:
         """
@@ -53,11 +177,24 @@ class gemini:
         #     "required": fields_to_extract
         # }
 
+        self.workflow_id = data.workflow_id
         self.inovices = [utils.normalize_text(_) for _ in data.context_input]
+        # the minimizer needs the line structure normalization removes
+        self.raw_inovices = list(data.context_input)
+        self.minimize = data.minimize
+        self.pre_extract = data.pre_extract
         self.output = None
         if data.output:
             self.output = data.output
         self.required_fields = data.fields_to_extract
+        self.model_fields = list(self.required_fields)
+        self.sent = list(range(len(self.inovices)))
+        self.deadline = data.deadline
+        self.tenant = data.tenant
+        # cascade: tier 0 sees the whole batch, every next tier only what the previous one got wrong
+        self.tiers = list(data.cascade or [])
+        self.tier = 0
+        self.tier_calls = []
 
         return {"status":"success","error" : "", "details": ""}
 
@@ -67,54 +204,347 @@ class gemini:
         build a single prompt with strict instructions
         """
 
+        self._pre_extract()
+        contexts = [self.inovices[_] for _ in self.sent]
+        fields = [self.model_fields[_] for _ in self.sent]
+
         # self.prompt = get_batched_prompt(self.inovices)
-        self.prompt = get_batched_prompt_with_fields(self.inovices,self.required_fields)
+        self.few_shot = self._few_shot(contexts, fields)
+        self.prompt = self._prompt(contexts, fields)
+        if self.structured:
+            self.schema = schemas.response_schema(fields)
+        if self.examples:
+            selected = self.tokens.local(self.few_shot)
+            fixed = self.tokens.local(few_shot())
+            self.few_shot_report = {
+                "examples": min(self.examples.k, len(self.examples.examples)),
+                "few_shot_tokens": selected,
+                "fixed_few_shot_tokens": fixed,
+                "tokens_saved": fixed - selected,
+                "selection_ms": self.examples.last_selection_ms,
+            }
+
+        if self.minimize:
+            # the model sees the minimized invoices, validation keeps using the original ones
+            self.minimized = minimizer.minimize_batch([self.raw_inovices[_] for _ in self.sent])
+            full = self.tokens.local(self.prompt)
+            self.prompt = self._prompt(self.minimized.contexts, fields, self.minimized.blocks)
+            reduced = self.tokens.local(self.prompt)
+            self.minimize_report = {
+                "prompt_tokens": full,
+                "minimized_prompt_tokens": reduced,
+                "token_reduction": 1 - reduced / full if full else 0.0,
+                "shared_blocks": len(self.minimized.blocks),
+                "lines_removed": self.minimized.lines_removed,
+            }
 
         return {"status":"success","error" : "", "details": ""}
 
+    def _pre_extract(self):
+        """
+        fills the fields the rules resolve with high confidence, invoices left without a field for the model are not sent
+        """
+        self.local_values = [{} for _ in self.inovices]
+        if self.pre_extract:
+            self.local_values = [rules.pre_extract(context, fields) for context, fields in zip(self.inovices, self.required_fields)]
+        self.model_fields = [[_ for _ in fields if _ not in local] for fields, local in zip(self.required_fields, self.local_values)]
+        self.sent = [i for i, fields in enumerate(self.model_fields) if fields]
+        if self.pre_extract:
+            self.pre_extract_report = {
+                "fields": sum(len(_) for _ in self.required_fields),
+                "fields_avoided": sum(len(_) for _ in self.local_values),
+                "invoices_skipped": len(self.inovices) - len(self.sent),
+                "calls_avoided": 0 if self.sent else 1,
+            }
+
+    def _with_local(self, i: int, extracted):
+        # the model never saw the locally resolved fields, they are merged back before validation
+        if not self.pre_extract or not isinstance(extracted, dict):
+            return extracted
+        return {**extracted, **self.local_values[i]}
+
+    def _prompt(self, contexts: list, required_fields: list, shared_blocks: list | None = None) -> str:
+        return get_batched_prompt_with_fields(contexts, required_fields, shared_blocks, structured=self.structured,
+                                              examples=self.few_shot)
+
+    def _contexts(self, ids: list) -> tuple:
+        """
+        (contexts, shared blocks) the model sees for invoices `ids`, minimized on their own when the
+        run minimizes, so a split batch, a follow up or a retry keeps the minimization
+        """
+        if not self.minimize:
+            return [self.inovices[_] for _ in ids], None
+        minimized = minimizer.minimize_batch([self.raw_inovices[_] for _ in ids])
+        return minimized.contexts, minimized.blocks
+
+    def _chunk_prompt(self, ids: list) -> str:
+        contexts, blocks = self._contexts(ids)
+        return self._prompt(contexts, [self.model_fields[_] for _ in ids], blocks)
+
+    def _few_shot(self, contexts: list, required_fields: list) -> str | None:
+        if not self.examples:
+            return None
+        return few_shot_examples.render(self.examples.select(contexts), required_fields)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _generate(self, prompt: str, invoices: int | None = None):
+        """
+        model request bounded by the workflow deadline, refused once the run was cancelled or
+        when its estimated tokens do not fit the budget
+        """
+        if self.cancelled.is_set():
+            raise RequestCancelled("Workflow was cancelled")
+        estimate, source = self.tokens.estimate(prompt, self.model)
+        reserved = estimate + self.tokens.output(len(self.sent) if invoices is None else invoices)
+        with self.tokens_lock:
+            self.budget.reserve(reserved, self.tokens_used + self.tokens_reserved, self.tenant)
+            self.tokens_reserved += reserved
+        try:
+            response = self._hedged(prompt)
+        except BaseException:
+            with self.tokens_lock:
+                self.tokens_reserved -= reserved
+            self.budget.settle(reserved, 0, self.tenant)
+            raise
+
+        usage = response.usage_metadata
+        with self.tokens_lock:
+            self.tokens_reserved -= reserved
+            self.tokens_used += usage.total_token_count
+        self.budget.settle(reserved, usage.total_token_count, self.tenant)
+        self.tokens.record(prompt, estimate, source, usage.prompt_token_count)
+        self.estimates.append((estimate, source, usage.prompt_token_count))
+        return response
+
+    def _hedged(self, prompt: str):
+        if not self.hedger:
+            return self._request(self.model, prompt)
+
+        hedge_model = self.model
+        if self.hedger.alternate and self.router:
+            hedge_model = self.router.select(self.tokens.local(prompt), len(self.sent), exclude=(self.model_name,)).get_provider()
+        response, self.last_hedge = self.hedger.call(
+            self.model_name,
+            lambda: self._request(self.model, prompt),
+            lambda: self._request(hedge_model, prompt),
+        )
+        return response
+
+    def _request(self, model, prompt: str):
+        kwargs = {"response_schema": self.schema} if self.schema else {}
+        timeout = self.request_timeout_s
+        if self.deadline:
+            remaining = self.deadline - time.time()
+            if remaining <= 0:
+                raise RequestCancelled("Request deadline exceeded")
+            timeout = min(timeout, remaining) if timeout else remaining
+        if not timeout:
+            return model.generate_content(prompt, **kwargs)
+        return model.generate_content(prompt, request_options={"timeout": timeout}, **kwargs)
+
+    def _split(self) -> list:
+        """
+        invoice indices per request, the batch is split when its prompt is over the per call limit
+        """
+        limit = self.budget.call_limit(self.route.max_input_tokens if self.route else None)
+        if not limit or self.tokens.local(self.prompt) <= limit:
+            return [list(self.sent)]
+
+        overhead = self.tokens.local(self._prompt([], []))
+        batches, current, size = [], [], overhead
+        for i in self.sent:
+            tokens = self.tokens.local(self._chunk_prompt([i])) - overhead
+            if overhead + tokens > limit:
+                raise PromptTooLarge(f"invoice {i} needs about {overhead + tokens} prompt tokens, the limit is {limit}")
+            if current and size + tokens > limit:
+                batches.append(current)
+                current, size = [], overhead
+            current.append(i)
+            size += tokens
+        batches.append(current)
+        return batches
+
     def call_model(self)->dict:
+        if self.pre_extract and not self.sent:
+            # every field was resolved by the rules
+            self.model_reponse = "[]"
+            self.latency = 0.0
+            self.metadata = {"model": None, "prompt_token_count": 0, "candidates_token_count": 0, "total_token_count": 0, "requests": 0}
+            return {"status":"success","error" : "", "details": ""}
         try:
-            self.model = genai.GenerativeModel(
-                        model_name=self.name,
-                        generation_config={
-                            "response_mime_type": "application/json",       
-                        }
-                    )
+            self.model = self._create_model()
+            batches = self._split()
+            if self.batcher:
+                self.batch_size = self.batcher.choose(len(self.sent), self.workflow_id)
+                batches = [ids[k:k + self.batch_size] for ids in batches for k in range(0, len(ids), self.batch_size)]
+            self.estimates = []
+            self.chunks = []
             
             start_time = time.time()
-            response = self.model.generate_content(self.prompt)
+            if len(batches) == 1:
+                responses = [self._generate(self.prompt, len(batches[0]))]
+                self.chunks = [(batches[0], time.time() - start_time, responses[0].usage_metadata.total_token_count)]
+            else:
+                # the chunks of a split batch run side by side, one after the other they could outlast the activity
+                timed = self._generate_many(batches, self._timed_chunk)
+                responses = [response for _, response in timed]
+                self.chunks = [(ids, latency, response.usage_metadata.total_token_count) for ids, (latency, response) in zip(batches, timed)]
+            if any(truncated(_) for _ in responses):
+                response = self._continue_truncated(batches, responses)
+            elif len(responses) == 1:
+                response = responses[0]
+            else:
+                response = merge_responses(responses, [len(_) for _ in batches])
             end_time = time.time()
             self.model_reponse = response.text
             self.latency = end_time - start_time 
             self.metadata = {
+                "model": self.model_name,
                 "prompt_token_count":response.usage_metadata.prompt_token_count,
                 "candidates_token_count": response.usage_metadata.candidates_token_count,
                 "total_token_count": response.usage_metadata.total_token_count,
+                "hedged": self.last_hedge.hedged,
+                "hedge_won": self.last_hedge.hedge_won,
+                "requests": len(batches) + self.truncation["continuation_calls"],
+                "batch_size": self.batch_size,
+                **self.truncation,
+                **self._estimate_metadata(),
             }
+            if self.route:
+                self.metadata["cost_usd"] = self.route.cost(self.metadata["prompt_token_count"], self.metadata["candidates_token_count"])
+                self.router.record(self.route, self.latency, self.metadata["total_token_count"], ok=True)
+            if self.tiers:
+                self.tier_calls.append(self._tier_call(len(self.sent), self.latency, response))
             return {"status":"success","error" : "", "details": ""}
-        except exceptions.GoogleAPICallError as e:
+        except (exceptions.GoogleAPICallError, ProviderAPIError) as e:
+            if self.route:
+                self.router.record(self.route, time.time() - start_time, estimate_tokens(self.prompt), ok=False)
             return {"status":"failed","error": "API call failed", "details": str(e)}
+        except RequestCancelled as e:
+            return {"status":"failed","error": "Request cancelled", "details": str(e)}
+        except TokenBudgetExceeded as e:
+            return {"status":"failed","error": "Token budget exceeded", "details": str(e)}
+        except PromptTooLarge as e:
+            return {"status":"failed","error": "Batch too large", "details": str(e)}
         except Exception as e:
             return {"status":"failed","error": "An unexpected error occurred", "details": str(e)}
 
+    def _answers(self, ids: list, response) -> dict:
+        """
+        invoice index -> answer of every invoice a response completed
+        """
+        try:
+            items = json_repair.loads(response.text)
+        except json.JSONDecodeError:
+            return {}
+        if not all(isinstance(_.get(schemas.INDEX_KEY), int) for _ in items):
+            return dict(zip(ids, items))
+        return {
+            ids[_[schemas.INDEX_KEY] - 1]: {k: v for k, v in _.items() if k != schemas.INDEX_KEY}
+            for _ in items if 1 <= _[schemas.INDEX_KEY] <= len(ids)
+        }
+
+    def _generate_many(self, batches: list, request=None) -> list:
+        """
+        the chunk or follow up requests, one in the limiter slot of the call and up to `max_parallel_requests - 1`
+        beside it in slots free right now, each request within the requests per minute budget
+        """
+        extra = 0
+        while extra < min(self.max_parallel_requests, len(batches)) - 1 and (not self.slots or self.slots.try_acquire()):
+            extra += 1
+        try:
+            with ThreadPoolExecutor(max_workers=extra + 1, thread_name_prefix="chunk") as executor:
+                return list(executor.map(request or self._follow_up, batches))
+        finally:
+            for _ in range(extra if self.slots else 0):
+                self.slots.release()
+
+    def _follow_up(self, ids: list):
+        if self.slots:
+            self.slots.request()
+        return self._generate(self._chunk_prompt(ids), len(ids))
+
+    def _timed_chunk(self, ids: list) -> tuple:
+        # the latency of the chunk alone feeds the batch size controller
+        started = time.time()
+        response = self._follow_up(ids)
+        return time.time() - started, response
+
+    def _continue_truncated(self, batches: list, responses: list):
+        """
+        keeps what the cut off answers completed and sends their remaining invoices again, in smaller
+        batches and in parallel, until every answer ended or an invoice alone does not fit
+        """
+        answers, usage = {}, []
+        pending = list(zip(batches, responses))
+        while pending:
+            follow = []
+            for ids, response in pending:
+                usage.append(response.usage_metadata)
+                kept = self._answers(ids, response)
+                answers.update(kept)
+                if not truncated(response):
+                    continue
+                self.truncation["truncated_responses"] += 1
+                rest = [_ for _ in ids if _ not in kept]
+                if not rest or (not kept and len(ids) == 1):
+                    continue
+                # the completed share is what fits, at least two follow ups run side by side
+                size = max(1, min(len(kept) or len(rest), math.ceil(len(rest) / 2)))
+                follow += [rest[k:k + size] for k in range(0, len(rest), size)]
+                self.truncation["invoices_continued"] += len(rest)
+            self.truncation["continuation_calls"] += len(follow)
+            if follow:
+                utils.log_structured(self.workflow_id, "call_model", status="truncated", follow_up_requests=len(follow),
+                                     invoices_continued=sum(len(_) for _ in follow))
+            pending = list(zip(follow, self._generate_many(follow))) if follow else []
+
+        # tagged with the position in the prompt, like one answer for the whole batch
+        text = json.dumps([{schemas.INDEX_KEY: k, **answers[i]} for k, i in enumerate(self.sent, 1) if i in answers])
+        return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(
+            prompt_token_count=sum(_.prompt_token_count for _ in usage),
+            candidates_token_count=sum(_.candidates_token_count for _ in usage),
+            total_token_count=sum(_.total_token_count for _ in usage),
+        ))
+
+    def _estimate_metadata(self) -> dict:
+        estimate = sum(_[0] for _ in self.estimates)
+        actual = sum(_[2] for _ in self.estimates)
+        return {
+            "token_estimate": estimate,
+            "token_estimate_source": "+".join(sorted({_[1] for _ in self.estimates})),
+            "token_estimate_error": (estimate - actual) / actual if actual else None,
+        }
+
     def parse_and_validate(self) ->dict:
         try:
-            extracted_responses = json.loads(self.model_reponse)
-            if type(extracted_responses[0]) == str:
-                extracted_responses = [ json.loads(_) for _ in extracted_responses]
+            extracted_responses, unaligned = schemas.decode(self.model_reponse, [self.model_fields[_] for _ in self.sent])
+            if self.pre_extract:
+                unaligned = {self.sent[k]: reason for k, reason in unaligned.items()}
+            extracted_responses = self._merge_local(extracted_responses)
             
         except json.JSONDecodeError as e:
+            self._record_batches(set(self.sent))
             return {"status":"failed","error": "Invalid JSON response from model", "details": str(e)}
 
         try:
             self.validated_response = []
             self.error_response = []
             for i in range(len(extracted_responses)):
+                if extracted_responses[i] is None:
+                    # only the invoices the model dropped or answered twice are asked again
+                    self.error_response.append((i, [unaligned[i]]))
+                    self.validated_response.append({})
+                    continue
                 validation_error = utils.validate_extracted_data(extracted_responses[i], self.inovices[i],self.required_fields[i])
                 if validation_error:
                     self.error_response.append((i,validation_error))
                 
                 self.validated_response.append(extracted_responses[i])
+            self._record_batches({i for i, _ in self.error_response})
+            self._flag_low_confidence(self.validated_response)
         except Exception as e:
             return {"status":"failed","error": "An unexpected error occurred", "details": str(e)}
         
@@ -125,6 +555,106 @@ class gemini:
 
 
 
+    def _merge_local(self, extracted_responses: list) -> list:
+        """
+        predictions of the whole batch, the model's answers for the invoices it was sent plus the local values
+        """
+        if not self.pre_extract:
+            return extracted_responses
+        merged = [dict(_) for _ in self.local_values]
+        for i, extracted in zip(self.sent, extracted_responses):
+            merged[i] = self._with_local(i, extracted)
+        return merged
+
+    def _record_batches(self, failed: set):
+        # the first answer of every request is what the batch size is judged on, retries are not
+        if self.batcher and self.batch_size:
+            for ids, latency, tokens in self.chunks:
+                self.batcher.record(self.batch_size, len(ids), latency, tokens, len(failed.intersection(ids)))
+        self.chunks = []
+
+    def _flag_low_confidence(self, extracted_responses: list, ids: list | None = None):
+        """
+        while a stronger tier is left, valid answers with too many empty fields are escalated too
+        """
+        if self.tier + 1 >= len(self.tiers):
+            return
+        ids = ids if ids is not None else list(range(len(extracted_responses)))
+        failing = {i for i, _ in self.error_response}
+        for i, extracted in zip(ids, extracted_responses):
+            reason = cascade.low_confidence(extracted, self.required_fields[i])
+            if reason and i not in failing:
+                self.error_response.append((i, [reason]))
+        self.error_response.sort(key=lambda _: _[0])
+
+    def _tier_call(self, invoices: int, latency: float, response) -> dict:
+        usage = response.usage_metadata
+        return {
+            "model": self.model_name,
+            "invoices": invoices,
+            "latency_s": latency,
+            "prompt_token_count": usage.prompt_token_count,
+            "candidates_token_count": usage.candidates_token_count,
+            "cost_usd": self.route.cost(usage.prompt_token_count, usage.candidates_token_count) if self.route else None,
+        }
+
+    def escalate(self) -> dict:
+        """
+        sends the invoices that failed validation or came back with low confidence to the next model tier
+        """
+        if not self.error_response:
+            return {"status":"success","error" : "", "details": ""}
+        if self.tier + 1 >= len(self.tiers):
+            return {"status":"failed","error": "No model tier left to escalate to", "details": ""}
+
+        self.tier += 1
+        ids = [i for i, _ in self.error_response]
+        prompt = self._chunk_prompt(ids)
+        start_time = time.time()
+        try:
+            self.model = self._tier_model(self.tier)
+            response = self._generate(prompt, len(ids))
+        except (exceptions.GoogleAPICallError, ProviderAPIError) as e:
+            if self.route:
+                self.router.record(self.route, time.time() - start_time, estimate_tokens(prompt), ok=False)
+            return {"status":"failed","error": "API call failed", "details": str(e)}
+        except RequestCancelled as e:
+            return {"status":"failed","error": "Request cancelled", "details": str(e)}
+        except TokenBudgetExceeded as e:
+            return {"status":"failed","error": "Token budget exceeded", "details": str(e)}
+        latency = time.time() - start_time
+        call = self._tier_call(len(ids), latency, response)
+        self.tier_calls.append(call)
+        if self.route:
+            self.router.record(self.route, latency, response.usage_metadata.total_token_count, ok=True)
+
+        try:
+            extracted_responses, unaligned = schemas.decode(response.text, [self.model_fields[i] for i in ids])
+            extracted_responses = [self._with_local(i, _) for i, _ in zip(ids, extracted_responses)]
+        except json.JSONDecodeError as e:
+            return {"status":"failed","error": "Invalid JSON response from model", "details": str(e)}
+
+        # the stronger tier's answer replaces the weaker one, valid or not, retries start from it
+        self.error_response = []
+        for k, (i, extracted) in enumerate(zip(ids, extracted_responses)):
+            if extracted is None:
+                # the weaker tier's answer stays until a retry replaces it
+                self.error_response.append((i, [unaligned[k]]))
+                continue
+            self.validated_response[i] = extracted
+            validation_error = utils.validate_extracted_data(extracted, self.inovices[i], self.required_fields[i])
+            if validation_error:
+                self.error_response.append((i, validation_error))
+        self.error_response += [(i, ["No answer from the escalated model"]) for i in ids[len(extracted_responses):]]
+        self._flag_low_confidence([self.validated_response[i] for i in ids], ids)
+
+        if self.error_response:
+            return {"status":"failed","error": "Failed in validation criteria from model response", "details": self.error_response}
+        return {"status":"success","error" : "", "details": ""}
+
+    def cascade_report(self) -> dict:
+        return cascade.report(self.tier_calls, len(self.inovices), self.tiers, self.router)
+
     def retry_model_call(self)->dict:
         """
         takes previously errorenous reponse, updates prompts with erros, and runs model 3 time to generate valid response,
@@ -135,22 +665,32 @@ class gemini:
         
         ids, erros = map(list, zip(*self.error_response))
         erroneous_context = [self.inovices[_] for _ in ids]
-        erroneous_required_filed = [self.required_fields[_] for _ in ids]
+        erroneous_required_filed = [self.model_fields[_] for _ in ids]
+        examples = self._few_shot(erroneous_context, erroneous_required_filed)
 
         for i in range(3):
-            prompt = retry_prompt(erroneous_context, erros, erroneous_required_filed)
-
-            response = self.model.generate_content(prompt)
-            extracted_responses = json.loads(response.text)
-            if extracted_responses and isinstance(extracted_responses[0], str):
-                extracted_responses = [json.loads(_) for _ in extracted_responses]
+            contexts, blocks = self._contexts(ids)
+            prompt = retry_prompt(contexts, erros, erroneous_required_filed, structured=self.structured,
+                                  examples=examples, shared_blocks=blocks)
+
+            try:
+                response = self._generate(prompt, len(erroneous_context))
+            except RequestCancelled as e:
+                return {"status":"failed","error": "Request cancelled", "details": str(e)}
+            except TokenBudgetExceeded as e:
+                return {"status":"failed","error": "Token budget exceeded", "details": str(e)}
+            extracted_responses, unaligned = schemas.decode(response.text, erroneous_required_filed)
             
             # Track successful validations
             successful_indices = []
             remaining_errors = []
             
             for j, extracted_response in enumerate(extracted_responses):
-                validation_error = utils.validate_extracted_data(extracted_response, erroneous_context[j])
+                if extracted_response is None:
+                    remaining_errors.append([unaligned[j]])
+                    continue
+                extracted_response = self._with_local(ids[j], extracted_response)
+                validation_error = utils.validate_extracted_data(extracted_response, erroneous_context[j], self.required_fields[ids[j]])
                 if validation_error:
                     remaining_errors.append(validation_error)
                 else:
@@ -180,9 +720,22 @@ class gemini:
         add evalution and summery 
         """
 
-        self.evalution_result = evaluate_field_extraction(self.validated_response,self.output)
-
-        return { "evalution_result " : self.evalution_result, "predictions" : self.validated_response}
+        # requests without ground truth only get predictions
+        if self.output:
+            self.evalution_result = evaluate_field_extraction(self.validated_response,self.output)
+
+        self.final_result = { "evalution_result " : self.evalution_result, "predictions" : self.validated_response}
+        if self.tiers:
+            self.final_result["cascade"] = self.cascade_report()
+        if self.minimize_report:
+            self.final_result["minimization"] = self.minimize_report
+        if self.pre_extract_report:
+            self.final_result["pre_extraction"] = self.pre_extract_report
+        if self.few_shot_report:
+            self.final_result["few_shot"] = self.few_shot_report
+        if self.truncation["truncated_responses"]:
+            self.final_result["truncation"] = dict(self.truncation)
+        return self.final_result
 
         
     def persist_artifact(self,path:Path):
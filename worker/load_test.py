@@ -0,0 +1,219 @@
+"""
+Offline end to end load generator.
+
+Starts a local Temporal dev server (`WorkflowEnvironment.start_local`) and an in-process worker
+whose LLM is a `SimulatedModel`, drives N concurrent `InformationExtraction` workflows and reports
+throughput, end to end latency percentiles and a per activity breakdown taken from the histories.
+
+    python -m worker.load_test --workflows 200 --concurrency 50 --batch-size 5
+    python -m worker.load_test --corpus invoices.jsonl --latency-median 2 --rate-limit-rate 0.05
+
+Pass `--temporal-cli /path/to/temporal` to run without downloading the dev server.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+
+from typing import Dict, List, Tuple
+from datetime import timedelta
+
+from temporalio.client import Client, WorkflowFailureError
+from temporalio.testing import WorkflowEnvironment
+from temporalio.worker import Worker
+from temporalio.api.enums.v1 import EventType
+
+from worker import datasets
+from worker.activities import LLMActivities
+from worker.shared import InvoiceData
+from worker.workflow import InformationExtraction
+from worker.synthetic import generate_corpus
+from worker.simulated_llm import SimulatedGemini, SimulatedModel, SimulationConfig
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Linear interpolated percentile, `p` in [0, 100].
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "mean_s": round(sum(values) / len(values), 4) if values else 0.0,
+        "p50_s": round(percentile(values, 50), 4),
+        "p95_s": round(percentile(values, 95), 4),
+        "p99_s": round(percentile(values, 99), 4),
+    }
+
+
+def load_corpus(path: str | None, n: int, seed: int = 0) -> Tuple[List[str], List[Dict]]:
+    """
+    Reads invoices from a dataset file (`Input` and `Final_Output` columns, see `worker.datasets`)
+    or generates `n` synthetic ones.
+    """
+    if not path:
+        contexts, outputs, _ = generate_corpus(n, seed)
+        return contexts, outputs
+
+    rows = list(datasets.iter_rows(path))
+    return [context for context, _ in rows], [output or {} for _, output in rows]
+
+
+_CLOSED_ACTIVITY_ATTRIBUTES = {
+    EventType.EVENT_TYPE_ACTIVITY_TASK_COMPLETED: "activity_task_completed_event_attributes",
+    EventType.EVENT_TYPE_ACTIVITY_TASK_FAILED: "activity_task_failed_event_attributes",
+    EventType.EVENT_TYPE_ACTIVITY_TASK_TIMED_OUT: "activity_task_timed_out_event_attributes",
+}
+
+
+def activity_durations(history) -> Dict[str, List[Tuple[float, float]]]:
+    """
+    Returns {activity: [(schedule_to_start_s, start_to_close_s), ...]} from a workflow history.
+    """
+    scheduled, started, durations = {}, {}, {}
+    for event in history.events:
+        if event.event_type == EventType.EVENT_TYPE_ACTIVITY_TASK_SCHEDULED:
+            attrs = event.activity_task_scheduled_event_attributes
+            scheduled[event.event_id] = (attrs.activity_type.name, event.event_time.ToDatetime())
+        elif event.event_type == EventType.EVENT_TYPE_ACTIVITY_TASK_STARTED:
+            started[event.activity_task_started_event_attributes.scheduled_event_id] = event.event_time.ToDatetime()
+        elif event.event_type in _CLOSED_ACTIVITY_ATTRIBUTES:
+            attrs = getattr(event, _CLOSED_ACTIVITY_ATTRIBUTES[event.event_type])
+            name, scheduled_at = scheduled[attrs.scheduled_event_id]
+            started_at = started.get(attrs.scheduled_event_id, scheduled_at)
+            finished_at = event.event_time.ToDatetime()
+            durations.setdefault(name, []).append(
+                ((started_at - scheduled_at).total_seconds(), (finished_at - started_at).total_seconds())
+            )
+    return durations
+
+
+async def drive(client: Client, task_queue: str, contexts: List[str], outputs: List[Dict],
+                workflows: int, concurrency: int, batch_size: int) -> Dict:
+    """
+    Runs `workflows` workflows, at most `concurrency` at a time, and builds the report.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, outcomes, activities = [], {"success": 0, "llm_error": 0, "failed": 0}, {}
+
+    async def one(i: int):
+        start = (i * batch_size) % len(contexts)
+        batch = [(start + j) % len(contexts) for j in range(batch_size)]
+        workflow_id = f"load-test-{uuid.uuid4()}"
+        data = InvoiceData(
+            context_input=[contexts[_] for _ in batch],
+            output=[outputs[_] for _ in batch],
+            fields_to_extract=[list(outputs[_].keys()) for _ in batch],
+            workflow_id=workflow_id,
+        )
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                result = await client.execute_workflow(
+                    InformationExtraction.run, data, id=workflow_id, task_queue=task_queue,
+                )
+                outcomes["success" if result.get("predictions") is not None else "llm_error"] += 1
+            except WorkflowFailureError:
+                outcomes["failed"] += 1
+            latencies.append(time.perf_counter() - t0)
+
+        history = await client.get_workflow_handle(workflow_id).fetch_history()
+        for name, values in activity_durations(history).items():
+            activities.setdefault(name, []).extend(values)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(workflows)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "workflows": workflows,
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "elapsed_s": round(elapsed, 3),
+        "workflows_per_s": round(workflows / elapsed, 3) if elapsed else 0.0,
+        "invoices_per_s": round(workflows * batch_size / elapsed, 3) if elapsed else 0.0,
+        "outcomes": outcomes,
+        "end_to_end": summarize(latencies),
+        "activities": {
+            name: {
+                "schedule_to_start": summarize([_[0] for _ in values]),
+                "start_to_close": summarize([_[1] for _ in values]),
+            }
+            for name, values in sorted(activities.items())
+        },
+    }
+
+
+async def run_load_test(args: argparse.Namespace) -> Dict:
+    contexts, outputs = load_corpus(args.corpus, max(args.workflows * args.batch_size, 1), args.seed)
+    model = SimulatedModel(SimulationConfig(
+        latency_median_s=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    ))
+    activities = LLMActivities(llm_factory=lambda: SimulatedGemini(model))
+    task_queue = f"load-test-{uuid.uuid4()}"
+
+    env = await WorkflowEnvironment.start_local(dev_server_existing_path=args.temporal_cli)
+    try:
+        async with Worker(
+            env.client,
+            task_queue=task_queue,
+            workflows=[InformationExtraction],
+            activities=[activities.load_input, activities.construct_prompt, activities.call_model, activities.parse_and_validate, activities.retry_model_call, activities.persist_artifact, activities.finalize],
+            max_concurrent_activities=args.max_concurrent_activities,
+            graceful_shutdown_timeout=timedelta(seconds=5),
+        ):
+            return await drive(env.client, task_queue, contexts, outputs, args.workflows, args.concurrency, args.batch_size)
+    finally:
+        await env.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load test of the InformationExtraction workflow")
+    parser.add_argument("--workflows", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--corpus", default=None, help="XLSX/CSV/JSONL/Parquet corpus, synthetic invoices when omitted")
+    parser.add_argument("--latency-median", type=float, default=1.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="probability of an injected 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of an injected 500")
+    parser.add_argument("--max-concurrent-activities", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--temporal-cli", default=None, help="existing temporal CLI binary, avoids the download")
+    parser.add_argument("--workdir", default=None, help="where run artifacts are written, a temp dir by default")
+    parser.add_argument("--output", default=None, help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    if args.corpus:
+        args.corpus = os.path.abspath(args.corpus)
+    # activities write ./runs/<workflow_id>, keep the load test artifacts out of the repo
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="load-test-"))
+
+    report = asyncio.run(run_load_test(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Prompt minimization for a batch of invoices.
+
+Invoices of one batch often carry the same footers, terms and bank blocks. Runs of lines that
+appear in several invoices are sent once as shared blocks and replaced by a `[[Bn]]` marker in
+each invoice, layout noise (separator lines, page numbers) is dropped. Every other line is
+kept, also when it repeats within an invoice, repeated table cells are values. The original
+texts are not changed and validation keeps running against them.
+"""
+import re
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from worker import utils
+
+# runs of shared lines shorter than this stay inline, short labels give the values next to them context
+MIN_BLOCK_CHARS = 40
+_NOISE = re.compile(r"^(?:[\W_]+|page \d+(?: of \d+)?)$")
+MARKER = "[[{}]]"
+
+
+@dataclass
+class MinimizedBatch:
+    # minimized invoices, one normalized line per kept line, [[Bn]] for a shared block
+    contexts: List[str]
+    # shared blocks, the first is B1
+    blocks: List[str]
+    lines_removed: int = 0
+
+
+def _lines(text: str) -> List[str]:
+    """
+    normalized non noise lines
+    """
+    lines = (utils.normalize_text(_) for _ in text.splitlines())
+    return [_ for _ in lines if _ and not _NOISE.match(_)]
+
+
+def _runs(lines: List[str], shared: set) -> List[Tuple[int, int]]:
+    """
+    [start, end) indices of the maximal runs of shared lines
+    """
+    runs, start = [], None
+    for i, line in enumerate(lines + [""]):
+        if line in shared and i < len(lines):
+            start = i if start is None else start
+        elif start is not None:
+            runs.append((start, i))
+            start = None
+    return runs
+
+
+def minimize_batch(contexts: List[str], min_block_chars: int = MIN_BLOCK_CHARS, min_invoices: int = 2) -> MinimizedBatch:
+    invoices = [_lines(_) for _ in contexts]
+    removed = sum(len([_ for _ in text.splitlines() if _.strip()]) for text in contexts) - sum(len(_) for _ in invoices)
+
+    counts = Counter(line for lines in invoices for line in set(lines))
+    shared = {line for line, count in counts.items() if count >= min_invoices}
+    runs = [_runs(lines, shared) for lines in invoices]
+    run_counts = Counter(tuple(lines[a:b]) for lines, invoice_runs in zip(invoices, runs) for a, b in invoice_runs)
+
+    blocks: List[str] = []
+    ids = {}
+    minimized = []
+    for lines, invoice_runs in zip(invoices, runs):
+        hoisted = {}
+        for a, b in invoice_runs:
+            key = tuple(lines[a:b])
+            if run_counts[key] >= min_invoices and sum(len(_) for _ in key) >= min_block_chars:
+                if key not in ids:
+                    blocks.append("\n".join(key))
+                    ids[key] = f"B{len(blocks)}"
+                hoisted[a] = (b, ids[key])
+
+        out, i = [], 0
+        while i < len(lines):
+            if i in hoisted:
+                i, block_id = hoisted[i]
+                out.append(MARKER.format(block_id))
+            else:
+                out.append(lines[i])
+                i += 1
+        minimized.append("\n".join(out))
+
+    return MinimizedBatch(contexts=minimized, blocks=blocks, lines_removed=removed)
@@ -0,0 +1,162 @@
+import os
+import glob
+import json
+import pstats
+import cProfile
+import argparse
+import threading
+import tracemalloc
+
+from typing import Callable, List, Dict
+
+# activities wrapped in cProfile/tracemalloc when a workflow opts in with `InvoiceData.profile`
+PROFILED_ACTIVITIES = set(
+    os.getenv("PROFILED_ACTIVITIES", "load_input,construct_prompt,parse_and_validate,finalize").split(",")
+)
+PROFILE_DIR_NAME = "profile"
+
+_PROFILE_LOCK = threading.Lock()
+_TRACING_LOCK = threading.Lock()
+# profiled runs holding tracemalloc, 0 when it was not started here
+_tracing_users = 0
+
+
+def run_profiled(func: Callable, *args, enabled: bool = False, output_dir: str = "", name: str = "", top_allocations: int = 25):
+    """
+    Runs `func(*args)`, optionally under cProfile and tracemalloc.
+
+    When `enabled` is false the function is called directly, so the only cost is this call.
+    Otherwise the cProfile stats are written to `<output_dir>/profile/<name>.prof` and the
+    peak traced memory plus the top allocation sites to `<output_dir>/profile/<name>_memory.json`.
+    """
+    if not enabled:
+        return func(*args)
+
+    # cProfile allows one active profiler per process, an overlapping run goes unprofiled
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        print(f"Profiling of {name} skipped, another profiled activity is running")
+        return func(*args)
+    try:
+        profile_dir = os.path.join(output_dir, PROFILE_DIR_NAME)
+        os.makedirs(profile_dir, exist_ok=True)
+        _start_tracing()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+    except Exception as e:
+        _PROFILE_LOCK.release()
+        print(f"Profiling of {name} skipped: {e}")
+        return func(*args)
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        try:
+            _save(profiler, before, profile_dir, name, top_allocations)
+        except Exception as e:
+            # profiling never fails the activity it measures
+            print(f"Saving the profile of {name} failed: {e}")
+        finally:
+            _stop_tracing()
+            _PROFILE_LOCK.release()
+
+
+def _start_tracing() -> None:
+    """
+    tracemalloc is process wide, it is started by the first user and stopped by the last
+    """
+    global _tracing_users
+    with _TRACING_LOCK:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            _tracing_users = 1
+        elif _tracing_users:
+            _tracing_users += 1
+
+
+def _stop_tracing() -> None:
+    global _tracing_users
+    with _TRACING_LOCK:
+        if _tracing_users:
+            _tracing_users -= 1
+            if _tracing_users == 0:
+                tracemalloc.stop()
+
+
+def _save(profiler: cProfile.Profile, before, profile_dir: str, name: str, top_allocations: int) -> None:
+    after = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    profiler.dump_stats(os.path.join(profile_dir, f"{name}.prof"))
+
+    allocations = [
+        {
+            "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_diff_bytes": stat.size_diff,
+            "count_diff": stat.count_diff,
+        }
+        for stat in after.compare_to(before, "lineno")[:top_allocations]
+    ]
+    memory = {
+        "activity": name,
+        "current_bytes": current,
+        "peak_bytes": peak,
+        "top_allocations": allocations,
+    }
+    with open(os.path.join(profile_dir, f"{name}_memory.json"), "w", encoding="utf-8") as f:
+        json.dump(memory, f, indent=2)
+
+
+def aggregate_profiles(runs_dir: str = "./runs", activity: str | None = None, top: int = 20, sort_by: str = "cumulative") -> List[Dict]:
+    """
+    Merges the cProfile stats saved under `<runs_dir>/*/profile/` and returns the hottest functions.
+
+    Args:
+        runs_dir: directory holding one sub directory per workflow run.
+        activity: only aggregate profiles of this activity, all activities when None.
+        top: number of functions to return.
+        sort_by: "cumulative" or "tottime".
+    """
+    pattern = os.path.join(runs_dir, "*", PROFILE_DIR_NAME, f"{activity or '*'}.prof")
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        return []
+
+    stats = pstats.Stats(paths[0])
+    if len(paths) > 1:
+        stats.add(*paths[1:])
+
+    key = 3 if sort_by == "cumulative" else 2
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][key], reverse=True)[:top]
+
+    return [
+        {
+            "function": f"{filename}:{lineno}({func_name})",
+            "primitive_calls": cc,
+            "total_calls": nc,
+            "tottime": round(tt, 6),
+            "cumtime": round(ct, 6),
+        }
+        for (filename, lineno, func_name), (cc, nc, tt, ct, _) in rows
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Aggregate activity profiles across workflow runs")
+    parser.add_argument("--runs-dir", default="./runs")
+    parser.add_argument("--activity", default=None)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--sort-by", choices=["cumulative", "tottime"], default="cumulative")
+    args = parser.parse_args()
+
+    rows = aggregate_profiles(args.runs_dir, args.activity, args.top, args.sort_by)
+    if not rows:
+        print(f"No profiles found under {args.runs_dir}")
+        return
+
+    print(f"{'cumtime':>10} {'tottime':>10} {'calls':>10}  function")
+    for row in rows:
+        print(f"{row['cumtime']:>10.4f} {row['tottime']:>10.4f} {row['total_calls']:>10}  {row['function']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -193,11 +193,12 @@ Extract the relevant entities from each input invoice text and structure them in
     prompt += """
 
 Respond with a **Python list of JSON strings**, where each string represents one extracted JSON object from each invoice above.
+`index` is the number of the invoice's INVOICE tag, answer every invoice once.
 
 Only return the final output in this format:
 [
-  '{"INVOICE_NUMBER": "...", ...}',
-  '{"INVOICE_NUMBER": "...", ...}',
+  '{"index": 1, "INVOICE_NUMBER": "...", ...}',
+  '{"index": 2, "INVOICE_NUMBER": "...", ...}',
   ...
 ]
 
@@ -205,9 +206,10 @@ Only return the final output in this format:
     return prompt
 
 
-def retry_prompt(contexts: list[str], error_list: list[str], required_fields: list[list[str]] = None) -> str:
+def retry_prompt(contexts: list[str], error_list: list[str], required_fields: list[list[str]] = None, structured: bool = False,
+                 examples: str | None = None, shared_blocks: list[str] | None = None) -> str:
     if required_fields:
-        prompt = get_batched_prompt_with_fields(contexts, required_fields)
+        prompt = get_batched_prompt_with_fields(contexts, required_fields, shared_blocks, structured=structured, examples=examples)
     else:
         prompt = get_batched_prompt(contexts)
 
@@ -222,7 +224,12 @@ def retry_prompt(contexts: list[str], error_list: list[str], required_fields: li
     prompt += error_prompt
     return prompt
 
-def get_batched_prompt_with_fields(contexts: list[str], required_fields: list[list[str]]) -> str:
+def get_batched_prompt_with_fields(contexts: list[str], required_fields: list[list[str]], shared_blocks: list[str] | None = None,
+                                   structured: bool = False, examples: str | None = None) -> str:
+    """
+    `structured` prompts go with a response schema, the answer is a JSON array of index tagged objects.
+    `examples` replaces the fixed few_shot() example, see worker/examples.py
+    """
     prompt = f"""
 You are provided with multiple invoice texts. Your task is to extract ONLY the specified entities for each invoice.
 
@@ -233,22 +240,35 @@ Instructions:
 4. Use Python list format for multiple items.
 
 # Example format:
-{few_shot()}
+{few_shot() if examples is None else examples}
 
 """
 
+    if shared_blocks:
+        prompt += "\nText shared by several invoices, [[Bn]] inside an invoice stands for the whole block Bn:\n"
+        for i, block in enumerate(shared_blocks, 1):
+            prompt += f"<SHARED_B{i}>\n{block}\n</SHARED_B{i}>\n"
+
     for i, (context, fields) in enumerate(zip(contexts, required_fields), 1):
         prompt += f"\n<INVOICE_{i}>\n"
         prompt += f"Required fields:\n [{', '.join(fields)}]\n"
         prompt += f"Context :\n{context.strip()}\n"
         prompt += f"</INVOICE_{i}>\n"
 
+    if structured:
+        prompt += """
+Respond with a JSON array with one object per invoice, `index` is the number of its INVOICE tag, answer every invoice once:
+[{"index": 1, "FIELD1": "...", "FIELD2": null}, ...]
+"""
+        return prompt
+
     prompt += """
 
-Respond with a **Python list of JSON strings**, extracting ONLY the required fields for each invoice:
+Respond with a **Python list of JSON strings**, extracting ONLY the required fields for each invoice.
+`index` is the number of the invoice's INVOICE tag, answer every invoice once:
 [
-  '{"FIELD1": "...", "FIELD2": "..."}',
-  '{"FIELD1": "...", "FIELD2": "..."}',
+  '{"index": 1, "FIELD1": "...", "FIELD2": "..."}',
+  '{"index": 2, "FIELD1": "...", "FIELD2": "..."}',
   ...
 ]
 """
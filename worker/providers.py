@@ -0,0 +1,272 @@
+"""
+Model providers and the router that picks one per request.
+
+A provider is anything with `generate_content(prompt, request_options=None, response_schema=None)` returning an object
+with `.text` and `.usage_metadata` (prompt, candidates and total token counts), the shape of a
+`google.generativeai` response. The Gemini SDK, any LiteLLM backend and the simulated model all
+fit it, so the extraction pipeline does not depend on a vendor. `finish_reason` reads why the
+answer ended from any of them.
+"""
+import os
+import json
+import math
+import threading
+
+from collections import deque
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+from worker import utils
+from worker import schemas
+
+# the SDKs are imported when the first model is created, not at worker or API startup
+genai = utils.LazyModule("google.generativeai")
+litellm = utils.LazyModule("litellm")
+
+# rough output size of one extracted invoice, used before any call was observed
+OUTPUT_TOKENS_PER_INVOICE = 80
+
+
+class ProviderAPIError(Exception):
+    """
+    a provider side failure (rate limit, timeout, server error) of a non Gemini backend
+    """
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def finish_reason(response) -> str | None:
+    """
+    why the answer ended, `finish_reason` of the response or of its first Gemini candidate
+    """
+    reason = getattr(response, "finish_reason", None)
+    if reason is None:
+        candidates = getattr(response, "candidates", None) or []
+        reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    name = getattr(reason, "name", reason)
+    return name if isinstance(name, str) else None
+
+
+def truncated(response) -> bool:
+    """
+    True when the answer was cut off at the output token limit
+    """
+    return finish_reason(response) in ("MAX_TOKENS", "length")
+
+
+class GeminiProvider:
+    def __init__(self, model_name: str, api_key: str | None = None):
+        self.model_name = model_name
+        genai.configure(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
+        self.model = genai.GenerativeModel(
+            model_name=model_name,
+            generation_config={"response_mime_type": "application/json"},
+        )
+
+    def generate_content(self, prompt: str, request_options: dict | None = None, response_schema: dict | None = None):
+        kwargs = {}
+        if request_options:
+            kwargs["request_options"] = request_options
+        if response_schema:
+            kwargs["generation_config"] = {"response_mime_type": "application/json", "response_schema": response_schema}
+        return self.model.generate_content(prompt, **kwargs)
+
+    def count_tokens(self, prompt: str) -> int:
+        return self.model.count_tokens(prompt).total_tokens
+
+
+class LiteLLMProvider:
+    """
+    any backend LiteLLM speaks to (OpenAI, Anthropic, Bedrock, vLLM, Ollama, ...), e.g. `openai/gpt-4o-mini`
+    """
+
+    def __init__(self, model_name: str, **completion_kwargs):
+        self.model_name = model_name
+        self.completion_kwargs = completion_kwargs
+
+    def count_tokens(self, prompt: str) -> int:
+        # the tokenizer of the backend, counted locally
+        return litellm.token_counter(model=self.model_name, messages=[{"role": "user", "content": prompt}])
+
+    def generate_content(self, prompt: str, request_options: dict | None = None, response_schema: dict | None = None):
+        response_format = {"type": "json_object"}
+        if response_schema:
+            # JSON schema response formats want an object at the top, the array is wrapped
+            response_format = {"type": "json_schema", "json_schema": {"name": "invoices", "strict": True, "schema": schemas.to_json_schema({
+                "type": "object", "properties": {"invoices": response_schema}, "required": ["invoices"],
+            })}}
+        try:
+            response = litellm.completion(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}],
+                response_format=response_format,
+                timeout=(request_options or {}).get("timeout"),
+                **self.completion_kwargs,
+            )
+        except ImportError:
+            raise
+        except Exception as e:
+            raise ProviderAPIError(f"{self.model_name}: {e}") from e
+
+        usage = response.usage
+        text = response.choices[0].message.content
+        if response_schema:
+            try:
+                text = json.dumps(json.loads(text)["invoices"])
+            except (json.JSONDecodeError, KeyError, TypeError):
+                # a cut off answer, the array is left for the tolerant parser
+                text = text[text.find("["):] if "[" in text else text
+        return SimpleNamespace(
+            text=text,
+            finish_reason=getattr(response.choices[0], "finish_reason", None),
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=usage.prompt_tokens,
+                candidates_token_count=usage.completion_tokens,
+                total_token_count=usage.total_tokens,
+            ),
+        )
+
+
+@dataclass
+class ModelRoute:
+    name: str
+    # builds the provider, called once per route
+    factory: Callable[[], object]
+    # USD per 1k tokens
+    cost_per_1k_input: float = 0.0
+    cost_per_1k_output: float = 0.0
+    max_input_tokens: int = 1_000_000
+    # latency assumed until calls were observed
+    prior_seconds_per_1k_tokens: float = 5.0
+    provider: object = field(default=None, repr=False)
+
+    def get_provider(self):
+        if self.provider is None:
+            self.provider = self.factory()
+        return self.provider
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens * self.cost_per_1k_input + output_tokens * self.cost_per_1k_output) / 1000
+
+
+class RollingStats:
+    """
+    Latency per token and errors of the last `window` calls of one route.
+    """
+
+    def __init__(self, window: int = 100):
+        self.calls = deque(maxlen=window)
+
+    def record(self, latency_s: float, tokens: int, ok: bool) -> None:
+        self.calls.append((latency_s / max(tokens, 1), ok))
+
+    def error_rate(self) -> float:
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls) if self.calls else 0.0
+
+    def seconds_per_token(self, quantile: float = 0.9) -> float | None:
+        values = sorted(latency for latency, ok in self.calls if ok)
+        if not values:
+            return None
+        return values[min(len(values) - 1, math.ceil(quantile * len(values)) - 1)]
+
+
+class ModelRouter:
+    """
+    Picks the cheapest route expected to answer within `latency_target_s`.
+
+    The expected latency of a route is the `quantile` of its recently observed seconds per token
+    times the tokens of the request, routes above `max_error_rate` or too small for the prompt are
+    skipped. When no route meets the target the fastest healthy one is used.
+    """
+
+    def __init__(self, routes: List[ModelRoute], latency_target_s: float = 60.0, max_error_rate: float = 0.2,
+                 quantile: float = 0.9, window: int = 100):
+        if not routes:
+            raise ValueError("ModelRouter needs at least one route")
+        self.routes = routes
+        self.latency_target_s = latency_target_s
+        self.max_error_rate = max_error_rate
+        self.quantile = quantile
+        self.stats: Dict[str, RollingStats] = {_.name: RollingStats(window) for _ in routes}
+        self.lock = threading.Lock()
+
+    def expected_latency(self, route: ModelRoute, tokens: int) -> float:
+        with self.lock:
+            per_token = self.stats[route.name].seconds_per_token(self.quantile)
+        if per_token is None:
+            per_token = route.prior_seconds_per_1k_tokens / 1000
+        return per_token * tokens
+
+    def route(self, name: str) -> ModelRoute | None:
+        return next((_ for _ in self.routes if _.name == name), None)
+
+    def select(self, prompt_tokens: int, batch_size: int, exclude: tuple = ()) -> ModelRoute:
+        output_tokens = batch_size * OUTPUT_TOKENS_PER_INVOICE
+        tokens = prompt_tokens + output_tokens
+        routes = [_ for _ in self.routes if _.name not in exclude] or self.routes
+        candidates = [_ for _ in routes if _.max_input_tokens >= prompt_tokens] or routes
+        with self.lock:
+            healthy = [_ for _ in candidates if self.stats[_.name].error_rate() <= self.max_error_rate]
+        candidates = healthy or candidates
+
+        latencies = {_.name: self.expected_latency(_, tokens) for _ in candidates}
+        on_target = [_ for _ in candidates if latencies[_.name] <= self.latency_target_s]
+        if on_target:
+            return min(on_target, key=lambda _: (_.cost(prompt_tokens, output_tokens), latencies[_.name]))
+        return min(candidates, key=lambda _: latencies[_.name])
+
+    def record(self, route: ModelRoute, latency_s: float, tokens: int, ok: bool) -> None:
+        with self.lock:
+            self.stats[route.name].record(latency_s, tokens, ok)
+
+
+def build_provider(spec: dict):
+    """
+    provider factory from a route spec: {"provider": "gemini" | "litellm" | "simulated", "model": ...}
+    """
+    kind = spec.get("provider", "gemini")
+    if kind == "gemini":
+        return lambda: GeminiProvider(spec["model"])
+    if kind == "litellm":
+        return lambda: LiteLLMProvider(spec["model"], **spec.get("options", {}))
+    if kind == "simulated":
+        from worker.simulated_llm import SimulatedModel, SimulationConfig
+        return lambda: SimulatedModel(SimulationConfig(**spec.get("options", {})))
+    raise ValueError(f"Unknown provider '{kind}', expected gemini, litellm or simulated")
+
+
+def router_from_config(config: dict) -> ModelRouter:
+    routes = [
+        ModelRoute(
+            name=spec.get("name") or spec["model"],
+            factory=build_provider(spec),
+            cost_per_1k_input=spec.get("cost_per_1k_input", 0.0),
+            cost_per_1k_output=spec.get("cost_per_1k_output", 0.0),
+            max_input_tokens=spec.get("max_input_tokens", 1_000_000),
+            prior_seconds_per_1k_tokens=spec.get("prior_seconds_per_1k_tokens", 5.0),
+        )
+        for spec in config["routes"]
+    ]
+    return ModelRouter(
+        routes,
+        latency_target_s=config.get("latency_target_s", 60.0),
+        max_error_rate=config.get("max_error_rate", 0.2),
+        quantile=config.get("quantile", 0.9),
+    )
+
+
+def router_from_env() -> ModelRouter | None:
+    """
+    `LLM_ROUTES` is a JSON file or inline JSON ({"routes": [...], "latency_target_s": ...}),
+    unset keeps the single Gemini model of the pipeline.
+    """
+    value = os.getenv("LLM_ROUTES")
+    if not value:
+        return None
+    if os.path.exists(value):
+        with open(value, encoding="utf-8") as f:
+            return router_from_config(json.load(f))
+    return router_from_config(json.loads(value))
@@ -0,0 +1,67 @@
+"""
+Rule based pre-extraction of the fields that follow fixed patterns.
+
+Every rule is a compiled, label anchored regex over the normalized invoice text. A field is only
+filled when its rule finds exactly one distinct value, anything ambiguous is left to the model.
+Values are slices of the normalized text, so they pass validation like a model answer would.
+"""
+import re
+
+from typing import Dict, List
+
+_MONTHS = r"(?:january|february|march|april|may|june|july|august|september|october|november|december|jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec)"
+_DATE = (
+    rf"\d{{1,2}} {_MONTHS},? \d{{4}}"
+    rf"|{_MONTHS} \d{{1,2}},? \d{{4}}"
+    r"|\d{4}-\d{2}-\d{2}"
+    r"|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}"
+)
+_AMOUNT = r"[$€£]? ?\d[\d,]*(?:\.\d{2})?"
+
+_INVOICE_NUMBER = re.compile(r"\binvoice (?:no|number|num|#)\.?\s*:?\s*(#?[a-z0-9/-]*\d[a-z0-9/-]*)")
+_DATE_OF_ISSUE = re.compile(rf"(?<!due )(?<!service )(?<!payment )\b(?:date of issue|issue date|invoice date|date)\s*:\s*({_DATE})\b")
+# amount due and balance due are what is left to pay, not the total
+_TOTAL_AMOUNT = re.compile(rf"\b(?:total due|grand total|total amount)\s*:?\s*({_AMOUNT})(?![\d,.])")
+_PLAIN_TOTAL = re.compile(rf"\btotal\s*:?\s*({_AMOUNT})(?![\d,.])")
+_ACCOUNT_NUMBER = re.compile(r"\b(?:account (?:no|number|#)|acct\.? no)\.?\s*:?\s*(\d[\d -]{4,}\d)\b")
+_EMAIL = re.compile(r"\b([a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,})\b")
+_PHONE = re.compile(r"\b(?:phone|tel|telephone)\.?\s*:?\s*(\+?\d[\d ().-]{6,}\d)\b")
+
+# required field name -> rule, synonyms share a rule
+RULES = {
+    "INVOICE_NUMBER": _INVOICE_NUMBER,
+    "DATE_OF_ISSUE": _DATE_OF_ISSUE,
+    "DATE": _DATE_OF_ISSUE,
+    "TOTAL_AMOUNT": _TOTAL_AMOUNT,
+    "GRAND_TOTAL": _TOTAL_AMOUNT,
+    "ACCOUNT_NUMBER": _ACCOUNT_NUMBER,
+    "EMAIL": _EMAIL,
+    "PHONE": _PHONE,
+}
+# rule -> unlabeled pattern of the same field, a value it finds that the rule did not makes the field ambiguous
+CONFLICTS = {
+    _TOTAL_AMOUNT: _PLAIN_TOTAL,
+}
+
+
+def extract_field(context: str, field: str) -> str | None:
+    rule = RULES.get(field.upper())
+    if rule is None:
+        return None
+    values = {_.strip() for _ in rule.findall(context)}
+    conflict = CONFLICTS.get(rule)
+    if conflict is not None and {_.strip() for _ in conflict.findall(context)} - values:
+        return None
+    return values.pop() if len(values) == 1 else None
+
+
+def pre_extract(context: str, fields: List[str]) -> Dict[str, str]:
+    """
+    the fields of `fields` resolved with high confidence from the normalized `context`
+    """
+    found = {}
+    for field in fields:
+        value = extract_field(context, field)
+        if value:
+            found[field] = value
+    return found
@@ -1,27 +1,76 @@
-
 import asyncio
+import math
 import os 
+from concurrent.futures import ThreadPoolExecutor
+
 from temporalio.client import Client
 from temporalio.worker import Worker
 
-from worker.activities import LLMActivities
-from worker.shared import INFORMATION_TASK_QUEUE_NAME
-from worker.workflow import InformationExtraction
+from worker.activities import LLMActivities, Sessions
+from worker.lanes import LaneLimiter, lane_slots
+from worker.llms import gemini
+from worker.providers import router_from_env
+from worker.batching import BatchController
+from worker.examples import ExampleBank
+from worker.hedging import Hedger
+from worker.tokens import TokenBudget, TokenEstimator
+from worker.shared import TASK_QUEUES
+from worker.workflow import BatchExtraction, InformationExtraction
 
 
 async def main() -> None:
     temporal_server_url = os.getenv("TEMPORAL_GRPC_ENDPOINT", "localhost:7233")
     print(f"Connecting to Temporal server at: {temporal_server_url}")
     client: Client = await Client.connect(temporal_server_url, namespace="default")
-    # Run the worker
-    activities = LLMActivities()
-    worker: Worker = Worker(
-        client,
-        task_queue=INFORMATION_TASK_QUEUE_NAME,
-        workflows=[InformationExtraction],
-        activities=[activities.load_input, activities.construct_prompt, activities.call_model, activities.parse_and_validate,activities.retry_model_call , activities.persist_artifact, activities.finalize],
-    )
-    await worker.run()
+
+    max_activities = int(os.getenv("WORKER_MAX_CONCURRENT_ACTIVITIES", "100"))
+    slots = lane_slots(max_activities, float(os.getenv("INTERACTIVE_SLOT_WEIGHT", "0.25")))
+    # activities block in threads, size the pool so a full bulk lane cannot starve the interactive one.
+    # A cancelled call frees its activity slot but keeps its thread until the request times out,
+    # the headroom keeps abandoned calls from taking the threads of new ones
+    headroom = float(os.getenv("WORKER_EXECUTOR_HEADROOM", "1.0"))
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max_activities + math.ceil(headroom * max_activities)))
+
+    # with LLM_ROUTES every batch goes to the model the router picks, all pipelines share its statistics
+    # and the hedger's latency window
+    router = router_from_env()
+    hedger = Hedger.from_env()
+    # token estimates calibrate on every call, tenant budgets are counted per worker
+    tokens, budget = TokenEstimator.from_env(), TokenBudget.from_env()
+    structured = os.getenv("LLM_RESPONSE_SCHEMA", "1") != "0"
+    # with LLM_BATCH_SIZES the request size is learned from latency and validation failures, kept across restarts
+    batcher = BatchController.from_env()
+    # with FEW_SHOT_BANK every prompt gets the nearest examples of the bank, indexed once here
+    examples = ExampleBank.from_env()
+    # follow ups of a cut off answer sent at once, extra ones only in free LLM_MAX_CONCURRENCY slots
+    parallel = int(os.getenv("LLM_MAX_PARALLEL_REQUESTS", "4"))
+    # every model request times out, also without a workflow deadline, 0 turns the limit off
+    request_timeout = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "300")) or None
+    activities = LLMActivities(llm_factory=lambda: gemini(router=router, hedger=hedger, tokens=tokens, budget=budget, structured_output=structured,
+                                                          batcher=batcher, examples=examples, max_parallel_requests=parallel,
+                                                          request_timeout_s=request_timeout), limiter=LaneLimiter(
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "0")),
+        requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+        interactive_reserved=float(os.getenv("INTERACTIVE_RESERVED_SHARE", "0.25")),
+    ), sessions=Sessions.from_env())
+    # one worker per lane, both share the activity sessions and the LLM budget
+    workers = [
+        Worker(
+            client,
+            task_queue=TASK_QUEUES[lane],
+            workflows=[InformationExtraction, BatchExtraction],
+            activities=[activities.load_input, activities.construct_prompt, activities.call_model, activities.parse_and_validate,activities.retry_model_call, activities.escalate, activities.persist_artifact, activities.finalize, activities.count_rows],
+            max_concurrent_activities=count,
+        )
+        for lane, count in slots.items()
+    ]
+    print(f"Polling {', '.join(f'{TASK_QUEUES[lane]} ({count} slots)' for lane, count in slots.items())}")
+    try:
+        await asyncio.gather(*(worker.run() for worker in workers))
+    finally:
+        if batcher:
+            # record() writes the state at most every 30s
+            batcher.flush()
 
 
 if __name__ == "__main__":
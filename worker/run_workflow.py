@@ -1,45 +1,191 @@
-import asyncio
-import traceback 
-import uuid
-import random
+"""
+Runs InformationExtraction workflows over a dataset.
+
+Rows are streamed from XLSX, CSV, JSONL or Parquet, grouped into batches and submitted with
+bounded concurrency. Progress is checkpointed, so an interrupted run resumes with the same command.
+
+    python -m worker.run_workflow invoices.xlsx --batch-size 20 --concurrency 8
+    python -m worker.run_workflow invoices.jsonl --checkpoint runs/invoices.checkpoint.json
+
+With --parent the batching runs server side in one BatchExtraction workflow instead, the dataset
+path must then be readable by the workers (e.g. on the shared runs volume):
+
+    python -m worker.run_workflow runs/invoices.jsonl --parent --batch-size 20 --concurrency 8
+"""
+import os
 import json
+import time
+import uuid
+import asyncio
+import argparse
 
-import pandas as pd
-from temporalio.client import Client, WorkflowFailureError
+from typing import Dict, List
 
-from worker.shared import InvoiceData, INFORMATION_TASK_QUEUE_NAME
-from worker.workflow import InformationExtraction
- 
+from temporalio.client import Client
+from temporalio.common import WorkflowIDReusePolicy
+from temporalio.exceptions import WorkflowAlreadyStartedError
 
+from worker import datasets
+from worker.shared import BatchJob, BATCH_WORKFLOW_NAME, INFORMATION_TASK_QUEUE_NAME, INFORMATION_WORKFLOW_NAME
 
+# failures kept in the summary, the counters still cover all of them
+MAX_REPORTED_FAILURES = 100
 
-async def main() -> None:
-    # Create client connected to server at the given address
-    client: Client = await Client.connect("localhost:7233")
-    df = pd.read_excel('/home/ajaysinh/Downloads/converted_invoice_dataset.xlsx')
-    df_sample = df[["Input","Final_Output"]].iloc[:1]
 
-    workflow_id = f"workflow-{str(uuid.uuid4())}"
+async def run_dataset(client: Client, path: str, batch_size: int = 20, concurrency: int = 8,
+                      checkpoint_path: str | None = None, task_queue: str = INFORMATION_TASK_QUEUE_NAME,
+                      input_column: str = "Input", output_column: str = "Final_Output",
+                      checkpoint_interval_s: float = 2.0, cascade: List[str] | None = None,
+                      minimize: bool = False, pre_extract: bool = False, fields: List[str] | None = None) -> Dict:
+    """
+    Submits one workflow per batch of `batch_size` rows, at most `concurrency` at a time.
+
+    Workflow ids are derived from the run id and the batch index, so a batch that was in flight
+    or finished when the previous run stopped is attached to instead of started twice.
+    """
+    checkpoint = datasets.Checkpoint(checkpoint_path, f"dataset-{uuid.uuid4()}", batch_size)
+    semaphore = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    summary = {
+        "run_id": checkpoint.run_id,
+        "source": path,
+        "batch_size": batch_size,
+        "batches_submitted": 0,
+        "batches_skipped": 0,
+        "batches_succeeded": 0,
+        "batches_llm_error": 0,
+        "batches_failed": 0,
+        "invoices_processed": 0,
+        "failures": [],
+    }
+    last_saved = time.monotonic()
+
+    async def run_batch(index: int, rows) -> None:
+        nonlocal last_saved
+        workflow_id = f"{checkpoint.run_id}-batch-{index}"
+        try:
+            try:
+                handle = await client.start_workflow(
+                    INFORMATION_WORKFLOW_NAME,
+                    datasets.build_invoice_data(rows, workflow_id, fields, cascade=cascade, minimize=minimize, pre_extract=pre_extract),
+                    id=workflow_id,
+                    task_queue=task_queue,
+                    # a batch that completed before the interruption is read back, a failed one runs again
+                    id_reuse_policy=WorkflowIDReusePolicy.ALLOW_DUPLICATE_FAILED_ONLY,
+                )
+            except WorkflowAlreadyStartedError:
+                handle = client.get_workflow_handle(workflow_id)
+            result = await handle.result()
 
-    data: InvoiceData = InvoiceData(
-        context_input=df_sample['Input'].values.tolist(),
-        fields_to_extract=[list(json.loads(_).keys()) for _ in df_sample['Final_Output']],
-        output=[json.loads(_) for _ in df_sample['Final_Output']],
-        workflow_id=workflow_id,
+            if result.get("predictions") is None:
+                summary["batches_llm_error"] += 1
+            else:
+                summary["batches_succeeded"] += 1
+            summary["invoices_processed"] += len(rows)
+            checkpoint.mark_done(index)
+        except Exception as e:
+            summary["batches_failed"] += 1
+            if len(summary["failures"]) < MAX_REPORTED_FAILURES:
+                summary["failures"].append({"batch": index, "workflow_id": workflow_id, "error": str(e)})
+        finally:
+            semaphore.release()
+            if time.monotonic() - last_saved >= checkpoint_interval_s:
+                checkpoint.save()
+                last_saved = time.monotonic()
+
+    started = time.perf_counter()
+    rows = datasets.iter_rows(path, input_column, output_column)
+    for index, batch in datasets.iter_batches(rows, batch_size):
+        if checkpoint.is_done(index):
+            summary["batches_skipped"] += 1
+            continue
+        # the reader only advances when a slot is free, memory stays bounded by the concurrency
+        await semaphore.acquire()
+        task = asyncio.create_task(run_batch(index, batch))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        summary["batches_submitted"] += 1
+
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    checkpoint.save()
+
+    elapsed = time.perf_counter() - started
+    summary["elapsed_s"] = round(elapsed, 3)
+    summary["invoices_per_s"] = round(summary["invoices_processed"] / elapsed, 3) if elapsed else 0.0
+    summary["batches_per_s"] = round(
+        (summary["batches_succeeded"] + summary["batches_llm_error"]) / elapsed, 3
+    ) if elapsed else 0.0
+    return summary
+
+
+async def run_batch_job(client: Client, path: str, batch_size: int = 20, concurrency: int = 8,
+                        task_queue: str = INFORMATION_TASK_QUEUE_NAME, input_column: str = "Input",
+                        output_column: str = "Final_Output", cascade: List[str] | None = None,
+                        minimize: bool = False, pre_extract: bool = False, fields: List[str] | None = None) -> Dict:
+    """
+    Runs the dataset as one BatchExtraction parent workflow and returns its merged summary and metrics.
+    """
+    job = BatchJob(
+        job_id=f"batch-{uuid.uuid4()}",
+        source=os.path.abspath(path),
+        chunk_size=batch_size,
+        max_concurrent_children=concurrency,
+        input_column=input_column,
+        output_column=output_column,
+        fields=fields,
+        cascade=cascade,
+        minimize=minimize,
+        pre_extract=pre_extract,
     )
+    print(f"Starting {BATCH_WORKFLOW_NAME} {job.job_id}")
+    return await client.execute_workflow(BATCH_WORKFLOW_NAME, job, id=job.job_id, task_queue=task_queue)
+
 
-    try:
-        result = await client.execute_workflow(
-            InformationExtraction.run,
-            data,
-            id=workflow_id,
-            task_queue=INFORMATION_TASK_QUEUE_NAME,
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Run InformationExtraction over a dataset file")
+    parser.add_argument("path", help="XLSX, CSV, JSONL or Parquet file")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--input-column", default="Input")
+    parser.add_argument("--output-column", default="Final_Output")
+    parser.add_argument("--checkpoint", default=None, help="defaults to runs/<dataset name>.checkpoint.json")
+    parser.add_argument("--summary", default=None, help="defaults to runs/<dataset name>.summary.json")
+    parser.add_argument("--task-queue", default=INFORMATION_TASK_QUEUE_NAME)
+    parser.add_argument("--parent", action="store_true", help="run as one BatchExtraction workflow with child workflows")
+    parser.add_argument("--minimize", action="store_true", help="send text shared by the invoices of a batch once")
+    parser.add_argument("--pre-extract", action="store_true", help="resolve pattern like fields with rules before the model")
+    parser.add_argument("--fields", default=None, help="comma separated fields for rows without ground truth, defaults to the required fields")
+    parser.add_argument("--cascade", default=None, help="comma separated model tiers, cheapest first, e.g. gemini-2.5-flash,gemini-2.5-pro")
+    args = parser.parse_args()
+
+    cascade = [_ for _ in args.cascade.split(",") if _] if args.cascade else None
+    fields = [_.strip() for _ in args.fields.split(",") if _.strip()] if args.fields else None
+    name = os.path.splitext(os.path.basename(args.path))[0]
+    checkpoint_path = args.checkpoint or os.path.join("runs", f"{name}.checkpoint.json")
+    summary_path = args.summary or os.path.join("runs", f"{name}.summary.json")
+
+    # Create client connected to server at the given address
+    client: Client = await Client.connect(os.getenv("TEMPORAL_GRPC_ENDPOINT", "localhost:7233"))
+    if args.parent:
+        result = await run_batch_job(
+            client, args.path, args.batch_size, args.concurrency, args.task_queue, args.input_column, args.output_column, cascade, args.minimize,
+            args.pre_extract, fields,
         )
+        print(json.dumps(result["metrics"], indent=2))
+        return
 
-        print(f"Result: {result}")
+    summary = await run_dataset(
+        client, args.path, args.batch_size, args.concurrency, checkpoint_path,
+        args.task_queue, args.input_column, args.output_column, cascade=cascade, minimize=args.minimize,
+        pre_extract=args.pre_extract, fields=fields,
+    )
 
-    except WorkflowFailureError:
-        print("Got expected exception: ", traceback.format_exc())
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps({k: v for k, v in summary.items() if k != "failures"}, indent=2))
+    print(f"Summary written to {summary_path}")
 
 
 if __name__ == "__main__":
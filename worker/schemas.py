@@ -0,0 +1,101 @@
+"""
+Response schemas for the batched extraction prompt.
+
+The schema is built from the required fields of a batch: an array with one object per invoice,
+tagged with the `index` of its <INVOICE_n> block, every field a nullable string, or a nullable
+list of strings for the line item fields. The model answers with plain objects, parsed once, and
+answers are placed by their index, so a dropped or repeated invoice only fails that invoice.
+"""
+from typing import Dict, List, Tuple
+
+from worker import json_repair
+
+INDEX_KEY = "index"
+MISSING = "No answer for this invoice in the model response"
+DUPLICATED = "Different answers for this invoice in the model response"
+# fields with one value per line item
+LIST_FIELDS = {"ITEM_DESCRIPTION", "QTY", "QUANTITY", "UNIT_PRICE", "PRICE", "AMOUNT"}
+
+
+def response_schema(required_fields: List[List[str]]) -> dict:
+    """
+    OpenAPI subset schema as `response_schema` of the Gemini SDK expects it
+    """
+    fields = sorted({field for fields in required_fields for field in fields})
+    properties = {INDEX_KEY: {"type": "integer"}}
+    for field in fields:
+        if field in LIST_FIELDS:
+            properties[field] = {"type": "array", "items": {"type": "string"}, "nullable": True}
+        else:
+            properties[field] = {"type": "string", "nullable": True}
+    return {
+        "type": "array",
+        "items": {"type": "object", "properties": properties, "required": [INDEX_KEY]},
+    }
+
+
+def to_json_schema(schema: dict) -> dict:
+    """
+    the same schema in JSON Schema for strict mode: nullable types become ["type", "null"] and
+    every property is required, a field without a value is answered with null
+    """
+    converted = {key: value for key, value in schema.items() if key != "nullable"}
+    if schema.get("nullable"):
+        converted["type"] = [schema["type"], "null"]
+    if "items" in schema:
+        converted["items"] = to_json_schema(schema["items"])
+    if "properties" in schema:
+        converted["properties"] = {key: to_json_schema(value) for key, value in schema["properties"].items()}
+        converted["required"] = list(schema["properties"])
+        converted["additionalProperties"] = False
+    return converted
+
+
+def _value(value):
+    # a single line item comes back as a plain string, like the unconstrained prompt answers
+    if isinstance(value, list):
+        if not value:
+            return None
+        return value[0] if len(value) == 1 else value
+    return value
+
+
+def decode(text: str, required_fields: List[List[str]]) -> Tuple[list, Dict[int, str]]:
+    """
+    predictions of a response, one per invoice in prompt order with only its required fields, and
+    the positions that are missing or were answered twice with the reason. Those positions hold None.
+    Damaged answers keep their complete invoices (see json_repair), untagged answers are taken in order.
+    """
+    extracted = json_repair.loads(text)
+    if not all(isinstance(_.get(INDEX_KEY), int) for _ in extracted):
+        predictions = [{k: v for k, v in _.items() if k != INDEX_KEY} for _ in extracted]
+        # without tags only a cut off end can be told apart
+        missing = range(len(predictions), len(required_fields))
+        return predictions + [None for _ in missing], {i: MISSING for i in missing}
+    if not required_fields:
+        # nothing to align to, the tags only give the order
+        return [{k: _value(v) for k, v in _.items() if k != INDEX_KEY} for _ in sorted(extracted, key=lambda _: _[INDEX_KEY])], {}
+    return align(extracted, required_fields)
+
+
+def align(extracted: List[dict], required_fields: List[List[str]]) -> Tuple[list, Dict[int, str]]:
+    """
+    places every index tagged answer at its invoice, tags outside the batch are dropped
+    """
+    predictions: list = [None] * len(required_fields)
+    unaligned = {}
+    for item in extracted:
+        i = item[INDEX_KEY] - 1
+        if not 0 <= i < len(required_fields) or i in unaligned:
+            continue
+        prediction = {field: _value(item.get(field)) for field in required_fields[i]}
+        if predictions[i] is not None and predictions[i] != prediction:
+            # two different answers for one invoice, neither can be trusted
+            predictions[i] = None
+            unaligned[i] = DUPLICATED
+            continue
+        predictions[i] = prediction
+    for i, prediction in enumerate(predictions):
+        if prediction is None and i not in unaligned:
+            unaligned[i] = MISSING
+    return predictions, unaligned
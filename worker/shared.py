@@ -1,16 +1,80 @@
 from dataclasses import dataclass
 from typing import List
 
+# lightweight workflow interface, the API starts workflows by name and never imports the worker code
 INFORMATION_TASK_QUEUE_NAME = "INFORMATION_TASK_QUEUE"
+# single invoice requests run on their own queue so they never wait behind batch jobs
+INTERACTIVE_TASK_QUEUE_NAME = "INFORMATION_TASK_QUEUE_INTERACTIVE"
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+TASK_QUEUES = {PRIORITY_INTERACTIVE: INTERACTIVE_TASK_QUEUE_NAME, PRIORITY_BULK: INFORMATION_TASK_QUEUE_NAME}
+INFORMATION_WORKFLOW_NAME = "InformationExtraction"
+BATCH_WORKFLOW_NAME = "BatchExtraction"
+# keyword search attribute set by the API, register it on the server (`--search-attribute BatchTag=Keyword`)
+BATCH_TAG_SEARCH_ATTRIBUTE = "BatchTag"
+@dataclass
+class DatasetSlice:
+    """
+    rows [offset, offset + limit) of a dataset file the workers can read, instead of the invoices themselves
+    """
+    path: str
+    offset: int
+    limit: int
+    input_column: str = "Input"
+    output_column: str = "Final_Output"
+    # fields asked for the rows without ground truth, REQUIRED_FIELDS when None
+    fields: List[str] | None = None
+
 @dataclass
 class InvoiceData:
     context_input: List[str] 
     output:List[dict]
     fields_to_extract : list
     workflow_id: str
+    # wrap selected activities in cProfile/tracemalloc and save the stats with the run artifacts
+    profile: bool = False
+    # lane of the workflow, activities run on the task queue of the workflow
+    priority: str = PRIORITY_BULK
+    # load_input reads the invoices from here when set, keeps large batches out of the workflow history
+    source: DatasetSlice | None = None
+    # return a mergeable evaluation summary instead of every prediction, used by BatchExtraction children
+    summary_only: bool = False
+    # unix time the caller stops waiting, caps every activity timeout and the model request timeout
+    deadline: float | None = None
+    # model tiers, cheapest first: invoices failing validation or with low confidence move to the next one
+    cascade: List[str] | None = None
+    # caller the worker's per tenant token budget is charged to
+    tenant: str | None = None
+    # send text shared by several invoices once and drop layout noise, see worker/minimizer.py
+    minimize: bool = False
+    # fill pattern like fields with the rules of worker/rules.py, the model only gets the rest
+    pre_extract: bool = False
+
+@dataclass
+class BatchJob:
+    job_id: str
+    source: str
+    chunk_size: int = 20
+    max_concurrent_children: int = 8
+    # children started by one run before it continues as new, bounds the parent history
+    chunks_per_run: int = 200
+    input_column: str = "Input"
+    output_column: str = "Final_Output"
+    fields: List[str] | None = None
+    priority: str = PRIORITY_BULK
+    profile: bool = False
+    cascade: List[str] | None = None
+    tenant: str | None = None
+    minimize: bool = False
+    pre_extract: bool = False
+    # carried over continue-as-new
+    total: int | None = None
+    next_offset: int = 0
+    summary: dict | None = None
+    runs: int = 1
 
 # class InvoiceData:
 #     context_input: str 
 #     fields_to_extract : list
 #     output:dict
-#     workflow_id: str
\ No newline at end of file
+#     workflow_id: str
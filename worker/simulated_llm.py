@@ -0,0 +1,135 @@
+import re
+import math
+import time
+import json
+import random
+import threading
+
+from dataclasses import dataclass
+from types import SimpleNamespace
+from google.api_core import exceptions
+
+from worker.llms import gemini
+from worker.schemas import INDEX_KEY, LIST_FIELDS
+from worker.synthetic import extract_labeled_fields
+
+_INVOICE_BLOCK = re.compile(
+    r"<INVOICE_(\d+)>\s*Required fields:\s*\[(.*?)\]\s*Context :\s*(.*?)</INVOICE_\1>",
+    re.DOTALL,
+)
+_SHARED_BLOCK = re.compile(r"<SHARED_(B\d+)>\n(.*?)\n</SHARED_\1>", re.DOTALL)
+
+
+@dataclass
+class SimulationConfig:
+    # per call latency is lognormal around the median, plus the output tokens at `tokens_per_second`
+    latency_median_s: float = 1.0
+    latency_sigma: float = 0.5
+    tokens_per_second: float = 200.0
+    # probability of a 429 (ResourceExhausted) and of a 500 (InternalServerError) per call
+    rate_limit_rate: float = 0.0
+    error_rate: float = 0.0
+    # probability that the answer for an invoice is left out of the response
+    drop_rate: float = 0.0
+    # answers longer than this are cut off like at the output token limit, 0 is no limit
+    max_output_tokens: int = 0
+    seed: int | None = None
+
+
+def _constrained(field: str, value):
+    if field in LIST_FIELDS:
+        return value if isinstance(value, list) or value is None else [value]
+    return value[0] if isinstance(value, list) else value
+
+
+class SimulatedModel:
+    """
+    Stands in for `genai.GenerativeModel`, answering batched prompts without any network call.
+
+    Field values are read back from the invoice text with the synthetic corpus labels,
+    so synthetic invoices pass validation.
+    """
+
+    def __init__(self, config: SimulationConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+
+    def sample_latency(self, output_tokens: int) -> float:
+        with self.lock:
+            base = self.config.latency_median_s * math.exp(self.rng.gauss(0, self.config.latency_sigma))
+        return base + output_tokens / self.config.tokens_per_second
+
+    def _maybe_fail(self):
+        with self.lock:
+            draw = self.rng.random()
+        if draw < self.config.rate_limit_rate:
+            raise exceptions.ResourceExhausted("429 simulated rate limit")
+        if draw < self.config.rate_limit_rate + self.config.error_rate:
+            raise exceptions.InternalServerError("500 simulated model error")
+
+    def generate_content(self, prompt: str, response_schema: dict | None = None, **kwargs):
+        self._maybe_fail()
+
+        # like a model, reads the shared blocks of a minimized prompt where their markers are
+        blocks = {f"[[{m.group(1)}]]": m.group(2) for m in _SHARED_BLOCK.finditer(prompt)}
+        predictions = []
+        for match in _INVOICE_BLOCK.finditer(prompt):
+            # INVOICE_0 is the few shot example
+            if match.group(1) == "0":
+                continue
+            fields = [_.strip() for _ in match.group(2).split(",") if _.strip()]
+            context = match.group(3)
+            for marker, block in blocks.items():
+                context = context.replace(marker, block)
+            predictions.append((int(match.group(1)), extract_labeled_fields(context, fields)))
+        if self.config.drop_rate:
+            with self.lock:
+                predictions = [_ for _ in predictions if self.rng.random() >= self.config.drop_rate]
+
+        if response_schema:
+            # answers in the shape of the schema, the line item fields always as lists
+            text = json.dumps([
+                {INDEX_KEY: i, **{field: _constrained(field, value) for field, value in prediction.items()}}
+                for i, prediction in predictions
+            ])
+        else:
+            text = json.dumps([json.dumps({INDEX_KEY: i, **prediction}) for i, prediction in predictions])
+        reason = "STOP"
+        if self.config.max_output_tokens and len(text) // 4 > self.config.max_output_tokens:
+            text, reason = text[:self.config.max_output_tokens * 4], "MAX_TOKENS"
+        prompt_tokens, output_tokens = len(prompt) // 4, len(text) // 4
+        latency = self.sample_latency(output_tokens)
+        # like the SDK, a request timeout (the workflow deadline) ends the call early
+        timeout = (kwargs.get("request_options") or {}).get("timeout")
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise exceptions.DeadlineExceeded("504 simulated request timeout")
+        time.sleep(latency)
+
+        return SimpleNamespace(
+            text=text,
+            finish_reason=reason,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=output_tokens,
+                total_token_count=prompt_tokens + output_tokens,
+            ),
+        )
+
+
+class SimulatedGemini(gemini):
+    """
+    `gemini` pipeline backed by a `SimulatedModel`, used by the load generator and tests.
+    """
+
+    def __init__(self, model: SimulatedModel | None = None, name: str = "simulated"):
+        # share one model between pipelines so latency and errors are drawn from a single stream
+        self.simulated_model = model or SimulatedModel(SimulationConfig())
+        super().__init__(name=name)
+
+    def _configure(self):
+        pass
+
+    def _create_model(self):
+        return self.simulated_model
@@ -0,0 +1,149 @@
+import re
+import json
+import random
+
+from typing import List, Dict, Tuple
+
+# label printed in front of each value in a synthetic invoice, used to generate and to read back values
+FIELD_LABELS = {
+    "INVOICE_NUMBER": "Invoice No",
+    "DATE_OF_ISSUE": "Date",
+    "BILLED_TO": "Billed To",
+    "ADDRESS": "Address",
+    "PHONE": "Phone",
+    "EMAIL": "Email",
+    "ITEM_DESCRIPTION": "Item",
+    "QTY": "Qty",
+    "UNIT_PRICE": "Unit Price",
+    "AMOUNT": "Amount",
+    "TOTAL_AMOUNT": "Total Due",
+    "BANK_NAME": "Bank",
+    "ACCOUNT_NAME": "Account Name",
+    "ACCOUNT_NUMBER": "Account No",
+}
+
+_COMPANIES = ["Borcelle", "Salford & Co.", "Larana Inc.", "Fauget Studio", "Arowwai Industries", "Wardiere Ltd."]
+_NAMES = ["Estelle Darcy", "Olivia Wilson", "Kimberly Nguyen", "Marceline Anderson", "Avery Davis", "Helena Paquet"]
+_STREETS = ["Anywhere St.", "Main Road", "Market Lane", "Harbour View", "Elm Avenue"]
+_CITIES = ["Any City", "Fairview", "Riverside", "Lakewood"]
+_ITEMS = ["Website Development", "Graphic Design", "Consulting Services", "Grilled Chicken", "Full body massage", "Logo Design", "Catering", "Photography"]
+_BANKS = ["Borcelle Bank", "Fauget Bank", "Larana Savings", "Really Great Bank"]
+_MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+_FOOTER = [
+    "Notes: Thank you for your business!",
+    "Payment is due 30 days from the invoice date.",
+    "Please include the invoice number with your payment.",
+    "www.reallygreatsite.com",
+]
+
+
+def synthetic_invoice(rng: random.Random, n_items: int | None = None) -> Tuple[str, Dict]:
+    """
+    Generates one invoice text and its ground truth.
+    """
+    n_items = n_items or rng.randint(1, 4)
+    items = []
+    for _ in range(n_items):
+        qty = rng.randint(1, 9)
+        price = rng.randint(10, 900)
+        items.append((rng.choice(_ITEMS), str(qty), f"${price:.2f}", f"${qty * price:.2f}"))
+    total = sum(float(item[3][1:]) for item in items)
+
+    truth = {
+        "INVOICE_NUMBER": f"#{rng.randint(10000, 99999)}",
+        "DATE_OF_ISSUE": f"{rng.randint(1, 28)} {rng.choice(_MONTHS)} {rng.randint(2020, 2030)}",
+        "BILLED_TO": rng.choice(_NAMES),
+        "ADDRESS": f"{rng.randint(1, 999)} {rng.choice(_STREETS)}, {rng.choice(_CITIES)}",
+        "ITEM_DESCRIPTION": items[0][0],
+        "QTY": items[0][1],
+        "UNIT_PRICE": items[0][2],
+        "AMOUNT": items[0][3],
+        "TOTAL_AMOUNT": f"${total:.2f}",
+        "BANK_NAME": rng.choice(_BANKS),
+        "ACCOUNT_NAME": rng.choice(_NAMES),
+        "ACCOUNT_NUMBER": f"{rng.randint(1000, 9999)} {rng.randint(1000, 9999)} {rng.randint(1000, 9999)}",
+    }
+    if rng.random() < 0.5:
+        truth["EMAIL"] = f"hello@{rng.choice(['reallygreatsite', 'borcelle', 'fauget'])}.com"
+    if rng.random() < 0.5:
+        truth["PHONE"] = f"+{rng.randint(100, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}"
+
+    lines = [f"{rng.choice(_COMPANIES)} Invoice", "INVOICE"]
+    for field in ("INVOICE_NUMBER", "DATE_OF_ISSUE", "BILLED_TO", "ADDRESS", "PHONE", "EMAIL"):
+        if field in truth:
+            lines.append(f"{FIELD_LABELS[field]}: {truth[field]}")
+    lines.append("")
+    for description, qty, price, amount in items:
+        lines.append(f"Item: {description} | Qty: {qty} | Unit Price: {price} | Amount: {amount}")
+    lines.append("")
+    lines.append(f"Total Due: {truth['TOTAL_AMOUNT']}")
+    lines.append("BANK DETAILS")
+    for field in ("BANK_NAME", "ACCOUNT_NAME", "ACCOUNT_NUMBER"):
+        lines.append(f"{FIELD_LABELS[field]}: {truth[field]}")
+    lines.append("")
+    lines.extend(_FOOTER)
+
+    return "\n".join(lines), truth
+
+
+def generate_corpus(n: int, seed: int = 0) -> Tuple[List[str], List[Dict], List[List[str]]]:
+    """
+    Generates `n` synthetic invoices.
+
+    Returns:
+        contexts, ground truths and the fields to extract for every invoice
+    """
+    rng = random.Random(seed)
+    contexts, outputs = [], []
+    for _ in range(n):
+        context, truth = synthetic_invoice(rng)
+        contexts.append(context)
+        outputs.append(truth)
+    return contexts, outputs, [list(truth.keys()) for truth in outputs]
+
+
+# labels that end the previous value without being a field themselves
+_STOP_LABELS = ["Notes"]
+_LABEL_PATTERN = re.compile(
+    r"(" + "|".join(re.escape(label) for label in sorted([*FIELD_LABELS.values(), *_STOP_LABELS], key=len, reverse=True)) + r")\s*:",
+    re.IGNORECASE,
+)
+
+
+def extract_labeled_fields(context: str, fields: List[str]) -> Dict:
+    """
+    Reads field values back from a synthetic invoice, normalized or not.
+    Repeated item fields come back as lists, like the model does for multiple items.
+    """
+    label_to_field = {label.lower(): field for field, label in FIELD_LABELS.items()}
+    matches = list(_LABEL_PATTERN.finditer(context))
+    found: Dict[str, List[str]] = {}
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(context)
+        value = context[m.end():end]
+        # values end at the next label, an item separator or the next line
+        value = re.split(r"\s\|\s|\n|\sbank details\b", value, flags=re.IGNORECASE)[0].strip()
+        field = label_to_field.get(m.group(1).lower())
+        if field and value:
+            found.setdefault(field, []).append(value)
+
+    result = {}
+    for field in fields:
+        values = found.get(field)
+        if not values:
+            result[field] = None
+        elif len(values) == 1:
+            result[field] = values[0]
+        else:
+            result[field] = values
+    return result
+
+
+def mock_model_response(predictions: List[Dict], as_strings: bool = True) -> str:
+    """
+    Builds a model response in the format the batched prompts ask for,
+    a list of JSON strings (or a plain JSON array of objects).
+    """
+    if as_strings:
+        return json.dumps([json.dumps(_) for _ in predictions])
+    return json.dumps(predictions)
@@ -0,0 +1,154 @@
+"""
+Token counts before the model call.
+
+`TokenEstimator` asks the provider to count the prompt when it can (`count_tokens`) and falls
+back to characters / 4, rescaled by the ratio observed against the usage the providers report.
+`TokenBudget` uses the estimates to refuse calls over the per call, per workflow or per tenant
+limits before anything is sent.
+"""
+import os
+import time
+import threading
+
+from collections import deque
+
+from worker.providers import OUTPUT_TOKENS_PER_INVOICE, estimate_tokens
+
+
+class TokenBudgetExceeded(Exception):
+    pass
+
+
+class PromptTooLarge(Exception):
+    """
+    a single invoice does not fit the per call limit, the batch cannot be split below it
+    """
+
+
+class TokenEstimator:
+    """
+    Prompt token estimates, with their error against the actual `prompt_token_count` of the last
+    `window` calls. `use_provider=False` never calls the provider, the Gemini count is a request.
+    """
+
+    def __init__(self, use_provider: bool = True, window: int = 500):
+        self.use_provider = use_provider
+        # actual / local estimate, rescales the local approximation
+        self.ratios = deque(maxlen=window)
+        # (source, estimate, actual)
+        self.errors = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TokenEstimator":
+        return cls(use_provider=os.getenv("LLM_COUNT_TOKENS", "provider") == "provider")
+
+    def local(self, text: str) -> int:
+        with self.lock:
+            ratios = sorted(self.ratios)
+        ratio = ratios[len(ratios) // 2] if ratios else 1.0
+        return round(estimate_tokens(text) * ratio)
+
+    def estimate(self, prompt: str, provider=None) -> tuple:
+        """
+        (prompt tokens, source), the provider count when it has one, the local approximation otherwise
+        """
+        if self.use_provider and hasattr(provider, "count_tokens"):
+            try:
+                return provider.count_tokens(prompt), "provider"
+            except Exception as e:
+                print(f"count_tokens failed, using the local estimate: {e}")
+        return self.local(prompt), "local"
+
+    def output(self, invoices: int) -> int:
+        return invoices * OUTPUT_TOKENS_PER_INVOICE
+
+    def record(self, prompt: str, estimate: int, source: str, actual: int) -> None:
+        if not isinstance(actual, int):
+            return
+        with self.lock:
+            self.errors.append((source, estimate, actual))
+            if actual and estimate_tokens(prompt):
+                self.ratios.append(actual / estimate_tokens(prompt))
+
+    def stats(self) -> dict:
+        """
+        mean absolute and signed relative error of the estimates per source
+        """
+        with self.lock:
+            errors = list(self.errors)
+        stats = {}
+        for source in sorted({_[0] for _ in errors}):
+            relative = [(estimate - actual) / actual for s, estimate, actual in errors if s == source and actual]
+            if relative:
+                stats[source] = {
+                    "calls": len(relative),
+                    "mean_abs_error": sum(abs(_) for _ in relative) / len(relative),
+                    "bias": sum(relative) / len(relative),
+                }
+        return stats
+
+
+class TokenBudget:
+    """
+    Token limits checked before every model call, 0 disables a limit:
+    - `per_call`: prompt tokens of one request, larger batches are split or refused
+    - `per_workflow`: prompt and output tokens of all calls of one workflow
+    - `per_tenant`: tokens of a tenant per `window_s`, counted on this worker
+    """
+
+    def __init__(self, per_call: int = 0, per_workflow: int = 0, per_tenant: int = 0, window_s: float = 86400.0):
+        self.per_call = per_call
+        self.per_workflow = per_workflow
+        self.per_tenant = per_tenant
+        self.window_s = window_s
+        # tenant -> [window start, tokens used or reserved]
+        self.tenants = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TokenBudget":
+        return cls(
+            per_call=int(os.getenv("TOKEN_BUDGET_PER_CALL", "0")),
+            per_workflow=int(os.getenv("TOKEN_BUDGET_PER_WORKFLOW", "0")),
+            per_tenant=int(os.getenv("TOKEN_BUDGET_PER_TENANT", "0")),
+            window_s=float(os.getenv("TOKEN_BUDGET_WINDOW_SECONDS", "86400")),
+        )
+
+    def call_limit(self, model_limit: int | None = None) -> int:
+        limits = [_ for _ in (self.per_call, model_limit) if _]
+        return min(limits) if limits else 0
+
+    def _tenant(self, tenant: str) -> list:
+        usage = self.tenants.setdefault(tenant, [time.monotonic(), 0])
+        if time.monotonic() - usage[0] >= self.window_s:
+            usage[:] = [time.monotonic(), 0]
+        return usage
+
+    def reserve(self, tokens: int, workflow_used: int = 0, tenant: str | None = None) -> None:
+        """
+        holds `tokens` of the tenant budget, raises TokenBudgetExceeded when a limit would be passed
+        """
+        if self.per_workflow and workflow_used + tokens > self.per_workflow:
+            raise TokenBudgetExceeded(f"workflow would use {workflow_used + tokens} tokens, budget is {self.per_workflow}")
+        if not (self.per_tenant and tenant):
+            return
+        with self.lock:
+            usage = self._tenant(tenant)
+            if usage[1] + tokens > self.per_tenant:
+                raise TokenBudgetExceeded(f"tenant {tenant} would use {usage[1] + tokens} tokens, budget is {self.per_tenant}")
+            usage[1] += tokens
+
+    def settle(self, reserved: int, actual: int, tenant: str | None = None) -> None:
+        """
+        replaces a reservation by the tokens the call actually used, 0 when it failed
+        """
+        if not (self.per_tenant and tenant):
+            return
+        with self.lock:
+            usage = self._tenant(tenant)
+            usage[1] = max(0, usage[1] - reserved + actual)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {tenant: used for tenant, (_, used) in self.tenants.items()}
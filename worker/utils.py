@@ -1,15 +1,16 @@
 import os 
 import re
 import json
+import hashlib
+import importlib
 import unicodedata
 
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict
-from sklearn.metrics import  f1_score
-from sklearn.metrics import recall_score
-from sklearn.metrics import precision_score
-from google.generativeai.types import GenerateContentResponse
+from typing import List, Dict, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google.generativeai.types import GenerateContentResponse
 
 REQUIRED_FIELDS = [
     "INVOICE_NUMBER", "DATE_OF_ISSUE", "BILLED_TO", "ADDRESS",
@@ -17,6 +18,19 @@ REQUIRED_FIELDS = [
     "TOTAL_AMOUNT", "BANK_NAME", "ACCOUNT_NAME", "ACCOUNT_NUMBER"
 ]
 
+class LazyModule:
+    """
+    Imports a module on first attribute access, keeps heavy SDKs off the startup path.
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
 def save_json_artifact(data: dict, output_dir: str, filename: str):
     """
     Saves a dictionary as a JSON file in the specified directory.
@@ -42,7 +56,7 @@ def match(gt: str, pred: str | list[str]) -> bool:
 def normalize_fields(entry: Dict) -> Dict:
     return {field: entry.get(field, None) for field in REQUIRED_FIELDS}
 
-def simplify_response(response: GenerateContentResponse) -> dict:
+def simplify_response(response: "GenerateContentResponse") -> dict:
     return {
         "text": response.text,
         "block_reason": response.prompt_feedback.block_reason if response.prompt_feedback else None,
@@ -68,6 +82,24 @@ def normalize_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
+def batch_fingerprint(contexts: List[str], required_fields: List[List[str]], options: dict | None = None) -> str:
+    """
+    Content hash of a batch, the same invoices and fields give the same hash
+    regardless of case, whitespace or field order. `options` (JSON values) are hashed as given,
+    anything else that changes the result of the run belongs there.
+    """
+    digest = hashlib.sha256()
+    for context, fields in zip(contexts, required_fields):
+        digest.update(normalize_text(context).encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(",".join(sorted(fields)).encode("utf-8"))
+        digest.update(b"\x01")
+    digest.update(str(len(contexts)).encode("utf-8"))
+    if options:
+        digest.update(b"\x02")
+        digest.update(json.dumps(options, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
 def validate_extracted_data(extracted_data: dict, context: str, required_fields: List[str] = REQUIRED_FIELDS) -> list:
     """
     Validates the extracted JSON data against a set of rules.
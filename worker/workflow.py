@@ -1,15 +1,34 @@
+import asyncio
+import dataclasses
 from datetime import timedelta
 
 from temporalio import workflow
 from temporalio.common import RetryPolicy
-from temporalio.exceptions import ActivityError
+from temporalio.exceptions import ActivityError, ApplicationError, ChildWorkflowError
 
 with workflow.unsafe.imports_passed_through():
+    from worker import field_extraction_metrics
     from worker.activities import LLMActivities
-    from worker.shared import InvoiceData
+    from worker.shared import BatchJob, DatasetSlice, InvoiceData, BATCH_WORKFLOW_NAME, INFORMATION_WORKFLOW_NAME
 
+# LLM activities heartbeat while the model request runs, a missed heartbeat or a cancellation
+# reaches them within this timeout
+LLM_HEARTBEAT_TIMEOUT = timedelta(seconds=5)
 
-@workflow.defn
+
+def activity_timeout(data: InvoiceData, seconds: float) -> timedelta:
+    """
+    start to close timeout of an activity, never past the deadline of the request
+    """
+    if data.deadline is None:
+        return timedelta(seconds=seconds)
+    remaining = data.deadline - workflow.now().timestamp()
+    if remaining <= 0:
+        raise ApplicationError("Request deadline exceeded", type="DeadlineExceeded", non_retryable=True)
+    return timedelta(seconds=min(seconds, remaining))
+
+
+@workflow.defn(name=INFORMATION_WORKFLOW_NAME)
 class InformationExtraction:
     @workflow.run
     async def run(self, data: InvoiceData)->dict:
@@ -21,53 +40,71 @@ class InformationExtraction:
         load_input_conformation = await workflow.execute_activity(
             LLMActivities.load_input,
             data,
-            start_to_close_timeout=timedelta(seconds=5),
+            # reading a dataset slice streams the file up to the offset
+            start_to_close_timeout=activity_timeout(data, 120 if data.source else 5),
             retry_policy=retry_policy,
         )
 
         construct_prompt_confirmation = await workflow.execute_activity(
             LLMActivities.construct_prompt,
             data,
-            start_to_close_timeout=timedelta(seconds=5),
+            start_to_close_timeout=activity_timeout(data, 5),
             retry_policy=retry_policy,
         )
 
         call_model_confirmation = await workflow.execute_activity(
             LLMActivities.call_model,
             data,
-            start_to_close_timeout=timedelta(seconds=360),
+            start_to_close_timeout=activity_timeout(data, 360),
+            heartbeat_timeout=LLM_HEARTBEAT_TIMEOUT,
             retry_policy=retry_policy,
         )
 
         if call_model_confirmation['status'] == "failed":
-            if "API call failed" in call_model_confirmation['error']:
+            if call_model_confirmation['error'] in ("API call failed", "Request cancelled", "Token budget exceeded", "Batch too large"):
                 persist_artifact_confirmation = await workflow.execute_activity(
                     LLMActivities.persist_artifact,
                     data,
+                    # cleanup of the run, also after the deadline
                     start_to_close_timeout=timedelta(seconds=60),
                     retry_policy=retry_policy,
                 )
+                if data.summary_only:
+                    return field_extraction_metrics.failed_summary(data.source.limit if data.source else len(data.context_input))
                 return { "evalution_resul " : None, "predictions" : None}
 
         parse_and_validate_confirmation = await workflow.execute_activity(
             LLMActivities.parse_and_validate,
             data,
-            start_to_close_timeout=timedelta(seconds=500),
+            start_to_close_timeout=activity_timeout(data, 500),
             retry_policy=retry_policy,
         )
 
+        # cascade: each stronger tier only sees the invoices the previous one got wrong
+        for _ in (data.cascade or [])[1:]:
+            if "Failed in validation criteria" not in parse_and_validate_confirmation['error']:
+                break
+            parse_and_validate_confirmation = await workflow.execute_activity(
+                LLMActivities.escalate,
+                data,
+                start_to_close_timeout=activity_timeout(data, 360),
+                heartbeat_timeout=LLM_HEARTBEAT_TIMEOUT,
+                retry_policy=retry_policy,
+            )
+
         if parse_and_validate_confirmation['status'] == "failed":
             if "Failed in validation criteria" in parse_and_validate_confirmation['error']:
                 retry_model_call_confirmation = await workflow.execute_activity(
                     LLMActivities.retry_model_call,
                     data,
-                    start_to_close_timeout=timedelta(seconds=1080),
+                    start_to_close_timeout=activity_timeout(data, 1080),
+                    heartbeat_timeout=LLM_HEARTBEAT_TIMEOUT,
                 )
 
         finalize_confirmation = await workflow.execute_activity(
             LLMActivities.finalize,
             data,
-            start_to_close_timeout=timedelta(seconds=60),
+            start_to_close_timeout=activity_timeout(data, 60),
             retry_policy=retry_policy,
         )
 
@@ -79,5 +116,78 @@ class InformationExtraction:
         )
 
 
-        return finalize_confirmation  
-    
\ No newline at end of file
+        return finalize_confirmation
+
+
+@workflow.defn(name=BATCH_WORKFLOW_NAME)
+class BatchExtraction:
+    """
+    Runs a large dataset as InformationExtraction children of `chunk_size` invoices, at most
+    `max_concurrent_children` at a time. Children read their rows from the dataset and return
+    mergeable summaries, so neither history holds the invoices or the predictions. After
+    `chunks_per_run` children the workflow continues as new with the offset and the summary so far.
+    """
+
+    @workflow.run
+    async def run(self, job: BatchJob) -> dict:
+        if job.total is None:
+            job.total = await workflow.execute_activity(
+                LLMActivities.count_rows,
+                job,
+                start_to_close_timeout=timedelta(minutes=10),
+                retry_policy=RetryPolicy(maximum_attempts=3),
+            )
+
+        summary = job.summary or field_extraction_metrics.empty_summary()
+        offset = job.next_offset
+        started = 0
+        pending = {}
+
+        while offset < job.total or pending:
+            while (offset < job.total and len(pending) < job.max_concurrent_children and started < job.chunks_per_run
+                   and not workflow.info().is_continue_as_new_suggested()):
+                index = offset // job.chunk_size
+                pending[asyncio.create_task(self.run_chunk(job, index, offset))] = index
+                offset += job.chunk_size
+                started += 1
+            if not pending:
+                break
+
+            done, _ = await workflow.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+            # merge in chunk order, the summary is the same whichever child finished first
+            for task in sorted(done, key=pending.get):
+                summary = field_extraction_metrics.merge_summaries(summary, task.result())
+                del pending[task]
+
+        if offset < job.total:
+            workflow.continue_as_new(dataclasses.replace(job, next_offset=offset, summary=summary, runs=job.runs + 1))
+
+        return {
+            "job_id": job.job_id,
+            "runs": job.runs,
+            "summary": summary,
+            "metrics": field_extraction_metrics.summary_report(summary),
+        }
+
+    async def run_chunk(self, job: BatchJob, index: int, offset: int) -> dict:
+        limit = min(job.chunk_size, job.total - offset)
+        child_id = f"{job.job_id}-chunk-{index}"
+        data = InvoiceData(
+            context_input=[],
+            output=[],
+            fields_to_extract=[],
+            workflow_id=child_id,
+            profile=job.profile,
+            priority=job.priority,
+            source=DatasetSlice(job.source, offset, limit, job.input_column, job.output_column, job.fields),
+            summary_only=True,
+            cascade=job.cascade,
+            tenant=job.tenant,
+            minimize=job.minimize,
+            pre_extract=job.pre_extract,
+        )
+        try:
+            return await workflow.execute_child_workflow(InformationExtraction.run, data, id=child_id)
+        except ChildWorkflowError as e:
+            workflow.logger.warning(f"chunk {child_id} failed: {e}")
+            return field_extraction_metrics.failed_summary(limit)